@@ -0,0 +1,187 @@
+"""Audit trail for mutating requests.
+
+Entries are queued in memory and written by a background thread in batches,
+so handlers never wait on the audit insert. Each entry stores the SHA-256 of
+its predecessor's hash plus its own content, making edits or deletions of
+past rows detectable with ``verify``.
+
+When several worker processes share the database, each batch is appended
+under a cross-process lock and chained onto the hash last committed by any
+worker, so the chain never forks.
+"""
+import os
+import json
+import queue
+import hashlib
+import logging
+import datetime
+import threading
+from typing import Optional
+from sqlalchemy import Index
+from sqlmodel import SQLModel, Field, Session, select
+from starlette.concurrency import run_in_threadpool
+from .coherence import locked
+from . import metrics
+
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "0.5"))
+GENESIS_HASH = "0" * 64
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+log = logging.getLogger(__name__)
+
+
+class AuditEntry(SQLModel, table=True):
+    __table_args__ = (Index("ix_auditentry_requirement_ts", "requirement_id", "ts"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    ts: datetime.datetime = Field(index=True)
+    actor: str
+    method: str
+    path: str
+    status_code: int
+    requirement_id: Optional[str] = None
+    detail: Optional[str] = None
+    prev_hash: str
+    hash: str = Field(index=True)
+
+
+def entry_hash(prev_hash: str, fields: dict) -> str:
+    body = json.dumps(fields, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256((prev_hash + body).encode()).hexdigest()
+
+
+def _hashed_fields(e: AuditEntry) -> dict:
+    return {
+        "ts": e.ts.isoformat(), "actor": e.actor, "method": e.method, "path": e.path,
+        "status_code": e.status_code, "requirement_id": e.requirement_id, "detail": e.detail,
+    }
+
+
+def note(request, requirement_id: Optional[str] = None, **detail):
+    """Attach the affected requirement and handler-specific detail to the current request's entry."""
+    state = request.state
+    if requirement_id is not None:
+        state.audit_requirement_id = requirement_id
+    current = getattr(state, "audit_detail", None) or {}
+    current.update(detail)
+    state.audit_detail = current
+
+
+class AuditWriter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.queue = queue.Queue(maxsize=AUDIT_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    async def submit(self, **fields):
+        """Queue an entry without blocking the event loop.
+
+        When the writer is a full queue behind, the entry waits for room in a
+        worker thread instead of being dropped.
+        """
+        if not (self._thread and self._thread.is_alive()):
+            self.start()
+        try:
+            self.queue.put_nowait(fields)
+        except queue.Full:
+            metrics.record_audit_queue_full()
+            await run_in_threadpool(self.queue.put, fields)
+
+    def _drain(self, first) -> list:
+        batch = [first]
+        while len(batch) < AUDIT_BATCH_SIZE:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stop.is_set() and self.queue.empty()):
+            try:
+                first = self.queue.get(timeout=AUDIT_FLUSH_SECONDS)
+            except queue.Empty:
+                continue
+            batch = self._drain(first)
+            try:
+                self._write(batch)
+            except Exception:
+                log.exception("failed to write %d audit entries", len(batch))
+
+    def _write(self, batch: list):
+        with locked(self.engine, "audit"), Session(self.engine) as s:
+            prev = s.exec(select(AuditEntry.hash).order_by(AuditEntry.id.desc()).limit(1)).first() or GENESIS_HASH
+            for fields in batch:
+                e = AuditEntry(prev_hash=prev, hash="", **fields)
+                e.hash = entry_hash(prev, _hashed_fields(e))
+                prev = e.hash
+                s.add(e)
+            s.commit()
+
+
+class AuditMiddleware:
+    """Queue an entry for each mutating request after it completes; other methods pass straight through."""
+
+    def __init__(self, app, writer: AuditWriter):
+        self.app = app
+        self.writer = writer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in MUTATING_METHODS:
+            return await self.app(scope, receive, send)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # what handlers attached with note(); request.state lives in scope["state"]
+            state = scope.get("state") or {}
+            detail = state.get("audit_detail")
+            actor = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"x-actor"), "")
+            client = scope.get("client")
+            await self.writer.submit(
+                ts=datetime.datetime.utcnow(),
+                actor=actor or (client[0] if client else "unknown"),
+                method=scope["method"],
+                path=scope["path"],
+                status_code=status[0],
+                requirement_id=state.get("audit_requirement_id"),
+                detail=json.dumps(detail, default=str) if detail else None,
+            )
+
+
+def verify(session: Session, batch_size: int = 5000) -> dict:
+    """Walk the chain in id order and report the first entry whose hash does not match."""
+    prev, checked, last_id = GENESIS_HASH, 0, 0
+    while True:
+        rows = session.exec(
+            select(AuditEntry).where(AuditEntry.id > last_id).order_by(AuditEntry.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return {"ok": True, "checked": checked}
+        for e in rows:
+            if e.prev_hash != prev or e.hash != entry_hash(prev, _hashed_fields(e)):
+                return {"ok": False, "checked": checked, "broken_at": e.id}
+            prev, last_id = e.hash, e.id
+            checked += 1
@@ -0,0 +1,119 @@
+"""Coordination between worker processes serving the API on one host.
+
+``locked(engine, name)`` is an exclusive ``flock`` on a file in ``LOCK_DIR``,
+keyed by the database, so schema setup and seeding run in one worker at a
+time and audit-chain appends from different workers cannot interleave.
+
+``Coherence`` keeps in-process caches honest across workers. Writers bump a
+named counter in ``CacheVersion`` inside the transaction that changes the
+cached data. Before serving, each worker runs ``check()``: for SQLite it
+first compares ``PRAGMA data_version`` on a dedicated connection, which only
+moves when another connection committed, so an idle database costs one
+pragma per request; when it moved (or for other databases, always) the
+counters are read and the callbacks registered for any counter that changed
+are invoked.
+"""
+import os
+import hashlib
+import logging
+import sqlite3
+import tempfile
+import threading
+import contextlib
+from collections import defaultdict
+from sqlalchemy import text as sql
+from sqlmodel import SQLModel, Field, Session, select
+
+try:
+    import fcntl
+except ImportError:  # Windows development; a single process needs no file lock
+    fcntl = None
+
+LOCK_DIR = os.getenv("LOCK_DIR", tempfile.gettempdir())
+
+log = logging.getLogger(__name__)
+
+
+class CacheVersion(SQLModel, table=True):
+    name: str = Field(primary_key=True)
+    version: int = 0
+
+
+@contextlib.contextmanager
+def locked(engine, name: str):
+    """Hold an exclusive lock shared by every process using the same database."""
+    if fcntl is None:
+        yield
+        return
+    tag = hashlib.sha1(str(engine.url).encode()).hexdigest()[:12]
+    path = os.path.join(LOCK_DIR, f"certmanager-{tag}-{name}.lock")
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class Coherence:
+    def __init__(self, engine):
+        self.engine = engine
+        self._listeners = defaultdict(list)
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        self._data_version = None
+        if engine.url.get_backend_name() == "sqlite" and engine.url.database:
+            self._conn = sqlite3.connect(os.path.abspath(engine.url.database), check_same_thread=False)
+
+    def register(self, name: str, callback):
+        self._listeners[name].append(callback)
+
+    def _versions(self) -> dict:
+        if self._conn is not None:
+            return dict(self._conn.execute("SELECT name, version FROM cacheversion").fetchall())
+        with Session(self.engine) as s:
+            return {v.name: v.version for v in s.exec(select(CacheVersion))}
+
+    def prime(self):
+        """Take the current counters as seen; call once the worker's caches are loaded."""
+        with self._lock:
+            if self._conn is not None:
+                self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            self._seen = self._versions()
+
+    def bump(self, session: Session, name: str) -> int:
+        """Advance ``name`` within the caller's transaction; pass the result to :meth:`written` after commit."""
+        session.exec(sql(
+            "INSERT INTO cacheversion (name, version) VALUES (:n, 1) "
+            "ON CONFLICT (name) DO UPDATE SET version = cacheversion.version + 1"
+        ), params={"n": name})
+        return session.exec(sql("SELECT version FROM cacheversion WHERE name = :n"), params={"n": name}).one()[0]
+
+    def written(self, name: str, version: int):
+        """This process already reflects its own write; skip invalidating for it unless others wrote first."""
+        with self._lock:
+            if self._seen.get(name, 0) == version - 1:
+                self._seen[name] = version
+
+    def check(self):
+        """Invoke the callbacks of every counter another writer advanced since the last check."""
+        with self._lock:
+            if self._conn is not None:
+                dv = self._conn.execute("PRAGMA data_version").fetchone()[0]
+                if dv == self._data_version:
+                    return
+                self._data_version = dv
+            current = self._versions()
+            changed = [name for name, v in current.items() if self._seen.get(name) != v]
+            self._seen = current
+        for name in changed:
+            for callback in self._listeners[name]:
+                try:
+                    callback()
+                except Exception:
+                    log.exception("cache invalidation for %s failed", name)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
@@ -0,0 +1,121 @@
+"""gzip/brotli response compression, with compressed bodies memoized for cacheable GETs.
+
+``CompressionMiddleware`` compresses complete 200 responses of a textual
+type once they reach ``COMPRESS_MIN_BYTES``, using brotli when the client
+accepts it and the ``brotli`` package is installed, else gzip. Streamed and
+partial responses (evidence downloads, ZIP archives) pass through untouched.
+
+For the routes listed as cacheable (the control list, the dashboard, ...)
+the compressed bytes are kept in a small LRU keyed by a digest of the
+uncompressed body, so a payload is compressed once per version of the data
+behind it however many clients ask, and any change to that data changes the
+key.
+"""
+import os
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from . import metrics
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_CACHE_ENTRIES = int(os.getenv("COMPRESS_CACHE_ENTRIES", "64"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+_TEXTUAL = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+def choose_encoding(accept_encoding: str):
+    """The best encoding the client accepts: ``"br"``, ``"gzip"`` or None."""
+    offered = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip().lower()] = q
+    for encoding in (("br",) if brotli else ()) + ("gzip",):
+        if offered.get(encoding, offered.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, cacheable=()):
+        self.app = app
+        self.cacheable = frozenset(cacheable)
+        self._cache = OrderedDict()  # (encoding, body digest) -> compressed body
+        self._lock = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        accept = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"accept-encoding"), "")
+        encoding = choose_encoding(accept)
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if passthrough:
+                return await send(message)
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            body = message.get("body", b"")
+            headers = MutableHeaders(scope=start)
+            textual = headers.get("content-type", "").startswith(_TEXTUAL)
+            if textual:
+                headers.add_vary_header("Accept-Encoding")
+            # partial (206) and streamed bodies, and anything already encoded, go out as they are
+            if (encoding is None or message.get("more_body") or not textual or len(body) < COMPRESS_MIN_BYTES
+                    or "content-encoding" in headers or start["status"] != 200):
+                passthrough = True
+                await send(start)
+                return await send(message)
+            route = scope.get("route")
+            cacheable = scope["method"] == "GET" and route is not None and route.path in self.cacheable
+            body = await self._compressed(body, encoding, cacheable)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _compressed(self, body: bytes, encoding: str, cacheable: bool) -> bytes:
+        if not cacheable:
+            return await run_in_threadpool(compress, body, encoding)
+        key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+        if hit is not None:
+            metrics.cache_hit("compressed_bodies")
+            return hit
+        metrics.cache_miss("compressed_bodies")
+        out = await run_in_threadpool(compress, body, encoding)
+        with self._lock:
+            self._cache[key] = out
+            while len(self._cache) > COMPRESS_CACHE_ENTRIES:
+                self._cache.popitem(last=False)
+        return out
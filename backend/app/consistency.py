@@ -0,0 +1,296 @@
+"""Near-duplicate narratives that drifted apart, found with MinHash and LSH.
+
+A variant is one distinct narrative text of one kind (whitespace collapsed,
+case kept, so "Duo 2FA" and "DUo 2FA" are two variants) and remembers every
+control using it. Each variant gets a MinHash signature over the character
+5-shingles of its lowercased text; the signature is cut into ``BANDS`` bands
+of ``ROWS`` values and variants sharing any band are candidates. Candidates
+whose estimated Jaccard similarity reaches ``THRESHOLD`` are merged into a
+cluster with union-find, so no pair is compared unless LSH proposes it.
+
+Adding a narrative signs only the new variant and compares it to the
+variants sharing one of its bands. Deleting one may split a cluster, so the
+clusters are recomputed from the signatures (one sort per band) before the
+next report. Changes made by other processes trigger a rebuild in the
+background (see ``derived``).
+"""
+import numpy as np
+from collections import Counter
+from sqlmodel import Session, select
+from .derived import DerivedIndex
+from .similarity import NARRATIVE_KINDS
+
+SHINGLE = 5
+BANDS, ROWS = 32, 4
+THRESHOLD = 0.7
+DIFF_WORDS = 20
+
+_SLOTS = BANDS * ROWS
+_MIX = np.uint64(0x9E3779B97F4A7C15)  # odd multiplier spreading shingle hashes over 64 bits
+_BAND_MIX = np.random.default_rng(20240229).integers(1, 1 << 62, ROWS, dtype=np.uint64) | np.uint64(1)
+_EMPTY = np.uint64(1 << 32)
+
+
+def _shingles(texts):
+    """``(doc, hash)`` of every character shingle of ``texts``, lowercased, in one pass over their bytes.
+
+    Repeated shingles are kept: they cannot change a minimum.
+    """
+    parts = [" ".join(t.lower().split()).ljust(SHINGLE).encode() for t in texts]
+    data = np.frombuffer(b"\0".join(parts), dtype=np.uint8).astype(np.uint64)
+    doc = np.repeat(np.arange(len(parts)), [len(p) + 1 for p in parts])[:len(data)]
+    doc[np.cumsum([len(p) + 1 for p in parts])[:-1] - 1] = -1  # the separators
+    n = len(data) - SHINGLE + 1
+    h = np.zeros(n, dtype=np.uint64)
+    for j in range(SHINGLE):
+        h = h * np.uint64(257) + data[j:j + n]
+    whole = (doc[:n] == doc[SHINGLE - 1:]) & (doc[:n] >= 0)
+    return doc[:n][whole], h[whole]
+
+
+def signatures(texts) -> np.ndarray:
+    """MinHash signatures of ``texts``, one row each.
+
+    One-permutation hashing: each shingle is hashed once, the top bits pick
+    one of ``BANDS * ROWS`` slots and the slot keeps its smallest value. A
+    short text leaves slots empty; each borrows the value of the next filled
+    slot to its right, shifted by the distance, so two texts still agree on
+    a slot with probability close to their Jaccard similarity.
+    """
+    out = np.full(len(texts) * _SLOTS, _EMPTY, dtype=np.uint64)
+    if not len(texts):
+        return out.reshape(0, _SLOTS).astype(np.uint32)
+    doc, mixed = _shingles(texts)
+    mixed = mixed * _MIX
+    mixed = (mixed ^ (mixed >> np.uint64(29))) * _MIX
+    slot = (mixed >> np.uint64(57)).astype(np.int64)
+    np.minimum.at(out, doc * _SLOTS + slot, (mixed >> np.uint64(25)) & np.uint64(0xFFFFFFFF))
+    out = out.reshape(len(texts), _SLOTS)
+    filled = out != _EMPTY
+    if not filled.all():
+        # index of the next filled slot, wrapping around: scan the row twice from the right
+        idx = np.arange(2 * _SLOTS)
+        twice = np.where(np.concatenate([filled, filled], axis=1), idx, 2 * _SLOTS)
+        nxt = np.minimum.accumulate(twice[:, ::-1], axis=1)[:, ::-1][:, :_SLOTS]
+        dist = (nxt - idx[:_SLOTS]).astype(np.uint64)
+        borrowed = np.take_along_axis(out, nxt % _SLOTS, axis=1) + dist * np.uint64(0x9E3779B1)
+        out = np.where(filled, out, borrowed & np.uint64(0xFFFFFFFF))
+    return out.astype(np.uint32)
+
+
+def band_keys(sigs: np.ndarray, kinds: np.ndarray) -> np.ndarray:
+    """One 64-bit key per band of each signature; only variants of the same kind share keys."""
+    keys = (sigs.reshape(len(sigs), BANDS, ROWS).astype(np.uint64) * _BAND_MIX).sum(axis=2)
+    return keys ^ (kinds.astype(np.uint64)[:, None] << np.uint64(62))
+
+
+def _words_diff(a: str, b: str) -> list:
+    return list((Counter(a.split()) - Counter(b.split())).elements())[:DIFF_WORDS]
+
+
+class _Variants:
+    def __init__(self):
+        self.keys = {}      # (kind, collapsed text) -> variant id
+        self.kind = []
+        self.text = []
+        self.refs = []      # variant id -> Counter of (requirement_id, TextLog id or None)
+        self.by_log = {}    # TextLog id -> variant id
+        self.sigs = np.zeros((0, BANDS * ROWS), dtype=np.uint32)
+        self.bands = np.zeros((BANDS, 0), dtype=np.uint64)  # band-major, so a lookup scans contiguous keys
+        self.kinds = np.zeros(0, dtype=np.int8)
+        self.alive = np.zeros(0, dtype=bool)
+        self.size = 0       # rows in use; the arrays grow by doubling
+        self.parent = []
+        self.stale = False  # a variant went away since the clusters were computed
+
+    def _variant(self, kind: str, text: str):
+        text = " ".join((text or "").split())
+        if not text:
+            return None
+        key = (kind, text)
+        vid = self.keys.get(key)
+        if vid is None:
+            vid = self.keys[key] = len(self.text)
+            self.kind.append(kind)
+            self.text.append(text)
+            self.refs.append(Counter())
+            self.parent.append(vid)
+        return vid
+
+    def add(self, kind: str, requirement_id: str, log_id, text: str):
+        """Record a narrative while loading; ``sign`` must run before queries."""
+        vid = self._variant(kind, text)
+        if vid is not None:
+            self.refs[vid][(requirement_id, log_id)] += 1
+            if log_id is not None:
+                self.by_log[log_id] = vid
+        return vid
+
+    def sign(self):
+        n = len(self.text)
+        self.kinds = np.asarray([NARRATIVE_KINDS.index(k) for k in self.kind], dtype=np.int8)
+        self.sigs = signatures(self.text)
+        self.bands = np.ascontiguousarray(band_keys(self.sigs, self.kinds).T)
+        self.alive = np.ones(n, dtype=bool)
+        self.size = n
+        self.cluster()
+
+    def _grow(self, n: int):
+        if n > len(self.alive):
+            cap = max(n, 2 * len(self.alive))
+            sigs, bands = self.sigs, self.bands
+            self.sigs = np.zeros((cap, BANDS * ROWS), dtype=np.uint32)
+            self.sigs[:len(sigs)] = sigs
+            self.bands = np.zeros((BANDS, cap), dtype=np.uint64)
+            self.bands[:, :bands.shape[1]] = bands
+            self.kinds = np.resize(self.kinds, cap)
+            self.alive = np.resize(self.alive, cap)
+            self.alive[self.size:] = False
+        self.size = max(self.size, n)
+
+    def insert(self, kind: str, requirement_id: str, log_id: int, text: str):
+        """Add one narrative to a signed index, linking its variant to the clusters it joins."""
+        if log_id in self.by_log:
+            return
+        vid = self.add(kind, requirement_id, log_id, text)
+        if vid is None or (vid < self.size and self.alive[vid]):
+            return
+        if vid >= self.size:
+            self._grow(vid + 1)
+            self.kinds[vid] = NARRATIVE_KINDS.index(kind)
+            self.sigs[vid] = signatures([self.text[vid]])[0]
+            self.bands[:, vid] = band_keys(self.sigs[vid:vid + 1], self.kinds[vid:vid + 1])[0]
+        self.alive[vid] = True
+        candidates = np.unique(np.concatenate([np.flatnonzero(keys[:self.size] == keys[vid]) for keys in self.bands]))
+        candidates = candidates[self.alive[candidates] & (candidates != vid)]
+        sims = (self.sigs[candidates] == self.sigs[vid]).mean(axis=1)
+        for other in candidates[sims >= THRESHOLD].tolist():
+            self.union(vid, other)
+
+    def remove_log(self, log_id: int, requirement_id: str):
+        vid = self.by_log.pop(log_id, None)
+        if vid is None:
+            return
+        refs = self.refs[vid]
+        refs[(requirement_id, log_id)] -= 1
+        if refs[(requirement_id, log_id)] <= 0:
+            del refs[(requirement_id, log_id)]
+        if not refs and vid < self.size:
+            self.alive[vid] = False
+            self.stale = True
+
+    def find(self, v: int) -> int:
+        parent = self.parent
+        while parent[v] != v:
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        return v
+
+    def union(self, a: int, b: int):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+    def cluster(self):
+        """Recompute every cluster: within each band, sort the keys and verify neighbours with equal keys."""
+        self.parent = list(range(len(self.text)))
+        live = np.flatnonzero(self.alive[:self.size])
+        for band in range(BANDS):
+            keys = self.bands[band, live]
+            order = np.argsort(keys, kind="stable")
+            same = np.flatnonzero(keys[order][1:] == keys[order][:-1])
+            if not len(same):
+                continue
+            a, b = live[order[same]], live[order[same + 1]]
+            sims = (self.sigs[a] == self.sigs[b]).mean(axis=1)
+            for x, y in zip(a[sims >= THRESHOLD].tolist(), b[sims >= THRESHOLD].tolist()):
+                self.union(x, y)
+        self.stale = False
+
+    def controls(self, vid: int) -> list:
+        return sorted({rid for rid, _ in self.refs[vid]})
+
+
+class ConsistencyIndex(DerivedIndex):
+    name = "consistency_index"
+
+    def __init__(self, engine, textlog_model, seed_narratives=()):
+        """``seed_narratives`` are ``(requirement_id, solution text)`` pairs from the shipped catalogue."""
+        super().__init__()
+        self.engine = engine
+        self.textlog_model = textlog_model
+        self.seed_narratives = list(seed_narratives)
+
+    def _build(self) -> _Variants:
+        variants = _Variants()
+        for rid, text in self.seed_narratives:
+            variants.add("solution", rid, None, text)
+        with Session(self.engine) as s:
+            tl = self.textlog_model
+            q = select(tl.id, tl.requirement_id, tl.kind, tl.text).where(tl.kind.in_(NARRATIVE_KINDS))
+            for log_id, rid, kind, text in s.exec(q):
+                variants.add(kind, rid, log_id, text)
+        variants.sign()
+        return variants
+
+    def narrative_added(self, log_id: int, requirement_id: str, kind: str, text: str):
+        if kind in NARRATIVE_KINDS:
+            self._change(lambda variants: variants.insert(kind, requirement_id, log_id, text))
+
+    def narrative_removed(self, log_id: int, requirement_id: str):
+        self._change(lambda variants: variants.remove_log(log_id, requirement_id))
+
+    def report(self, kind: str = None, requirement_id: str = None, domain: str = None, limit: int = 50) -> dict:
+        """Clusters of near-identical narratives that exist in more than one variant, most widespread first.
+
+        Each cluster names its canonical variant (the one most controls use)
+        and, for every other variant, its similarity to the canonical one and
+        the words it adds or drops. ``requirement_id`` and ``domain`` keep
+        the clusters touching those controls.
+        """
+        variants = self._current()
+        with self._lock:
+            if variants.stale:
+                variants.cluster()
+            groups = {}
+            for vid in np.flatnonzero(variants.alive[:variants.size]).tolist():
+                if kind is None or variants.kind[vid] == kind:
+                    groups.setdefault(variants.find(vid), []).append(vid)
+            prefix = domain.split("(")[-1].strip(" )").upper() + "." if domain else None
+            clusters = []
+            for members in groups.values():
+                if len(members) < 2:
+                    continue
+                uses = {vid: variants.controls(vid) for vid in members}
+                touched = {rid for rids in uses.values() for rid in rids}
+                if requirement_id and requirement_id not in touched:
+                    continue
+                if prefix and not any(rid.startswith(prefix) for rid in touched):
+                    continue
+                members.sort(key=lambda vid: (-len(uses[vid]), vid))
+                clusters.append((len(touched), members, uses))
+            clusters.sort(key=lambda c: (-c[0], c[1][0]))
+            return {
+                "threshold": THRESHOLD,
+                "variants": int(variants.alive[:variants.size].sum()),
+                "cluster_count": len(clusters),
+                "clusters": [self._cluster(variants, *c) for c in clusters[:limit]],
+            }
+
+    @staticmethod
+    def _cluster(variants, controls: int, members: list, uses: dict) -> dict:
+        canonical, rest = members[0], members[1:]
+        text = variants.text[canonical]
+        return {
+            "kind": variants.kind[canonical],
+            "controls": controls,
+            "canonical": {"text": text, "uses": len(uses[canonical]), "requirement_ids": uses[canonical][:5]},
+            "divergent": [{
+                "text": variants.text[vid],
+                "similarity": round(float((variants.sigs[vid] == variants.sigs[canonical]).mean()), 3),
+                "uses": len(uses[vid]),
+                "requirement_ids": uses[vid][:5],
+                "added": _words_diff(variants.text[vid], text),
+                "removed": _words_diff(text, variants.text[vid]),
+            } for vid in rest],
+        }
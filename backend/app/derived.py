@@ -0,0 +1,80 @@
+"""In-memory structures derived from the database (search and similarity indexes).
+
+``DerivedIndex`` builds its state on first use and lets the process that
+writes apply its own changes in place. After ``invalidate()`` (another
+process changed the inputs; see ``coherence``) the state is rebuilt in a
+background thread while the previous one keeps answering; changes applied
+during the rebuild are replayed onto the new state before it is swapped in,
+so they must be idempotent.
+"""
+import logging
+import threading
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+
+class DerivedIndex:
+    name = "derived_index"  # cache name in /metrics and rebuild thread name
+
+    def __init__(self):
+        self._state = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._pending = []
+
+    def _build(self):
+        raise NotImplementedError
+
+    def _changed(self, state):
+        """Called under the lock after a change was applied to ``state``."""
+
+    def invalidate(self):
+        """Another process changed the inputs; rebuild before long."""
+        self._dirty = True
+
+    def _refresh_async(self):
+        def run():
+            try:
+                state = self._build()
+                with self._lock:
+                    for change in self._pending:
+                        change(state)
+                    self._pending = []
+                    self._state = state
+            except Exception as e:
+                log.warning("%s rebuild failed: %s", self.name, e)
+            finally:
+                self._refreshing = False
+
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+            self._dirty = False
+            self._pending = []
+        threading.Thread(target=run, name=self.name, daemon=True).start()
+
+    def _current(self):
+        if self._state is None:
+            with self._lock:
+                if self._state is None:
+                    metrics.cache_miss(self.name)
+                    self._state = self._build()
+                    self._dirty = False
+        elif self._dirty:
+            metrics.cache_miss(self.name)
+            self._refresh_async()
+        else:
+            metrics.cache_hit(self.name)
+        return self._state
+
+    def _change(self, change):
+        """Apply ``change(state)`` now if built, and again to a rebuild in progress."""
+        with self._lock:
+            if self._state is not None:
+                change(self._state)
+                self._changed(self._state)
+            if self._refreshing:
+                self._pending.append(change)
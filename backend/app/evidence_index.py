@@ -0,0 +1,212 @@
+"""Full-text index over evidence files.
+
+Text is extracted from PDF, DOCX, XLSX and plain-text/log files in a process
+pool and stored in an SQLite FTS5 table keyed by evidence id. Each indexed
+file's size, mtime and SHA-256 are remembered in ``EvidenceText`` so a
+reindex only extracts files that are new or have changed.
+"""
+import os
+import re
+import zipfile
+import hashlib
+import logging
+import datetime
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from sqlalchemy import text as sql
+from sqlmodel import SQLModel, Field, Session, select
+from .storage import get_storage
+from .previews import PREVIEW_DIRNAME
+from . import sync
+
+EVIDENCE_INDEX_WORKERS = int(os.getenv("EVIDENCE_INDEX_WORKERS", "2"))
+MAX_TEXT_CHARS = int(os.getenv("EVIDENCE_INDEX_MAX_CHARS", str(2_000_000)))
+TEXT_EXTENSIONS = {".txt", ".log", ".csv", ".md", ".json", ".xml", ".conf", ".cfg", ".ini", ".yaml", ".yml"}
+
+log = logging.getLogger(__name__)
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_WS_RE = re.compile(r"\s+")
+
+
+class EvidenceText(SQLModel, table=True):
+    evidence_id: int = Field(primary_key=True)
+    sha256: Optional[str] = None
+    size: int = 0
+    mtime_ns: int = 0
+    chars: int = 0
+    error: Optional[str] = None
+    indexed_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+
+
+def _xml_text(zf: zipfile.ZipFile, names) -> str:
+    parts = []
+    for name in names:
+        with zf.open(name) as f:
+            xml = f.read().decode("utf-8", "ignore")
+        parts.append(_TAG_RE.sub(" ", xml.replace("</w:p>", "\n").replace("</si>", "\n")))
+    return "\n".join(parts)
+
+
+def _extract_pdf(path: str) -> str:
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    out, total = [], 0
+    for page in reader.pages:
+        t = page.extract_text() or ""
+        out.append(t)
+        total += len(t)
+        if total >= MAX_TEXT_CHARS:
+            break
+    return "\n".join(out)
+
+
+def extract_text(key: str, filename: str) -> dict:
+    """Runs in a worker process: fetch the evidence, hash it and pull out its searchable text."""
+    storage = get_storage()
+    size, mtime_ns = storage.stat(key) or (0, 0)
+    with storage.materialize(key) as path:
+        return _extract(path, filename, size, mtime_ns)
+
+
+def _extract(path: str, filename: str, size: int, mtime_ns: int) -> dict:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    result = {"sha256": h.hexdigest(), "size": size, "mtime_ns": mtime_ns, "text": "", "error": None}
+    ext = os.path.splitext(filename.lower())[1]
+    try:
+        if ext == ".pdf":
+            body = _extract_pdf(path)
+        elif ext in (".docx", ".docm"):
+            with zipfile.ZipFile(path) as zf:
+                body = _xml_text(zf, [n for n in zf.namelist() if re.match(r"word/(document|header\d*|footer\d*)\.xml$", n)])
+        elif ext in (".xlsx", ".xlsm"):
+            with zipfile.ZipFile(path) as zf:
+                names = [n for n in zf.namelist() if n == "xl/sharedStrings.xml" or re.match(r"xl/worksheets/sheet\d+\.xml$", n)]
+                body = _xml_text(zf, names)
+        elif ext in TEXT_EXTENSIONS or filename.lower().endswith(".log"):
+            with open(path, "rb") as f:
+                body = f.read(MAX_TEXT_CHARS).decode("utf-8", "replace")
+        else:
+            body = ""
+        result["text"] = _WS_RE.sub(" ", body)[:MAX_TEXT_CHARS].strip()
+    except ImportError as e:
+        result["error"] = f"extractor unavailable: {e.name}"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def fts_query(q: str) -> str:
+    """Quote each term so user input like ``3.1.1`` or ``AC-2`` is not parsed as FTS syntax."""
+    terms = [t.replace('"', '""') for t in q.split()]
+    return " ".join(f'"{t}"' for t in terms if t)
+
+
+class EvidenceIndexer:
+    def __init__(self, engine, storage):
+        self.engine = engine
+        self.storage = storage
+        self.enabled = engine.url.get_backend_name() == "sqlite"
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def ensure_schema(self):
+        if self.enabled:
+            with self.engine.begin() as conn:
+                conn.exec_driver_sql(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS evidence_fts USING fts5("
+                    "filename, body, requirement_id UNINDEXED, tokenize='porter unicode61')"
+                )
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn: the API process runs threads (audit writer, executor), which fork does not copy safely
+                self._pool = ProcessPoolExecutor(EVIDENCE_INDEX_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def schedule(self, rows):
+        """Queue ``(evidence_id, requirement_id, filename, key)`` tuples for extraction."""
+        if not self.enabled:
+            return 0
+        pool = self._executor()
+        for evidence_id, requirement_id, filename, key in rows:
+            fut = pool.submit(extract_text, key, filename)
+            fut.add_done_callback(lambda f, i=evidence_id, r=requirement_id, n=filename: self._store(f, i, r, n))
+        return len(rows)
+
+    def _store(self, fut, evidence_id, requirement_id, filename):
+        try:
+            res = fut.result()
+        except Exception as e:
+            log.warning("text extraction failed for evidence %s: %s", evidence_id, e)
+            return
+        with self._write_lock, Session(self.engine) as s:
+            s.exec(sql("DELETE FROM evidence_fts WHERE rowid = :id"), params={"id": evidence_id})
+            # read inside the write transaction the DELETE opened, so no other writer can change it before the UPDATE
+            row = s.exec(sql("SELECT sha256 FROM evidence WHERE id = :id"), params={"id": evidence_id}).first()
+            if row is None:
+                return  # deleted while extracting; closing the session rolls back the DELETE
+            if res["text"]:
+                s.exec(sql("INSERT INTO evidence_fts(rowid, filename, body, requirement_id) VALUES (:id, :fn, :body, :rid)"),
+                       params={"id": evidence_id, "fn": filename, "body": res["text"], "rid": requirement_id})
+            s.merge(EvidenceText(evidence_id=evidence_id, sha256=res["sha256"], size=res["size"], mtime_ns=res["mtime_ns"],
+                                 chars=len(res["text"]), error=res["error"], indexed_at=datetime.datetime.utcnow()))
+            if row.sha256 is None:
+                # a backfill is a change sync clients must see; rows already hashed keep their seq
+                s.exec(sql("UPDATE evidence SET sha256 = :sha, seq = :seq WHERE id = :id"),
+                       params={"sha": res["sha256"], "seq": sync.next_seq(s.connection()), "id": evidence_id})
+            s.commit()
+
+    def remove(self, session: Session, evidence_id: int):
+        if not self.enabled:
+            return
+        session.exec(sql("DELETE FROM evidence_fts WHERE rowid = :id"), params={"id": evidence_id})
+        row = session.get(EvidenceText, evidence_id)
+        if row:
+            session.delete(row)
+
+    def stale(self, session: Session, evidence_model) -> list:
+        """Evidence rows whose file is not indexed yet or changed since it was indexed.
+
+        Compares against one ``scan()`` listing rather than a stat per row, which
+        on S3 would be a HEAD request each. Blocking; call via run_in_threadpool.
+        """
+        known = {t.evidence_id: t for t in session.exec(select(EvidenceText))}
+        stored = {key: (size, mtime_ns) for key, size, mtime_ns in self.storage.scan(skip_dirs={PREVIEW_DIRNAME})}
+        out = []
+        for e in session.exec(select(evidence_model)):
+            st = stored.get(self.storage.key_for(e.path))
+            if st is None:
+                continue
+            t = known.get(e.id)
+            if t is None or (t.size, t.mtime_ns) != st or (e.sha256 and t.sha256 != e.sha256):
+                out.append((e.id, e.requirement_id, e.filename, e.path))
+        return out
+
+    def search(self, session: Session, q: str, limit: int = 50, requirement_id: Optional[str] = None) -> list:
+        match = fts_query(q)
+        if not match:
+            return []
+        stmt = (
+            "SELECT e.id, e.requirement_id, e.filename, e.size, e.ts, "
+            "snippet(evidence_fts, 1, '[', ']', '…', 16) AS snippet, bm25(evidence_fts) AS rank "
+            "FROM evidence_fts JOIN evidence e ON e.id = evidence_fts.rowid "
+            "WHERE evidence_fts MATCH :q"
+        )
+        params = {"q": match, "limit": limit}
+        if requirement_id:
+            stmt += " AND e.requirement_id = :rid"
+            params["rid"] = requirement_id
+        stmt += " ORDER BY rank LIMIT :limit"
+        return [dict(r._mapping) for r in session.exec(sql(stmt), params=params)]
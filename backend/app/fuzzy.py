@@ -0,0 +1,217 @@
+"""Typo-tolerant search over controls and their narratives.
+
+Text is split into words; each distinct word is indexed by its trigrams
+(``"  word "`` padded as in pg_trgm) and posts to the distinct text blobs it
+appears in. A query word is matched to vocabulary words by trigram
+similarity (shared / union), and the last word also by prefix, so results
+update as the user types. Blobs are scored by the mean best similarity of
+the query words, weighted by field (title > statement > narrative), and
+expanded to the controls that carry them. Synthetic or multi-tenant
+catalogues repeat the same title and statement, so the number of blobs, and
+the work per keystroke, grows with the distinct text rather than with the
+number of controls.
+
+Queries that look like a requirement id (``AC.L2-3.1``, ``3.1.1``) take a
+prefix fast path over sorted ids instead.
+
+The index is built on first use and kept current in this process as
+narratives are added or deleted; when another process changes controls or
+narratives it is rebuilt in the background (see ``derived``).
+"""
+import re
+import bisect
+from collections import Counter
+from sqlmodel import Session, select
+from .derived import DerivedIndex
+
+SIMILARITY_THRESHOLD = 0.3
+MAX_CANDIDATES = 20
+FIELD_WEIGHTS = {"title": 1.0, "statement": 0.9, "narrative": 0.8}
+
+_WORD = re.compile(r"[a-z0-9]+")
+_ID_QUERY = re.compile(r"^(?:[a-z]{2}\.|[a-z]{2}$|\d+\.\d)")
+
+
+def trigrams(word: str) -> frozenset:
+    padded = f"  {word} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class _Index:
+    def __init__(self):
+        self.blobs = {}             # (field, text) -> blob id
+        self.blob_field = []
+        self.blob_controls = []     # blob id -> Counter of control ids
+        self.words = {}             # word -> word id
+        self.word_list = []
+        self.word_grams = []
+        self.word_blobs = []        # word id -> set of blob ids
+        self.gram_words = {}        # trigram -> list of word ids
+        self.sorted_words = []
+        self.controls = {}          # control id -> (requirement_id, title, domain)
+        self.rid_control = {}
+        self.narratives = {}        # TextLog id -> (blob id, control id)
+        self.ids = []               # sorted (lowercase id, control id), for prefix lookups
+        self.suffixes = []          # the same keyed by the part after "-" ("3.1.1")
+
+    def _word(self, word: str) -> int:
+        wid = self.words.get(word)
+        if wid is None:
+            wid = self.words[word] = len(self.word_list)
+            self.word_list.append(word)
+            grams = trigrams(word)
+            self.word_grams.append(grams)
+            self.word_blobs.append(set())
+            for g in grams:
+                self.gram_words.setdefault(g, []).append(wid)
+            if self.ids:  # built already; keep the prefix list sorted for narratives added later
+                bisect.insort(self.sorted_words, word)
+        return wid
+
+    def add_blob(self, field: str, text: str, control_id: int):
+        key = (field, text)
+        bid = self.blobs.get(key)
+        if bid is None:
+            bid = self.blobs[key] = len(self.blob_field)
+            self.blob_field.append(field)
+            self.blob_controls.append(Counter())
+            for word in set(_WORD.findall(text.lower())):
+                self.word_blobs[self._word(word)].add(bid)
+        self.blob_controls[bid][control_id] += 1
+        return bid
+
+    def add_control(self, cid, requirement_id, title, domain, statement):
+        # requirement ids are unique, so they go to the prefix lists, not into the shared title blob
+        self.controls[cid] = (requirement_id, title, domain)
+        self.rid_control[requirement_id] = cid
+        self.add_blob("title", " ".join(filter(None, (title, domain))), cid)
+        if statement:
+            self.add_blob("statement", statement, cid)
+
+    def add_narrative(self, log_id: int, requirement_id: str, text: str):
+        cid = self.rid_control.get(requirement_id)
+        if cid is not None and text and log_id not in self.narratives:
+            self.narratives[log_id] = (self.add_blob("narrative", text, cid), cid)
+
+    def remove_narrative(self, log_id: int):
+        entry = self.narratives.pop(log_id, None)
+        if entry is not None:
+            bid, cid = entry
+            self.blob_controls[bid][cid] -= 1
+            if self.blob_controls[bid][cid] <= 0:
+                del self.blob_controls[bid][cid]
+
+    def finish(self):
+        self.sorted_words = sorted(self.word_list)
+        self.ids = sorted((rid.lower(), cid) for rid, cid in self.rid_control.items())
+        self.suffixes = sorted((rid.lower().rsplit("-", 1)[-1], cid) for rid, cid in self.rid_control.items())
+
+    # -- queries --------------------------------------------------------------
+
+    def _prefixed(self, pairs, prefix: str, limit: int) -> list:
+        out = []
+        i = bisect.bisect_left(pairs, (prefix,))
+        while i < len(pairs) and len(out) < limit and pairs[i][0].startswith(prefix):
+            out.append(pairs[i][1])
+            i += 1
+        return out
+
+    def by_id(self, prefix: str, limit: int) -> list:
+        found = self._prefixed(self.ids, prefix, limit)
+        if len(found) < limit:
+            found += [c for c in self._prefixed(self.suffixes, prefix, limit) if c not in found][:limit - len(found)]
+        return found
+
+    def candidates(self, token: str, typing: bool) -> list:
+        """``[(word id, similarity)]`` of the vocabulary words close to ``token``, best first."""
+        grams = trigrams(token)
+        shared = Counter()
+        for g in grams:
+            shared.update(self.gram_words.get(g, ()))
+        scored = {}
+        for wid, n in shared.items():
+            sim = n / (len(grams) + len(self.word_grams[wid]) - n)
+            if sim >= SIMILARITY_THRESHOLD:
+                scored[wid] = sim
+        if typing and len(token) >= 2:
+            words = self.sorted_words
+            for i in range(bisect.bisect_left(words, token), len(words)):
+                if not words[i].startswith(token):
+                    break
+                wid = self.words[words[i]]
+                scored[wid] = max(scored.get(wid, 0), len(token) / len(words[i]), SIMILARITY_THRESHOLD)
+        return sorted(scored.items(), key=lambda kv: -kv[1])[:MAX_CANDIDATES]
+
+    def search(self, tokens: list, limit: int) -> list:
+        per_token = []
+        for i, token in enumerate(tokens):
+            best = {}
+            for wid, sim in self.candidates(token, typing=i == len(tokens) - 1):
+                for bid in self.word_blobs[wid]:
+                    best.setdefault(bid, sim)
+            per_token.append(best)
+        totals = Counter()
+        for best in per_token:
+            totals.update(best)
+        ranked = sorted(
+            (-score / len(tokens) * FIELD_WEIGHTS[self.blob_field[bid]], bid) for bid, score in totals.items()
+        )
+        out, seen = [], set()
+        for score, bid in ranked:
+            score = -score
+            if score < SIMILARITY_THRESHOLD:
+                break
+            for cid in self.blob_controls[bid]:
+                if cid not in seen:
+                    seen.add(cid)
+                    out.append((cid, round(score, 3), self.blob_field[bid]))
+                    if len(out) == limit:
+                        return out
+        return out
+
+
+class FuzzyIndex(DerivedIndex):
+    name = "fuzzy_index"
+
+    def __init__(self, engine, control_model, textlog_model):
+        super().__init__()
+        self.engine = engine
+        self.control_model = control_model
+        self.textlog_model = textlog_model
+
+    def _build(self) -> _Index:
+        index = _Index()
+        with Session(self.engine) as s:
+            cm = self.control_model
+            for row in s.exec(select(cm.id, cm.requirement_id, cm.title, cm.domain, cm.statement).order_by(cm.sort_key)):
+                index.add_control(*row)
+            tl = self.textlog_model
+            for log_id, rid, text in s.exec(select(tl.id, tl.requirement_id, tl.text)):
+                index.add_narrative(log_id, rid, text)
+        index.finish()
+        return index
+
+    def narrative_added(self, log_id: int, requirement_id: str, text: str):
+        self._change(lambda index: index.add_narrative(log_id, requirement_id, text))
+
+    def narrative_removed(self, log_id: int):
+        self._change(lambda index: index.remove_narrative(log_id))
+
+    def search(self, q: str, limit: int = 20) -> list:
+        """``[{id, requirement_id, title, domain, score, match}]``, best first."""
+        needle = " ".join((q or "").lower().split())
+        if not needle:
+            return []
+        index = self._current()
+        with self._lock:
+            if _ID_QUERY.match(needle) and " " not in needle:
+                hits = [(cid, 1.0, "requirement_id") for cid in index.by_id(needle, limit)]
+                if hits:
+                    return [self._row(index, *hit) for hit in hits]
+            tokens = _WORD.findall(needle)
+            return [self._row(index, *hit) for hit in index.search(tokens, limit)] if tokens else []
+
+    @staticmethod
+    def _row(index, cid, score, match) -> dict:
+        rid, title, domain = index.controls[cid]
+        return {"id": cid, "requirement_id": rid, "title": title, "domain": domain, "score": score, "match": match}
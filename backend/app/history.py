@@ -0,0 +1,188 @@
+"""Readiness history: append-only status events plus packed daily snapshots.
+
+Every status change in ``update_control`` appends a ``StatusEvent``, and so
+does every control added after the baseline (seeding, the Excel importer).
+Completed days are rolled up into one ``DailySnapshot`` row holding the bucket
+counts as a packed int32 array, so a range query reads one small row per day
+and only replays the events recorded since the last snapshot. Compaction runs
+at startup and again on each worker's first history read of a new day, under
+a cross-process lock; ``series`` itself replays in memory and never writes.
+"""
+import datetime
+from array import array
+from typing import Optional
+from sqlmodel import SQLModel, Field, Session, select
+
+C3PAO_STATUS_BUCKETS = ["MET", "NOT_MET", "NA", "UNASSIGNED"]
+SELF_IMPL_STATUS_BUCKETS = [
+    "Implemented",
+    "Partially Implemented",
+    "Planned or Not Implemented",
+    "Alternative Implementation",
+    "N/A",
+    "UNASSIGNED",
+]
+OTHER = "OTHER"
+
+FIELDS = {
+    "c3pao_finding": ("c3pao", C3PAO_STATUS_BUCKETS + [OTHER]),
+    "self_impl_status": ("impl", SELF_IMPL_STATUS_BUCKETS + [OTHER]),
+}
+
+_compacted_on = None  # the day this process last compacted
+
+# Packed layout: [total, c3pao buckets..., impl buckets...]
+LAYOUT = ["total"] + [f"{name}:{b}" for name, buckets in FIELDS.values() for b in buckets]
+_SLOT = {key: i for i, key in enumerate(LAYOUT)}
+
+CREATED = "created"  # event field for a new control, which starts UNASSIGNED in every field
+
+
+class StatusEvent(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    ts: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    day: datetime.date = Field(default_factory=lambda: datetime.datetime.utcnow().date(), index=True)
+    requirement_id: str = Field(index=True)
+    field: str
+    old_status: Optional[str] = None
+    new_status: Optional[str] = None
+
+
+class DailySnapshot(SQLModel, table=True):
+    day: datetime.date = Field(primary_key=True)
+    event_id: int = 0
+    counts: bytes
+
+
+def _slot(field: str, status: Optional[str]) -> int:
+    name, buckets = FIELDS[field]
+    status = status or "UNASSIGNED"
+    return _SLOT[f"{name}:{status if status in buckets else OTHER}"]
+
+
+def pack(counts: array) -> bytes:
+    return counts.tobytes()
+
+
+def unpack(blob: bytes) -> array:
+    counts = array("i")
+    counts.frombytes(blob)
+    if len(counts) < len(LAYOUT):
+        counts.extend([0] * (len(LAYOUT) - len(counts)))
+    return counts
+
+
+def as_dict(day: datetime.date, counts: array) -> dict:
+    out = {"day": day.isoformat(), "total": counts[0]}
+    for name, buckets in FIELDS.values():
+        out[name] = {b: counts[_SLOT[f"{name}:{b}"]] for b in buckets if b != OTHER or counts[_SLOT[f"{name}:{b}"]]}
+    return out
+
+
+def apply_event(counts: array, ev: StatusEvent):
+    if ev.field == CREATED:
+        counts[0] += 1
+        for field in FIELDS:
+            counts[_slot(field, None)] += 1
+        return
+    counts[_slot(ev.field, ev.old_status)] -= 1
+    counts[_slot(ev.field, ev.new_status)] += 1
+
+
+def record(session: Session, requirement_id: str, old: dict, new: dict):
+    """Queue one event per changed status field; committed with the caller's transaction."""
+    for field in FIELDS:
+        if old.get(field) != new.get(field):
+            session.add(StatusEvent(requirement_id=requirement_id, field=field,
+                                    old_status=old.get(field), new_status=new.get(field)))
+
+
+def record_created(session: Session, requirement_id: str, statuses: dict):
+    """Queue the events for a new control with ``statuses``; committed with the caller's transaction."""
+    session.add(StatusEvent(requirement_id=requirement_id, field=CREATED))
+    record(session, requirement_id, {}, statuses)
+
+
+def ensure_baseline(session: Session, rows):
+    """Seed today's snapshot from ``(c3pao_finding, self_impl_status)`` rows if none exists."""
+    if session.exec(select(DailySnapshot.day).limit(1)).first() is not None:
+        return
+    counts = array("i", [0] * len(LAYOUT))
+    for c3pao, impl in rows:
+        counts[0] += 1
+        counts[_slot("c3pao_finding", c3pao)] += 1
+        counts[_slot("self_impl_status", impl)] += 1
+    last = session.exec(select(StatusEvent.id).order_by(StatusEvent.id.desc()).limit(1)).first() or 0
+    session.add(DailySnapshot(day=datetime.datetime.utcnow().date(), event_id=last, counts=pack(counts)))
+    session.commit()
+
+
+def _latest(session: Session, before: Optional[datetime.date] = None) -> Optional[DailySnapshot]:
+    q = select(DailySnapshot)
+    if before is not None:
+        q = q.where(DailySnapshot.day < before)
+    return session.exec(q.order_by(DailySnapshot.day.desc()).limit(1)).first()
+
+
+def _roll(session: Session, base: DailySnapshot, before: Optional[datetime.date] = None) -> list:
+    """``(day, last event id, counts)`` at the end of each day with events after ``base``."""
+    q = select(StatusEvent).where(StatusEvent.id > base.event_id)
+    if before is not None:
+        q = q.where(StatusEvent.day < before)
+    counts, day, event_id = unpack(base.counts), base.day, base.event_id
+    out = []
+    for ev in session.exec(q.order_by(StatusEvent.id)).all():
+        if ev.day != day and event_id != base.event_id:
+            out.append((day, event_id, array("i", counts)))
+        apply_event(counts, ev)
+        day, event_id = max(day, ev.day), ev.id
+    if event_id != base.event_id:
+        out.append((day, event_id, counts))
+    return out
+
+
+def compact_due() -> bool:
+    """True until this process has compacted today, so a new day's first read can roll up yesterday."""
+    return _compacted_on != datetime.datetime.utcnow().date()
+
+
+def compact(session: Session):
+    """Roll every completed day since the last snapshot into its own snapshot.
+
+    Writes, so only call it while holding a lock other workers respect (the
+    startup lock, or ``"history"``); ``series`` is correct without it.
+    """
+    global _compacted_on
+    today = datetime.datetime.utcnow().date()
+    last = _latest(session)
+    if last is not None:
+        rolled = _roll(session, last, before=today)
+        for day, event_id, counts in rolled:
+            session.merge(DailySnapshot(day=day, event_id=event_id, counts=pack(counts)))
+        if rolled:
+            session.commit()
+    _compacted_on = today
+
+
+def series(session: Session, start: datetime.date, end: datetime.date) -> list:
+    """Daily bucket counts for ``start..end`` inclusive, carrying quiet days forward."""
+    end = min(end, datetime.datetime.utcnow().date())
+    prev = _latest(session, before=start)
+    q = select(DailySnapshot).where(DailySnapshot.day >= (prev.day if prev else start), DailySnapshot.day <= end)
+    known = {snap.day: unpack(snap.counts) for snap in session.exec(q).all()}
+    base = _latest(session)
+    if base is not None:
+        # days not compacted yet, today included
+        known.update((day, counts) for day, _, counts in _roll(session, base))
+
+    out = []
+    earlier = [day for day in known if day < start]
+    counts = known[max(earlier)] if earlier else None
+    day = start
+    while day <= end:
+        if day in known:
+            counts = known[day]
+        if counts is not None:
+            out.append(as_dict(day, counts))
+        day += datetime.timedelta(days=1)
+    return out
@@ -7,9 +7,10 @@ Expected columns:
 import os
 import pandas as pd
 from sqlmodel import Session, select
-from .main import engine, Control
+from .main import engine, Control, coherence
+from . import objectives, history
 
-XLSX_PATH = "/data/CMMC L2 SSP.xlsx"
+XLSX_PATH = os.getenv("XLSX_PATH", "/data/CMMC L2 SSP.xlsx")
 COL_REQ = "requirement_id"
 COL_OBJ = "assessment_objectives"
 COL_MTH = "assessment_methods"
@@ -24,6 +25,7 @@ def run():
         if need not in lc:
             raise SystemExit(f"Missing required column in Excel: {need}")
     with Session(engine) as s:
+        imported = []
         for _, row in df.iterrows():
             rid = str(row[lc[COL_REQ]]).strip()
             if not rid:
@@ -33,9 +35,15 @@ def run():
             ctrl = s.exec(select(Control).where(Control.requirement_id==rid)).first()
             if not ctrl:
                 ctrl = Control(requirement_id=rid, domain="Unknown", title=rid, statement="")
+                history.record_created(s, rid, {})
             ctrl.assessment_objectives = obj
             ctrl.assessment_methods = mth
             s.add(ctrl)
+            imported.append((rid, obj))
+        objectives.sync_objectives(s, imported)
+        # running API workers reload their control caches and search index
+        coherence.bump(s, "controls")
+        coherence.bump(s, "search")
         s.commit()
     print("Import complete.")
 
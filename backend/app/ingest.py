@@ -0,0 +1,189 @@
+"""Bulk evidence ingest from a ZIP archive or a server-side directory.
+
+Files are mapped to controls by their path: the first path component (or
+any component) that names a known requirement_id, e.g.
+``AC.L2-3.1.1/screenshots/gpo.png``. Matching files are copied into evidence
+storage and hashed by a thread pool, and ``Evidence`` rows are
+committed in large batches. Files whose (requirement_id, SHA-256) is already
+on record are skipped, so re-running an ingest is cheap.
+
+CLI, from ``backend/``::
+
+    python -m app.ingest /data/ingest/auditor-drop.zip
+"""
+import os
+import re
+import sys
+import json
+import zipfile
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from sqlmodel import Session, select
+from .storage import make_key
+from . import usage
+
+INGEST_ROOT = os.getenv("INGEST_ROOT", "/data/ingest")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "8"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+
+_RID_RE = re.compile(r"[A-Za-z]{2}\.L[12]-3\.\d+\.\d+")
+
+
+class IngestError(Exception):
+    pass
+
+
+def map_requirement(relpath: str, known: dict):
+    """Canonical requirement_id for a path, or None. ``known`` maps lowercased ids to canonical ones."""
+    parts = [p for p in relpath.replace("\\", "/").split("/") if p]
+    for part in parts[:-1]:
+        rid = known.get(part.lower())
+        if rid:
+            return rid
+    for part in parts:
+        m = _RID_RE.search(part)
+        if m and m.group(0).lower() in known:
+            return known[m.group(0).lower()]
+    return None
+
+
+def _skip(relpath: str) -> bool:
+    name = os.path.basename(relpath)
+    return not name or name.startswith(".") or "__MACOSX/" in relpath or name in ("Thumbs.db", "desktop.ini")
+
+
+def directory_entries(root: str):
+    """Yield ``(relpath, size, opener)`` for every file under ``root`` (must live inside INGEST_ROOT)."""
+    real_root = os.path.realpath(root)
+    allowed = os.path.realpath(INGEST_ROOT)
+    if os.path.commonpath([real_root, allowed]) != allowed:
+        raise IngestError(f"Directory must be inside INGEST_ROOT ({INGEST_ROOT})")
+    if not os.path.isdir(real_root):
+        raise IngestError(f"Not a directory: {root}")
+    stack = [real_root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield (os.path.relpath(entry.path, real_root), entry.stat(follow_symlinks=False).st_size,
+                           (lambda p=entry.path: open(p, "rb")))
+
+
+def zip_entries(zf: zipfile.ZipFile):
+    for info in zf.infolist():
+        if not info.is_dir():
+            yield info.filename, info.file_size, (lambda i=info: zf.open(i))
+
+
+def _copy(storage, opener, key: str):
+    with opener() as src:
+        return storage.save(key, src)
+
+
+def ingest(session: Session, entries, storage, evidence_model, control_model) -> dict:
+    """Copy mapped files into ``storage`` and record them.
+
+    Returns a summary whose ``rows`` holds ``(id, requirement_id, filename, key, size)`` per new file.
+    """
+    known = {rid.lower(): rid for rid in session.exec(select(control_model.requirement_id))}
+    seen = set(session.exec(
+        select(evidence_model.requirement_id, evidence_model.sha256).where(evidence_model.sha256.is_not(None))
+    ).all())
+    stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    report = {"ingested": 0, "bytes": 0, "duplicates": 0, "unmapped": [], "rejected": [], "rows": []}
+    used = set()
+    budget = usage.Budget(session)
+
+    def plan():
+        for relpath, size, opener in entries:
+            if _skip(relpath):
+                continue
+            rid = map_requirement(relpath, known)
+            if rid is None:
+                report["unmapped"].append(relpath)
+                continue
+            try:
+                budget.take(rid, size)
+            except usage.QuotaExceeded as e:
+                report["rejected"].append({"path": relpath, "error": str(e)})
+                continue
+            name = os.path.basename(relpath.replace("\\", "/"))
+            key, n = make_key(rid, name, stamp), 1
+            while key in used or storage.exists(key):
+                key, n = make_key(rid, f"{n}__{name}", stamp), n + 1
+            used.add(key)
+            yield relpath, rid, name, size, opener, key
+
+    pending = []
+
+    def flush():
+        session.add_all(pending)
+        per_control = {}
+        for e in pending:
+            nbytes, nfiles = per_control.get(e.requirement_id, (0, 0))
+            per_control[e.requirement_id] = (nbytes + e.size, nfiles + 1)
+        for rid, (nbytes, nfiles) in per_control.items():
+            usage.apply(session, rid, nbytes, nfiles)
+        session.flush()
+        # capture before commit expires the instances, or every attribute access would reload a row
+        report["rows"].extend((e.id, e.requirement_id, e.filename, e.path, e.size) for e in pending)
+        session.commit()
+        pending.clear()
+
+    with ThreadPoolExecutor(INGEST_WORKERS, thread_name_prefix="ingest") as pool:
+        window = []
+
+        def settle(item):
+            relpath, rid, name, expected, key, fut = item
+            try:
+                size, sha = fut.result()
+            except Exception as e:
+                budget.release(rid, expected)
+                report["rejected"].append({"path": relpath, "error": str(e)})
+                return
+            if (rid, sha) in seen:
+                budget.release(rid, expected)
+                storage.delete(key)
+                report["duplicates"] += 1
+                return
+            seen.add((rid, sha))
+            pending.append(evidence_model(requirement_id=rid, filename=name, size=size, path=key, sha256=sha))
+            report["ingested"] += 1
+            report["bytes"] += size
+            if len(pending) >= INGEST_BATCH_SIZE:
+                flush()
+
+        for relpath, rid, name, size, opener, key in plan():
+            window.append((relpath, rid, name, size, key, pool.submit(_copy, storage, opener, key)))
+            # bound the number of in-flight copies so huge archives don't queue every file at once
+            if len(window) >= INGEST_WORKERS * 4:
+                settle(window.pop(0))
+        for item in window:
+            settle(item)
+    if pending:
+        flush()
+    return report
+
+
+def main(argv=None):
+    from .main import engine, Evidence, Control, storage
+
+    args = argv if argv is not None else sys.argv[1:]
+    if len(args) != 1:
+        raise SystemExit("usage: python -m app.ingest <zip-file-or-directory>")
+    source = args[0]
+    with Session(engine) as s:
+        if zipfile.is_zipfile(source):
+            with zipfile.ZipFile(source) as zf:
+                report = ingest(s, zip_entries(zf), storage, Evidence, Control)
+        else:
+            report = ingest(s, directory_entries(source), storage, Evidence, Control)
+    report.pop("rows")
+    print(json.dumps(report, indent=2))
+    print("Run POST /evidence/reindex to add the new files to the search index.")
+
+
+if __name__ == "__main__":
+    main()
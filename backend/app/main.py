@@ -1,15 +1,47 @@
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, Query, Request, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, PlainTextResponse, FileResponse, StreamingResponse, RedirectResponse
 from typing import Optional, List
-from sqlmodel import SQLModel, Field, Session, create_engine, select
-import os, shutil, datetime
-from collections import Counter
+from sqlmodel import SQLModel, Field, Session, create_engine, select, or_, and_, func
+import os, re, datetime, logging, zipfile
+from sqlalchemy import inspect, Index, event, bindparam, update
+from sqlalchemy.orm import aliased
+from .scoring import ScoreHistory, scoreboard, MAX_SCORE, MIN_SCORE
+from . import history
+from .history import C3PAO_STATUS_BUCKETS, SELF_IMPL_STATUS_BUCKETS
+from . import audit
+from .audit import AuditEntry, AuditWriter
+from . import metrics, profiling
+from . import compression
+from .evidence_index import EvidenceIndexer
+from .previews import PreviewCache, Unsupported
+from .archive import stream_zip
+from . import ingest as bulk
+from .storage import get_storage, make_key, safe_name as storage_name, StorageError
+from . import reconcile
+from . import usage
+from . import readmodel
+from . import objectives
+from . import sync
+from .fuzzy import FuzzyIndex
+from .similarity import SimilarityIndex
+from .consistency import ConsistencyIndex
+from .coherence import Coherence, locked
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/data/uploads")
+COVERAGE_SNIPPET_CHARS = 200
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",")
 
 engine = create_engine(DATABASE_URL, echo=False)
+if readmodel.READ_MODE != "primary" and engine.url.get_backend_name() == "sqlite":
+    readmodel.enable_wal(engine)
+read_engine = readmodel.read_engine(engine)
+for db in {engine, read_engine}:
+    metrics.install_db_hooks(db)
+    if profiling.PROFILE_ENABLED:
+        profiling.install_db_hooks(db)
 
 app = FastAPI(title="CertManager API")
 
@@ -19,9 +51,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-After", "ETag"],
 )
+app.add_middleware(
+    compression.CompressionMiddleware,
+    cacheable=("/controls", "/dashboard", "/dashboard/history", "/score", "/sync"),
+)
+if profiling.PROFILE_ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+log = logging.getLogger(__name__)
+audit_log = AuditWriter(engine)
+app.add_middleware(audit.AuditMiddleware, writer=audit_log)
 
 class Control(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -36,23 +79,69 @@ class Control(SQLModel, table=True):
     assessment_methods: Optional[str] = None
     c3pao_finding: Optional[str] = Field(default=None, index=True)
     self_impl_status: Optional[str] = Field(default=None, index=True)
+    sort_key: Optional[str] = Field(default=None, index=True)
+    version: int = Field(default=1)
+    seq: int = Field(default=0, index=True)
+
+def requirement_sort_key(requirement_id: str) -> str:
+    """Natural order for requirement ids: numbers are zero-padded, so AC.L2-3.1.2 sorts before AC.L2-3.1.10."""
+    return re.sub(r"\d+", lambda m: m.group().zfill(6), requirement_id)
+
+@event.listens_for(Control, "before_insert")
+@event.listens_for(Control, "before_update")
+def _set_sort_key(mapper, connection, target):
+    target.sort_key = requirement_sort_key(target.requirement_id)
+
+@event.listens_for(Control, "before_update")
+def _bump_version(mapper, connection, target):
+    # ORM writers such as the Excel import; update_control bumps it in its own conditional UPDATE
+    target.version = (target.version or 0) + 1
+
+read_model = readmodel.ReadModel(read_engine, Control)
 
 class TextLog(SQLModel, table=True):
+    __table_args__ = (Index("ix_textlog_requirement_kind_ts", "requirement_id", "kind", "ts"),)
     id: Optional[int] = Field(default=None, primary_key=True)
     requirement_id: str = Field(index=True)
     kind: str = Field(index=True)
     text: str
     ts: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    seq: int = Field(default=0, index=True)
 
 class Evidence(SQLModel, table=True):
+    __table_args__ = (Index("ix_evidence_requirement_ts", "requirement_id", "ts"),)
     id: Optional[int] = Field(default=None, primary_key=True)
     requirement_id: str = Field(index=True)
     filename: str
     size: int
     ts: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
     path: str
+    sha256: Optional[str] = None
+    seq: int = Field(default=0, index=True)
 
-SQLModel.metadata.create_all(engine)
+sync.track(Control, "controls")
+sync.track(TextLog, "textlog")
+sync.track(Evidence, "evidence")
+
+def ensure_columns(model, columns):
+    """Add columns introduced after a table was first created; create_all never alters existing tables."""
+    table = model.__tablename__
+    existing = {c["name"] for c in inspect(engine).get_columns(table)}
+    with engine.begin() as conn:
+        for name, ddl in columns.items():
+            if name not in existing:
+                conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}")
+
+def ensure_indexes(*models):
+    """Create indexes declared after a table was first created; create_all skips them for existing tables."""
+    for model in models:
+        for index in model.__table__.indexes:
+            index.create(engine, checkfirst=True)
+
+storage = get_storage(UPLOAD_DIR)
+fuzzy_index = FuzzyIndex(engine, Control, TextLog)
+evidence_indexer = EvidenceIndexer(engine, storage)
+preview_cache = PreviewCache(UPLOAD_DIR, storage)
 SEED = [
 {
     "requirement_id": "AC.L2-3.1.1",
@@ -1817,78 +1906,265 @@ SEED = [
 ]
 
 from sqlmodel import select, Session
-with Session(engine) as s:
+# with several workers, schema changes and seeding must not run concurrently
+with locked(engine, "startup"), Session(engine) as s:
+    SQLModel.metadata.create_all(engine)
+    ensure_columns(Evidence, {"sha256": "VARCHAR", "seq": "INTEGER NOT NULL DEFAULT 0"})
+    ensure_columns(Control, {"sort_key": "VARCHAR", "version": "INTEGER NOT NULL DEFAULT 1", "seq": "INTEGER NOT NULL DEFAULT 0"})
+    ensure_columns(TextLog, {"seq": "INTEGER NOT NULL DEFAULT 0"})
+    ensure_indexes(Control, TextLog, Evidence)
+    sync.ensure_counter(s)
+    evidence_indexer.ensure_schema()
     cnt = s.exec(select(Control)).all()
     if not cnt:
         for row in SEED:
             s.add(Control(**row))
+            history.record_created(s, row["requirement_id"], row)
         s.commit()
-def get_session():
+    unsorted = s.exec(select(Control.id, Control.requirement_id).where(Control.sort_key.is_(None))).all()
+    if unsorted:
+        s.execute(Control.__table__.update().where(Control.id == bindparam("cid")).values(sort_key=bindparam("key")),
+                  [{"cid": cid, "key": requirement_sort_key(rid)} for cid, rid in unsorted])
+        s.commit()
+    history.ensure_baseline(s, s.exec(select(Control.c3pao_finding, Control.self_impl_status)).all())
+    history.compact(s)
+    usage.ensure_counters(s, Evidence)
+    objectives.ensure_objectives(s, Control)
+
+def control_statuses():
+    with Session(engine) as s:
+        return s.exec(select(Control.requirement_id, Control.c3pao_finding, Control.self_impl_status)).all()
+
+scoreboard.load(control_statuses())
+scoreboard.bind(control_statuses)
+SEED_SOLUTION_FIELD = "What is the Solution?\nHow is it implemented?"
+similarity_index = SimilarityIndex(
+    engine, Control, TextLog,
+    seed_narratives=[(row["requirement_id"], row[SEED_SOLUTION_FIELD]) for row in SEED if row.get(SEED_SOLUTION_FIELD)],
+)
+consistency_index = ConsistencyIndex(engine, TextLog, seed_narratives=similarity_index.seed_narratives)
+coherence = Coherence(engine)
+coherence.register("controls", read_model.invalidate)
+coherence.register("controls", scoreboard.invalidate)
+coherence.register("search", fuzzy_index.invalidate)
+coherence.register("search", similarity_index.invalidate)
+coherence.register("search", consistency_index.invalidate)
+
+def index_narrative_added(log_id: int, requirement_id: str, kind: str, text: str):
+    """Apply a new narrative entry to the in-memory search indexes; blocking, call via run_in_threadpool."""
+    fuzzy_index.narrative_added(log_id, requirement_id, text)
+    similarity_index.narrative_added(log_id, requirement_id, kind, text)
+    consistency_index.narrative_added(log_id, requirement_id, kind, text)
+
+def index_narrative_removed(log_id: int, requirement_id: str):
+    fuzzy_index.narrative_removed(log_id)
+    similarity_index.narrative_removed(log_id, requirement_id)
+    consistency_index.narrative_removed(log_id, requirement_id)
+coherence.prime()
+
+async def get_session():
+    coherence.check()
     with Session(engine) as session:
         yield session
 
+async def get_read_session():
+    """Session for read-only routes; see readmodel for READ_MODE."""
+    coherence.check()
+    with Session(read_engine) as session:
+        yield session
+
+@app.on_event("shutdown")
+def flush_audit_log():
+    audit_log.stop()
+    evidence_indexer.shutdown()
+    preview_cache.shutdown()
+    coherence.close()
+
 @app.get("/health")
 async def health():
     return {"ok": True}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    body = metrics.render(engine.url.database if engine.url.get_backend_name() == "sqlite" else None, UPLOAD_DIR)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+def control_coverage(session: Session, requirement_ids=None) -> dict:
+    """``requirement_id -> coverage fields`` for ``requirement_ids`` (every control when None), from one statement.
+
+    Evidence totals come from the per-control usage counters; the newest
+    provider and solution narrative from a row_number over TextLog, both
+    joined to Control on requirement_id. A page only ranks its own TextLog rows.
+    """
+    scope = [TextLog.kind.in_(("provider", "solution"))]
+    if requirement_ids is not None:
+        scope.append(TextLog.requirement_id.in_(requirement_ids))
+    ranked = select(
+        TextLog.requirement_id, TextLog.kind, TextLog.ts,
+        func.substr(TextLog.text, 1, COVERAGE_SNIPPET_CHARS).label("snippet"),
+        func.row_number().over(
+            partition_by=(TextLog.requirement_id, TextLog.kind), order_by=(TextLog.ts.desc(), TextLog.id.desc())
+        ).label("rn"),
+    ).where(*scope).cte("latest_textlog")
+    provider, solution = ranked.alias("provider"), ranked.alias("solution")
+    used = usage.EvidenceUsage
+    q = (
+        select(Control.requirement_id, used.files, used.bytes, provider.c.snippet, provider.c.ts, solution.c.snippet, solution.c.ts)
+        .outerjoin(used, and_(used.scope == usage.CONTROL, used.key == Control.requirement_id))
+        .outerjoin(provider, and_(provider.c.requirement_id == Control.requirement_id, provider.c.kind == "provider", provider.c.rn == 1))
+        .outerjoin(solution, and_(solution.c.requirement_id == Control.requirement_id, solution.c.kind == "solution", solution.c.rn == 1))
+    )
+    if requirement_ids is not None:
+        q = q.where(Control.requirement_id.in_(requirement_ids))
+    out = {}
+    for rid, files, nbytes, p_text, p_ts, s_text, s_ts in session.exec(q):
+        out[rid] = {
+            "evidence_count": files or 0,
+            "evidence_bytes": nbytes or 0,
+            "latest_provider": {"text": p_text, "ts": p_ts} if p_ts is not None else None,
+            "latest_solution": {"text": s_text, "ts": s_ts} if s_ts is not None else None,
+        }
+    return out
+
 @app.get("/controls")
-async def list_controls(q: Optional[str] = None, domain: Optional[str] = None, session: Session = Depends(get_session)):
-    stmt = select(Control)
-    rows = session.exec(stmt).all()
-    if domain:
-        rows = [r for r in rows if r.domain.lower() == domain.lower()]
-    if q:
-        needle = q.strip().lower()
-        rows = [r for r in rows if any([
-            needle in (r.title or '').lower(),
-            needle in (r.statement or '').lower(),
-            needle in (r.requirement_id or '').lower(),
-            needle in (r.domain or '').lower()
-        ])]
+async def list_controls(
+    response: Response,
+    q: Optional[str] = None,
+    domain: Optional[str] = None,
+    coverage: bool = False,
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    session: Session = Depends(get_read_session),
+):
+    """Controls in natural requirement_id order.
+
+    With ``limit`` the list is a page; when more follow, the ``X-Next-After``
+    header holds the requirement_id to pass as ``after`` for the next one.
+    """
+    if not q and not domain and not coverage and after is None and limit is None:
+        body = read_model.controls_json()
+        if body is not None:
+            return Response(body, media_type="application/json")
+    after_key = requirement_sort_key(after) if after is not None else None
+    rows = read_model.controls(session, q, domain, after_key, limit + 1 if limit else None)
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-After"] = rows[-1].requirement_id
+    if coverage:
+        partial = q or domain or after is not None or limit
+        cov = control_coverage(session, [r.requirement_id for r in rows] if partial else None)
+        rows = [{**r.model_dump(), **cov.get(r.requirement_id, {})} for r in rows]
     return rows
 
+@app.get("/controls/search")
+async def search_controls(q: str, limit: int = Query(20, ge=1, le=100)):
+    """Typo-tolerant, ranked search over controls and narratives; see fuzzy.py."""
+    coherence.check()
+    return await run_in_threadpool(fuzzy_index.search, q, limit)
+
 @app.get("/controls/{control_id}")
-async def get_control(control_id: int, session: Session = Depends(get_session)):
-    c = session.get(Control, control_id)
+async def get_control(control_id: int, response: Response, session: Session = Depends(get_read_session)):
+    c = read_model.control(session, control_id)
     if not c:
         raise HTTPException(404, "Control not found")
+    response.headers["ETag"] = control_etag(c)
     return c
 
+def control_etag(c: Control) -> str:
+    # weak: the same version may go out gzip- or brotli-encoded (see compression.py)
+    return f'W/"{c.version}"'
+
+def if_match_version(header: Optional[str]) -> Optional[int]:
+    """The control version an ``If-Match`` header names; None when absent or ``*``."""
+    if header is None or header.strip() == "*":
+        return None
+    tag = header.split(",")[0].strip().removeprefix("W/").strip('"')
+    try:
+        return int(tag)
+    except ValueError:
+        raise HTTPException(400, 'If-Match must be a control version such as "3"')
+
+def edit_conflict(c: Control) -> HTTPException:
+    return HTTPException(
+        409,
+        {"message": "Control was changed by someone else", "current": c.model_dump()},
+        headers={"ETag": control_etag(c)},
+    )
+
 from pydantic import BaseModel
 class ControlUpdate(BaseModel):
     c3pao_finding: Optional[str] = None
     self_impl_status: Optional[str] = None
 
 @app.patch("/controls/{control_id}")
-async def update_control(control_id: int, payload: ControlUpdate, session: Session = Depends(get_session)):
+async def update_control(
+    control_id: int,
+    payload: ControlUpdate,
+    request: Request,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    session: Session = Depends(get_session),
+):
+    """Compare-and-set on ``Control.version``: 409 with the current control if it moved.
+
+    With ``If-Match`` the edit applies only to that version; without it, only
+    to the version read here. Either way the check and the write are one
+    ``UPDATE ... WHERE id = ? AND version = ?``, so concurrent editors never
+    wait on a lock. The response carries the new version (also as ``ETag``)
+    and ``changed``, the fields this edit set, for the client to merge.
+    """
+    expected = if_match_version(if_match)
     c = session.get(Control, control_id)
     if not c:
         raise HTTPException(404, "Control not found")
+    if expected is not None and expected != c.version:
+        raise edit_conflict(c)
+    old = {"c3pao_finding": c.c3pao_finding, "self_impl_status": c.self_impl_status}
+    new = dict(old)
     if payload.c3pao_finding is not None:
-        c.c3pao_finding = payload.c3pao_finding
+        new["c3pao_finding"] = payload.c3pao_finding
     if payload.self_impl_status is not None:
-        c.self_impl_status = payload.self_impl_status
-    session.add(c)
+        new["self_impl_status"] = payload.self_impl_status
+    audit.note(request, c.requirement_id, before=old, after=new)
+    if new == old:
+        # nothing to write: no new version, and every cache stays valid
+        response.headers["ETag"] = control_etag(c)
+        return {**c.model_dump(), "changed": {}}
+    written = session.exec(
+        update(Control)
+        .where(Control.id == control_id, Control.version == c.version)
+        .values(**new, version=Control.version + 1, seq=sync.next_seq(session.connection()))
+    )
+    if written.rowcount != 1:
+        session.rollback()
+        session.refresh(c)
+        raise edit_conflict(c)
+    delta = scoreboard.delta(c.requirement_id, old, new)
+    score = scoreboard.scores(delta)
+    session.add(ScoreHistory(requirement_id=c.requirement_id, self_score=score["self"], c3pao_score=score["c3pao"]))
+    history.record(session, c.requirement_id, old, new)
+    version = coherence.bump(session, "controls")
     session.commit()
+    coherence.written("controls", version)
+    read_model.invalidate()
+    if delta:
+        scoreboard.apply(delta)
     session.refresh(c)
-    return c
-C3PAO_STATUS_BUCKETS = ["MET", "NOT_MET", "NA", "UNASSIGNED"]
-SELF_IMPL_STATUS_BUCKETS = [
-    "Implemented",
-    "Partially Implemented",
-    "Planned or Not Implemented",
-    "Alternative Implementation",
-    "N/A",
-    "UNASSIGNED",
-]
+    response.headers["ETag"] = control_etag(c)
+    return {**c.model_dump(), "changed": {k: v for k, v in new.items() if v != old[k]}}
 
 
+@app.get("/sync")
+async def sync_changes(since: Optional[int] = Query(None, ge=0), session: Session = Depends(get_read_session)):
+    """Controls, TextLog and Evidence rows changed after ``since``, plus tombstones; everything without it.
+
+    Clients keep the returned ``seq`` and pass it back next time; see sync.py.
+    """
+    return sync.changes(session, since)
+
 @app.get("/dashboard")
-async def dashboard(session: Session = Depends(get_session)):
-    rows = session.exec(select(Control)).all()
-    total = len(rows)
-    c3pao_counts = Counter((r.c3pao_finding or "UNASSIGNED") for r in rows)
-    impl_counts = Counter((r.self_impl_status or "UNASSIGNED") for r in rows)
+async def dashboard(session: Session = Depends(get_read_session)):
+    total, c3pao_counts, impl_counts = read_model.status_counts(session)
 
     for bucket in C3PAO_STATUS_BUCKETS:
         c3pao_counts.setdefault(bucket, 0)
@@ -1899,6 +2175,37 @@ async def dashboard(session: Session = Depends(get_session)):
         "total": total,
         "c3pao": dict(c3pao_counts),
         "impl": dict(impl_counts),
+        "sprs": scoreboard.scores(),
+    }
+
+def compact_history():
+    with locked(engine, "history"), Session(engine) as s:
+        history.compact(s)
+
+@app.get("/dashboard/history")
+async def dashboard_history(
+    start: Optional[datetime.date] = Query(None, alias="from"),
+    end: Optional[datetime.date] = Query(None, alias="to"),
+    session: Session = Depends(get_session),
+):
+    end = end or datetime.datetime.utcnow().date()
+    start = start or end - datetime.timedelta(days=30)
+    if start > end:
+        raise HTTPException(400, "'from' must not be after 'to'")
+    if history.compact_due():
+        await run_in_threadpool(compact_history)
+    return history.series(session, start, end)
+
+@app.get("/score")
+async def get_score(limit: int = Query(100, ge=1, le=1000), session: Session = Depends(get_session)):
+    q = select(ScoreHistory).order_by(ScoreHistory.ts.desc(), ScoreHistory.id.desc()).limit(limit)
+    history = session.exec(q).all()
+    history.reverse()
+    return {
+        "max": MAX_SCORE,
+        "min": MIN_SCORE,
+        **scoreboard.scores(),
+        "history": history,
     }
 
 class TextLogIn(BaseModel):
@@ -1906,11 +2213,16 @@ class TextLogIn(BaseModel):
     text: str
 
 @app.post("/controls/{requirement_id}/textlog")
-async def add_textlog(requirement_id: str, payload: TextLogIn, session: Session = Depends(get_session)):
+async def add_textlog(requirement_id: str, payload: TextLogIn, request: Request, session: Session = Depends(get_session)):
     entry = TextLog(requirement_id=requirement_id, kind=payload.kind, text=payload.text)
     session.add(entry)
+    version = coherence.bump(session, "search")
     session.commit()
+    coherence.written("search", version)
     session.refresh(entry)
+    # band lookups and the periodic similarity merge stay off the event loop
+    await run_in_threadpool(index_narrative_added, entry.id, entry.requirement_id, entry.kind, entry.text)
+    audit.note(request, requirement_id, textlog_id=entry.id, kind=entry.kind)
     return entry
 
 @app.get("/controls/{requirement_id}/textlog")
@@ -1922,30 +2234,132 @@ async def list_textlog(requirement_id: str, kind: Optional[str]=None, session: S
     rows.sort(key=lambda x: x.ts)
     return rows
 
+@app.get("/controls/{requirement_id}/bundle")
+async def control_bundle(
+    requirement_id: str,
+    log_limit: int = Query(50, ge=1, le=500),
+    log_offset: int = Query(0, ge=0),
+    session: Session = Depends(get_read_session),
+):
+    """Everything the control detail view shows, in three indexed queries.
+
+    ``textlog`` has one entry per kind: the newest entry, the kind's total,
+    and a page of ``log_limit`` entries counting back from the newest
+    (skipping ``log_offset``), returned oldest first like ``/textlog``.
+    """
+    c = session.exec(select(Control).where(Control.requirement_id == requirement_id)).first()
+    if not c:
+        raise HTTPException(404, "Control not found")
+    newest_first = (TextLog.ts.desc(), TextLog.id.desc())
+    ranked = select(
+        TextLog,
+        func.row_number().over(partition_by=TextLog.kind, order_by=newest_first).label("rn"),
+        func.count().over(partition_by=TextLog.kind).label("total"),
+    ).where(TextLog.requirement_id == requirement_id).subquery()
+    entry = aliased(TextLog, ranked)
+    rows = session.exec(
+        select(entry, ranked.c.rn, ranked.c.total)
+        .where(or_(ranked.c.rn == 1, ranked.c.rn.between(log_offset + 1, log_offset + log_limit)))
+        .order_by(ranked.c.kind, ranked.c.rn.desc())
+    ).all()
+    textlog = {}
+    for e, rn, total in rows:
+        group = textlog.setdefault(e.kind, {"latest": None, "total": total, "items": []})
+        if rn == 1:
+            group["latest"] = e
+        if log_offset < rn <= log_offset + log_limit:
+            group["items"].append(e)
+    for group in textlog.values():
+        group["has_more"] = group["total"] > log_offset + log_limit
+    evidence = session.exec(select(Evidence).where(Evidence.requirement_id == requirement_id).order_by(Evidence.ts)).all()
+    return {"control": c, "textlog": textlog, "evidence": evidence}
+
+@app.get("/controls/{requirement_id}/similar")
+async def similar_controls(requirement_id: str, k: int = Query(10, ge=1, le=100)):
+    """Controls with the most similar statement or narratives (TF-IDF cosine); see similarity.py."""
+    coherence.check()
+    found = await run_in_threadpool(similarity_index.similar_controls, requirement_id, k)
+    if found is None:
+        raise HTTPException(404, "Control not found")
+    return found
+
+@app.get("/narratives/suggest")
+async def suggest_narrative(
+    q: Optional[str] = None,
+    requirement_id: Optional[str] = None,
+    kind: Optional[str] = Query(None, pattern="^(provider|solution)$"),
+    k: int = Query(5, ge=1, le=50),
+):
+    """Existing narratives to reuse: closest to the draft ``q``, or used by controls with similar statements."""
+    if not (q or "").strip() and not requirement_id:
+        raise HTTPException(400, "Give q or requirement_id")
+    coherence.check()
+    found = await run_in_threadpool(similarity_index.suggest, q, requirement_id, kind, k)
+    if found is None:
+        raise HTTPException(404, "Control not found")
+    return found
+
+@app.get("/narratives/consistency")
+async def narrative_consistency(
+    kind: Optional[str] = Query(None, pattern="^(provider|solution)$"),
+    requirement_id: Optional[str] = None,
+    domain: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+):
+    """Near-duplicate narratives that exist in several variants (MinHash/LSH); see consistency.py."""
+    coherence.check()
+    return await run_in_threadpool(consistency_index.report, kind, requirement_id, domain, limit)
+
 @app.delete("/textlog/{log_id}")
-async def delete_textlog(log_id: int, session: Session = Depends(get_session)):
+async def delete_textlog(log_id: int, request: Request, session: Session = Depends(get_session)):
     row = session.get(TextLog, log_id)
     if not row:
         raise HTTPException(404, "Log not found")
+    audit.note(request, row.requirement_id, textlog_id=row.id, kind=row.kind, text=row.text)
+    objectives.unlink(session, objectives.TEXTLOG, row.id)
     session.delete(row)
+    version = coherence.bump(session, "search")
     session.commit()
+    coherence.written("search", version)
+    await run_in_threadpool(index_narrative_removed, log_id, row.requirement_id)
     return {"ok": True}
+def upload_size(uf: UploadFile) -> int:
+    if uf.size is not None:
+        return uf.size
+    pos = uf.file.tell()
+    uf.file.seek(0, os.SEEK_END)
+    size = uf.file.tell() - pos
+    uf.file.seek(pos)
+    return size
+
 @app.post("/controls/{requirement_id}/evidence")
-async def upload_evidence(requirement_id: str, files: List[UploadFile]=File(...), session: Session = Depends(get_session)):
+async def upload_evidence(requirement_id: str, request: Request, files: List[UploadFile]=File(...), session: Session = Depends(get_session)):
     saved = []
-    target = os.path.join(UPLOAD_DIR, requirement_id)
-    os.makedirs(target, exist_ok=True)
+    try:
+        usage.check(session, requirement_id, sum(upload_size(uf) for uf in files))
+    except usage.QuotaExceeded as e:
+        raise HTTPException(413, str(e))
     for uf in files:
         ts = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-        safe_name = f"{ts}__{uf.filename}"
-        dest = os.path.join(target, safe_name)
-        with open(dest, "wb") as out:
-            shutil.copyfileobj(uf.file, out)
-        meta = Evidence(requirement_id=requirement_id, filename=uf.filename, size=os.path.getsize(dest), path=dest)
+        key, n = make_key(requirement_id, uf.filename, ts), 1
+        while storage.exists(key):
+            key, n = make_key(requirement_id, f"{n}__{storage_name(uf.filename)}", ts), n + 1
+        size, sha256 = await run_in_threadpool(storage.save, key, uf.file)
+        meta = Evidence(requirement_id=requirement_id, filename=uf.filename, size=size, path=key, sha256=sha256)
         session.add(meta)
+        usage.apply(session, requirement_id, size, 1)
+        try:
+            usage.verify(session, requirement_id)
+        except usage.QuotaExceeded as e:
+            session.rollback()
+            storage.delete(key)
+            raise HTTPException(413, str(e))
+        metrics.record_upload(meta.size)
         session.commit()
         session.refresh(meta)
         saved.append(meta)
+    audit.note(request, requirement_id, files=[{"id": m.id, "filename": m.filename, "size": m.size} for m in saved])
+    evidence_indexer.schedule([(m.id, m.requirement_id, m.filename, m.path) for m in saved])
     return saved
 
 @app.get("/controls/{requirement_id}/evidence")
@@ -1955,16 +2369,184 @@ async def list_evidence(requirement_id: str, session: Session = Depends(get_sess
     rows.sort(key=lambda x: x.ts)
     return rows
 
+@app.get("/evidence/search")
+async def search_evidence(q: str, requirement_id: Optional[str] = None, limit: int = Query(50, ge=1, le=500), session: Session = Depends(get_session)):
+    if not evidence_indexer.enabled:
+        raise HTTPException(501, "Evidence search requires SQLite FTS5")
+    return evidence_indexer.search(session, q, limit=limit, requirement_id=requirement_id)
+
+@app.get("/evidence/usage")
+async def evidence_usage(requirement_id: Optional[str] = None, domain: Optional[str] = None, limit: int = Query(100, ge=1, le=10000), session: Session = Depends(get_session)):
+    """Bytes and file counts per domain and per control (largest first), from the maintained counters."""
+    return usage.report(session, requirement_id=requirement_id, domain=domain, limit=limit)
+
+@app.post("/evidence/reindex")
+async def reindex_evidence(session: Session = Depends(get_session)):
+    if not evidence_indexer.enabled:
+        raise HTTPException(501, "Evidence search requires SQLite FTS5")
+    stale = await run_in_threadpool(evidence_indexer.stale, session, Evidence)
+    return {"queued": evidence_indexer.schedule(stale)}
+
+@app.post("/evidence/ingest")
+async def ingest_evidence(request: Request, file: Optional[UploadFile] = File(None), directory: Optional[str] = Form(None), session: Session = Depends(get_session)):
+    """Bulk-attach evidence from a ZIP upload or a directory under INGEST_ROOT, mapped to controls by path."""
+    if (file is None) == (directory is None):
+        raise HTTPException(400, "Provide either a ZIP file or a directory")
+    try:
+        if file is not None:
+            if not zipfile.is_zipfile(file.file):
+                raise HTTPException(400, "Upload is not a ZIP archive")
+            with zipfile.ZipFile(file.file) as zf:
+                report = await run_in_threadpool(bulk.ingest, session, bulk.zip_entries(zf), storage, Evidence, Control)
+        else:
+            report = await run_in_threadpool(bulk.ingest, session, bulk.directory_entries(directory), storage, Evidence, Control)
+    except bulk.IngestError as e:
+        raise HTTPException(400, str(e))
+    rows = report.pop("rows")
+    for row in rows:
+        metrics.record_upload(row[4])
+    evidence_indexer.schedule([row[:4] for row in rows])
+    audit.note(request, None, source=file.filename if file is not None else directory,
+               ingested=report["ingested"], bytes=report["bytes"], duplicates=report["duplicates"])
+    return report
+
+@app.get("/evidence/archive")
+async def evidence_archive(domain: Optional[str] = None, requirement_id: Optional[str] = None, session: Session = Depends(get_session)):
+    q = select(Evidence)
+    if requirement_id:
+        q = q.where(Evidence.requirement_id == requirement_id)
+    if domain:
+        rids = select(Control.requirement_id).where(func.lower(Control.domain) == domain.lower())
+        q = q.where(or_(Evidence.requirement_id.in_(rids), Evidence.requirement_id.like(f"{domain.upper()}.%")))
+    rows = session.exec(q.order_by(Evidence.requirement_id, Evidence.id)).all()
+    label = requirement_id or (domain.split("(")[-1].strip(" )") if domain else "all")
+    label = re.sub(r"[^A-Za-z0-9._-]+", "_", label)
+    stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    return StreamingResponse(stream_zip(rows, storage.open), media_type="application/zip", headers={
+        "Content-Disposition": f'attachment; filename="evidence-{label}-{stamp}.zip"',
+    })
+
+@app.get("/evidence/{evidence_id}/download")
+async def download_evidence(evidence_id: int, session: Session = Depends(get_session)):
+    row = session.get(Evidence, evidence_id)
+    if not row:
+        raise HTTPException(404, "Evidence not found")
+    if storage.presigns:
+        # hand the transfer to the object store instead of proxying it through the API
+        return RedirectResponse(storage.download_url(row.path, row.filename), status_code=307)
+    path = storage.local_path(row.path)
+    if not os.path.exists(path):
+        raise HTTPException(410, "Evidence file is missing")
+    return FileResponse(path, filename=row.filename)
+
+@app.get("/evidence/{evidence_id}/preview")
+async def evidence_preview(evidence_id: int, v: Optional[str] = None, session: Session = Depends(get_session)):
+    """JPEG thumbnail. Ids are reused after a delete, so only a URL naming the file's hash (``?v=<sha256>``) is immutable."""
+    row = session.get(Evidence, evidence_id)
+    if not row:
+        raise HTTPException(404, "Evidence not found")
+    if not preview_cache.supported(row.filename):
+        raise HTTPException(415, "No preview for this file type")
+    try:
+        path = await preview_cache.get(row)
+    except Unsupported as e:
+        raise HTTPException(415, str(e))
+    except Exception as e:
+        log.warning("preview failed for evidence %s: %s", evidence_id, e)
+        raise HTTPException(422, "Could not render preview")
+    pinned = v is not None and row.sha256 is not None and v == row.sha256
+    cache_control = "public, max-age=31536000, immutable" if pinned else "no-cache"
+    return FileResponse(path, media_type="image/jpeg", headers={"Cache-Control": cache_control})
+
 @app.delete("/evidence/{evidence_id}")
-async def delete_evidence(evidence_id: int, session: Session = Depends(get_session)):
+async def delete_evidence(evidence_id: int, request: Request, session: Session = Depends(get_session)):
     row = session.get(Evidence, evidence_id)
     if not row:
         raise HTTPException(404, "Evidence not found")
+    audit.note(request, row.requirement_id, evidence_id=row.id, filename=row.filename, size=row.size)
     try:
-        if os.path.exists(row.path):
-            os.remove(row.path)
-    except Exception:
-        pass
-    session.delete(row)
+        storage.delete(row.path)
+    except (OSError, StorageError) as e:
+        # the row goes anyway; /evidence/reconcile reports and removes the leftover file
+        log.warning("could not remove evidence file %s: %s", row.path, e)
+        audit.note(request, file_error=str(e))
+    forget_evidence(session, row)
     session.commit()
     return {"ok": True}
+
+def forget_evidence(session: Session, row: Evidence):
+    """Delete an Evidence row with its search text, integrity record and cached preview."""
+    evidence_indexer.remove(session, row.id)
+    reconcile.discard(session, row.id)
+    usage.apply(session, row.requirement_id, -row.size, -1)
+    preview_cache.discard(row)
+    objectives.unlink(session, objectives.EVIDENCE, row.id)
+    session.delete(row)
+
+class ObjectiveLinksIn(BaseModel):
+    letters: List[str]
+
+@app.get("/controls/{requirement_id}/objectives")
+async def list_objectives(requirement_id: str, session: Session = Depends(get_session)):
+    return objectives.for_control(session, requirement_id)
+
+def link_objectives(session: Session, request: Request, kind: str, row, letters: List[str]):
+    try:
+        kept = objectives.set_links(session, kind, row.id, row.requirement_id, letters)
+    except objectives.UnknownObjective as e:
+        raise HTTPException(400, str(e))
+    audit.note(request, row.requirement_id, **{f"{kind}_id": row.id, "objectives": kept})
+    session.commit()
+    return {"id": row.id, "requirement_id": row.requirement_id, "objectives": kept}
+
+@app.put("/evidence/{evidence_id}/objectives")
+async def link_evidence_objectives(evidence_id: int, payload: ObjectiveLinksIn, request: Request, session: Session = Depends(get_session)):
+    row = session.get(Evidence, evidence_id)
+    if not row:
+        raise HTTPException(404, "Evidence not found")
+    return link_objectives(session, request, objectives.EVIDENCE, row, payload.letters)
+
+@app.put("/textlog/{log_id}/objectives")
+async def link_textlog_objectives(log_id: int, payload: ObjectiveLinksIn, request: Request, session: Session = Depends(get_session)):
+    row = session.get(TextLog, log_id)
+    if not row:
+        raise HTTPException(404, "Log not found")
+    return link_objectives(session, request, objectives.TEXTLOG, row, payload.letters)
+
+@app.get("/objectives/gaps")
+async def objective_gaps(
+    kind: str = Query(objectives.EVIDENCE, pattern="^(evidence|textlog|any)$"),
+    requirement_id: Optional[str] = None,
+    domain: Optional[str] = None,
+    session: Session = Depends(get_session),
+):
+    return objectives.gaps(session, None if kind == "any" else kind, requirement_id, domain)
+
+@app.post("/evidence/reconcile")
+async def reconcile_evidence(request: Request, repair: bool = False, session: Session = Depends(get_session)):
+    """Report evidence rows without files, files without rows, and files whose hash changed; optionally repair."""
+    report = await run_in_threadpool(reconcile.reconcile, session, storage, Evidence, repair, forget_evidence)
+    if repair:
+        audit.note(request, None, **report["repaired"], missing=report["missing_count"], orphans=report["orphan_count"])
+    return report
+
+@app.get("/audit")
+async def list_audit(
+    requirement_id: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    limit: int = Query(200, ge=1, le=1000),
+    session: Session = Depends(get_session),
+):
+    q = select(AuditEntry)
+    if requirement_id:
+        q = q.where(AuditEntry.requirement_id == requirement_id)
+    if since:
+        q = q.where(AuditEntry.ts >= since)
+    if until:
+        q = q.where(AuditEntry.ts < until)
+    return session.exec(q.order_by(AuditEntry.ts.desc(), AuditEntry.id.desc()).limit(limit)).all()
+
+@app.get("/audit/verify")
+async def verify_audit(session: Session = Depends(get_session)):
+    return audit.verify(session)
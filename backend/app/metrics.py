@@ -0,0 +1,234 @@
+"""Prometheus text-format metrics collected in-process.
+
+``MetricsMiddleware`` is a plain ASGI middleware (no per-request Request
+objects) that times every request by route template. SQLAlchemy cursor
+events attribute query counts and time to the request that issued them.
+"""
+import os
+import time
+import bisect
+import threading
+import contextvars
+from collections import defaultdict, deque
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250)
+UPLOAD_RATE_WINDOW = 60.0
+DISK_USAGE_TTL = float(os.getenv("METRICS_DISK_TTL", "30"))
+
+_lock = threading.Lock()
+_request_db = contextvars.ContextVar("request_db", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels: tuple, value: float):
+        with _lock:
+            s = self.series.get(labels)
+            if s is None:
+                s = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][bisect.bisect_left(self.buckets, value)] += 1
+            s[1] += value
+            s[2] += 1
+
+
+requests_total = defaultdict(int)
+request_latency = Histogram(LATENCY_BUCKETS)
+request_db_queries = Histogram(QUERY_COUNT_BUCKETS)
+request_db_seconds = Histogram(LATENCY_BUCKETS)
+db_queries_total = [0, 0.0]
+upload_bytes_total = [0]
+_upload_window = deque()
+cache_requests = defaultdict(int)
+audit_queue_full_total = [0]
+_disk_usage = {"at": 0.0, "bytes": 0, "files": 0, "refreshing": False}
+
+
+def cache_hit(name: str):
+    with _lock:
+        cache_requests[(name, "hit")] += 1
+
+
+def cache_miss(name: str):
+    with _lock:
+        cache_requests[(name, "miss")] += 1
+
+
+def record_upload(nbytes: int):
+    now = time.monotonic()
+    with _lock:
+        upload_bytes_total[0] += nbytes
+        _upload_window.append((now, nbytes))
+
+
+def record_audit_queue_full():
+    with _lock:
+        audit_queue_full_total[0] += 1
+
+
+def _upload_rate() -> float:
+    cutoff = time.monotonic() - UPLOAD_RATE_WINDOW
+    with _lock:
+        while _upload_window and _upload_window[0][0] < cutoff:
+            _upload_window.popleft()
+        return sum(n for _, n in _upload_window) / UPLOAD_RATE_WINDOW
+
+
+def install_db_hooks(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        db_queries_total[0] += 1
+        db_queries_total[1] += elapsed
+        stats = _request_db.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        stats = [0, 0.0]
+        token = _request_db.set(stats)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_db.reset(token)
+            route = scope.get("route")
+            labels = (scope["method"], route.path if route is not None else "unmatched")
+            requests_total[labels + (str(status[0]),)] += 1
+            request_latency.observe(labels, elapsed)
+            request_db_queries.observe(labels, stats[0])
+            request_db_seconds.observe(labels, stats[1])
+
+
+def _dir_usage(path: str):
+    total = files = 0
+    stack = [path]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+                        files += 1
+                except OSError:
+                    pass
+    return total, files
+
+
+def _refresh_disk_usage(path: str):
+    try:
+        total, files = _dir_usage(path)
+        with _lock:
+            _disk_usage["bytes"], _disk_usage["files"] = total, files
+    finally:
+        _disk_usage["refreshing"] = False
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names, values) -> str:
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}" if pairs else ""
+
+
+def _histogram_lines(name: str, help_text: str, hist: Histogram, label_names) -> list:
+    out = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    with _lock:
+        series = {k: (list(v[0]), v[1], v[2]) for k, v in hist.series.items()}
+    for labels, (counts, total, n) in sorted(series.items()):
+        cumulative = 0
+        for bound, c in zip(list(hist.buckets) + ["+Inf"], counts):
+            cumulative += c
+            out.append(f"{name}_bucket{_label_str(label_names + ('le',), labels + (bound,))} {cumulative}")
+        out.append(f"{name}_sum{_label_str(label_names, labels)} {total}")
+        out.append(f"{name}_count{_label_str(label_names, labels)} {n}")
+    return out
+
+
+def render(db_path: str, upload_dir: str) -> str:
+    lines = ["# HELP http_requests_total Requests handled, by route template and status.",
+             "# TYPE http_requests_total counter"]
+    for (method, route, code), n in sorted(requests_total.items()):
+        lines.append(f"http_requests_total{_label_str(('method', 'route', 'status'), (method, route, code))} {n}")
+    lines += _histogram_lines("http_request_duration_seconds", "Request latency.", request_latency, ("method", "route"))
+    lines += _histogram_lines("http_request_db_queries", "SQL statements executed per request.", request_db_queries, ("method", "route"))
+    lines += _histogram_lines("http_request_db_seconds", "Time spent in SQL per request.", request_db_seconds, ("method", "route"))
+    lines += [
+        "# HELP db_queries_total SQL statements executed.", "# TYPE db_queries_total counter",
+        f"db_queries_total {db_queries_total[0]}",
+        "# HELP db_query_seconds_total Time spent executing SQL.", "# TYPE db_query_seconds_total counter",
+        f"db_query_seconds_total {db_queries_total[1]}",
+        "# HELP evidence_upload_bytes_total Evidence bytes written.", "# TYPE evidence_upload_bytes_total counter",
+        f"evidence_upload_bytes_total {upload_bytes_total[0]}",
+        f"# HELP evidence_upload_bytes_per_second Upload throughput over the last {int(UPLOAD_RATE_WINDOW)}s.",
+        "# TYPE evidence_upload_bytes_per_second gauge",
+        f"evidence_upload_bytes_per_second {_upload_rate()}",
+        "# HELP audit_queue_full_total Audit entries that found the queue full and waited for the writer.",
+        "# TYPE audit_queue_full_total counter",
+        f"audit_queue_full_total {audit_queue_full_total[0]}",
+    ]
+    lines += ["# HELP cache_requests_total Cache lookups by result.", "# TYPE cache_requests_total counter"]
+    with _lock:
+        cache_counts = dict(cache_requests)
+    caches = sorted({name for name, _ in cache_counts})
+    for name in caches:
+        for result in ("hit", "miss"):
+            lines.append(f"cache_requests_total{_label_str(('cache', 'result'), (name, result))} {cache_counts.get((name, result), 0)}")
+    lines += ["# HELP cache_hit_ratio Fraction of cache lookups that hit.", "# TYPE cache_hit_ratio gauge"]
+    for name in caches:
+        hits, misses = cache_counts.get((name, "hit"), 0), cache_counts.get((name, "miss"), 0)
+        lines.append(f"cache_hit_ratio{_label_str(('cache',), (name,))} {hits / (hits + misses) if hits + misses else 0}")
+
+    # walking a large evidence store takes a while: refresh in a thread and report the last result
+    now = time.monotonic()
+    with _lock:
+        due = now - _disk_usage["at"] > DISK_USAGE_TTL and not _disk_usage["refreshing"]
+        if due:
+            _disk_usage["at"], _disk_usage["refreshing"] = now, True
+    if due:
+        threading.Thread(target=_refresh_disk_usage, args=(upload_dir,), name="metrics-disk-usage", daemon=True).start()
+    try:
+        db_bytes = os.path.getsize(db_path) if db_path else 0
+    except OSError:
+        db_bytes = 0
+    lines += [
+        "# HELP sqlite_file_bytes Size of the SQLite database file.", "# TYPE sqlite_file_bytes gauge",
+        f"sqlite_file_bytes {db_bytes}",
+        "# HELP upload_dir_bytes Bytes stored under UPLOAD_DIR.", "# TYPE upload_dir_bytes gauge",
+        f"upload_dir_bytes {_disk_usage['bytes']}",
+        "# HELP upload_dir_files Files stored under UPLOAD_DIR.", "# TYPE upload_dir_files gauge",
+        f"upload_dir_files {_disk_usage['files']}",
+    ]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,135 @@
+"""Assessment objectives as rows, and which evidence or narrative covers them.
+
+``Control.assessment_objectives`` is free text such as
+``"[a] Authorized users identified;\\n[b] Processes identified."``.
+``sync_objectives`` splits it into one ``Objective`` per bracketed letter, in
+bulk, whenever controls are seeded or imported. Evidence files and TextLog
+entries are linked to objectives through ``ObjectiveLink``; ``gaps`` lists
+every objective nothing is linked to with a single anti-join.
+"""
+import re
+from typing import Optional
+from sqlalchemy import Index, UniqueConstraint, and_, delete
+from sqlmodel import SQLModel, Field, Session, select, func
+
+EVIDENCE, TEXTLOG = "evidence", "textlog"
+
+_ITEM = re.compile(r"\[([a-z]{1,2})\]\s*(.*?)(?=\[[a-z]{1,2}\]|\Z)", re.S)
+
+
+class UnknownObjective(Exception):
+    pass
+
+
+class Objective(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("requirement_id", "letter", name="uq_objective_requirement_letter"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    requirement_id: str = Field(index=True)
+    letter: str
+    text: str
+
+
+class ObjectiveLink(SQLModel, table=True):
+    __table_args__ = (Index("ix_objectivelink_target", "kind", "target_id"),)
+    objective_id: int = Field(primary_key=True)
+    kind: str = Field(primary_key=True)
+    target_id: int = Field(primary_key=True)
+
+
+def parse(text: Optional[str]) -> list:
+    """``[(letter, text)]`` in the order they appear; text without bracketed letters yields nothing."""
+    out = []
+    for letter, body in _ITEM.findall(text or ""):
+        body = " ".join(body.split()).rstrip(";.").strip()
+        if body:
+            out.append((letter, body))
+    return out
+
+
+def sync_objectives(session: Session, rows):
+    """Bring objectives in line with ``(requirement_id, assessment_objectives)`` rows; the caller commits.
+
+    Unchanged objectives keep their id, and with it their links; objectives
+    that disappeared from the text are removed together with their links.
+    """
+    wanted = {rid: dict(parse(text)) for rid, text in rows}
+    if not wanted:
+        return
+    existing = {}
+    for o in session.exec(select(Objective).where(Objective.requirement_id.in_(wanted))):
+        existing[(o.requirement_id, o.letter)] = o
+    stale = []
+    for o in existing.values():
+        text = wanted[o.requirement_id].get(o.letter)
+        if text is None:
+            stale.append(o.id)
+        elif text != o.text:
+            o.text = text
+            session.add(o)
+    if stale:
+        session.exec(delete(ObjectiveLink).where(ObjectiveLink.objective_id.in_(stale)))
+        session.exec(delete(Objective).where(Objective.id.in_(stale)))
+    session.add_all(
+        Objective(requirement_id=rid, letter=letter, text=text)
+        for rid, items in wanted.items() for letter, text in items.items()
+        if (rid, letter) not in existing
+    )
+
+
+def ensure_objectives(session: Session, control_model):
+    """Parse every control once for databases that predate the Objective table."""
+    if session.exec(select(Objective.id).limit(1)).first() is None:
+        sync_objectives(session, session.exec(select(control_model.requirement_id, control_model.assessment_objectives)).all())
+        session.commit()
+
+
+def set_links(session: Session, kind: str, target_id: int, requirement_id: str, letters) -> list:
+    """Replace what ``target_id`` covers with ``letters`` of its control's objectives; returns the letters kept."""
+    letters = sorted(set(letters))
+    found = {o.letter: o.id for o in session.exec(
+        select(Objective).where(Objective.requirement_id == requirement_id, Objective.letter.in_(letters))
+    )}
+    unknown = [l for l in letters if l not in found]
+    if unknown:
+        raise UnknownObjective(f"{requirement_id} has no objective {', '.join(f'[{l}]' for l in unknown)}")
+    unlink(session, kind, target_id)
+    session.add_all(ObjectiveLink(objective_id=found[l], kind=kind, target_id=target_id) for l in letters)
+    return letters
+
+
+def unlink(session: Session, kind: str, target_id: int):
+    session.exec(delete(ObjectiveLink).where(ObjectiveLink.kind == kind, ObjectiveLink.target_id == target_id))
+
+
+def for_control(session: Session, requirement_id: str) -> list:
+    links = {}
+    q = (select(ObjectiveLink).join(Objective, Objective.id == ObjectiveLink.objective_id)
+         .where(Objective.requirement_id == requirement_id))
+    for link in session.exec(q):
+        links.setdefault(link.objective_id, {EVIDENCE: [], TEXTLOG: []})[link.kind].append(link.target_id)
+    objectives = session.exec(select(Objective).where(Objective.requirement_id == requirement_id).order_by(Objective.letter))
+    return [{"id": o.id, "letter": o.letter, "text": o.text, **links.get(o.id, {EVIDENCE: [], TEXTLOG: []})}
+            for o in objectives]
+
+
+def gaps(session: Session, kind: Optional[str] = EVIDENCE, requirement_id: str = None, domain: str = None) -> dict:
+    """Objectives with no link of ``kind`` (or of any kind when None), as one anti-join."""
+    on = ObjectiveLink.objective_id == Objective.id
+    if kind is not None:
+        on = and_(on, ObjectiveLink.kind == kind)
+    scope = []
+    if requirement_id:
+        scope.append(Objective.requirement_id == requirement_id)
+    if domain:
+        code = domain.split("(")[-1].strip(" )").upper()
+        scope.append(Objective.requirement_id.like(f"{code}.%"))
+    q = (select(Objective).outerjoin(ObjectiveLink, on).where(ObjectiveLink.objective_id.is_(None), *scope)
+         .order_by(Objective.requirement_id, Objective.letter))
+    missing = session.exec(q).all()
+    total = session.exec(select(func.count()).select_from(Objective).where(*scope)).one()
+    return {
+        "kind": kind or "any",
+        "objectives": total,
+        "gap_count": len(missing),
+        "gaps": [{"requirement_id": o.requirement_id, "letter": o.letter, "text": o.text} for o in missing],
+    }
@@ -0,0 +1,147 @@
+"""Evidence thumbnails, rendered on first request and cached on disk.
+
+Images are downscaled with Pillow; PDFs get a first-page render from
+``pdftoppm`` (poppler-utils). Previews are JPEGs in a ``.previews`` folder
+under ``UPLOAD_DIR/<requirement_id>`` (beside the evidence with local
+storage; a per-replica cache with S3). Rendering happens in a small thread pool; each hit
+refreshes the preview's mtime and the least recently used previews are
+removed once the cache grows past ``PREVIEW_CACHE_BYTES``.
+"""
+import os
+import shutil
+import asyncio
+import logging
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from . import metrics
+
+PREVIEW_SIZE = int(os.getenv("PREVIEW_SIZE", "320"))
+PREVIEW_CACHE_BYTES = int(os.getenv("PREVIEW_CACHE_BYTES", str(512 * 1024 * 1024)))
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", "2"))
+PREVIEW_DIRNAME = ".previews"
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tif", ".tiff", ".webp"}
+
+log = logging.getLogger(__name__)
+
+
+class Unsupported(Exception):
+    pass
+
+
+def _render_image(src: str, dest: str):
+    try:
+        from PIL import Image
+    except ImportError:
+        raise Unsupported("Pillow is not installed")
+    with Image.open(src) as im:
+        im.draft("RGB", (PREVIEW_SIZE, PREVIEW_SIZE))
+        im.thumbnail((PREVIEW_SIZE, PREVIEW_SIZE))
+        im.convert("RGB").save(dest, "JPEG", quality=80, optimize=True)
+
+
+def _render_pdf(src: str, dest: str):
+    if not shutil.which("pdftoppm"):
+        raise Unsupported("pdftoppm is not installed")
+    out_base = dest[:-len(".jpg")]
+    subprocess.run(
+        ["pdftoppm", "-jpeg", "-f", "1", "-l", "1", "-singlefile", "-scale-to", str(PREVIEW_SIZE), src, out_base],
+        check=True, capture_output=True, timeout=60,
+    )
+
+
+class PreviewCache:
+    def __init__(self, upload_dir: str, storage):
+        self.upload_dir = upload_dir
+        self.storage = storage
+        self._pool = ThreadPoolExecutor(PREVIEW_WORKERS, thread_name_prefix="preview")
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._bytes = None
+
+    def path_for(self, evidence) -> str:
+        tag = (evidence.sha256 or "")[:12] or str(evidence.size)
+        return os.path.join(self.upload_dir, evidence.requirement_id, PREVIEW_DIRNAME, f"{evidence.id}-{tag}.jpg")
+
+    def supported(self, filename: str) -> bool:
+        ext = os.path.splitext(filename.lower())[1]
+        return ext in IMAGE_EXTENSIONS or ext == ".pdf"
+
+    async def get(self, evidence) -> str:
+        """Path of the preview JPEG, rendering it first if needed."""
+        dest = self.path_for(evidence)
+        try:
+            os.utime(dest)
+            metrics.cache_hit("evidence_preview")
+            return dest
+        except FileNotFoundError:
+            pass
+        metrics.cache_miss("evidence_preview")
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            fut = self._inflight.get(dest)
+            if fut is None:
+                fut = self._inflight[dest] = loop.run_in_executor(self._pool, self._render, evidence.path, evidence.filename, dest)
+                fut.add_done_callback(lambda _: self._inflight.pop(dest, None))
+        await asyncio.shield(fut)
+        return dest
+
+    def _render(self, key: str, filename: str, dest: str):
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = dest + ".tmp.jpg"
+        with self.storage.materialize(key) as src:
+            if os.path.splitext(filename.lower())[1] == ".pdf":
+                _render_pdf(src, tmp)
+            else:
+                _render_image(src, tmp)
+        os.replace(tmp, dest)
+        self._account(os.path.getsize(dest))
+
+    def _previews(self):
+        for entry in os.scandir(self.upload_dir):
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            pdir = os.path.join(entry.path, PREVIEW_DIRNAME)
+            try:
+                for p in os.scandir(pdir):
+                    if p.is_file(follow_symlinks=False):
+                        yield p
+            except OSError:
+                continue
+
+    def _account(self, added: int):
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(p.stat().st_size for p in self._previews())
+            else:
+                self._bytes += added
+            over = self._bytes > PREVIEW_CACHE_BYTES
+        if over:
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used previews until the cache is at 90% of its budget."""
+        files = sorted(((p.stat().st_mtime, p.stat().st_size, p.path) for p in self._previews()))
+        total = sum(size for _, size, _ in files)
+        target = PREVIEW_CACHE_BYTES * 0.9
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._bytes = total
+
+    def discard(self, evidence):
+        try:
+            os.remove(self.path_for(evidence))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning("could not remove preview for evidence %s: %s", evidence.id, e)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,152 @@
+"""Opt-in request profiling.
+
+When ``PROFILE_ENABLED=1`` a request is profiled if it carries an
+``X-Profile: 1`` header or falls within ``PROFILE_SAMPLE_RATE``. A sampler
+thread records the event loop thread's stack every ``PROFILE_INTERVAL_MS``
+while the handler runs (other requests interleaved on the loop show up too),
+and every SQL statement issued by the request is timed. Results land in
+``PROFILE_DIR`` as a collapsed-stack file (flamegraph.pl / speedscope) or
+speedscope JSON, plus ``<id>.sql.json`` with the statements slowest first.
+"""
+import os
+import sys
+import json
+import time
+import random
+import datetime
+import threading
+import contextvars
+from collections import Counter
+from sqlalchemy import event
+
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "2"))
+PROFILE_FORMAT = os.getenv("PROFILE_FORMAT", "collapsed")
+PROFILE_HEADER = b"x-profile"
+
+_query_log = contextvars.ContextVar("query_log", default=None)
+
+
+def install_db_hooks(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _query_log.get() is not None:
+            conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        queries = _query_log.get()
+        if queries is not None and conn.info.get("profile_start"):
+            elapsed = time.perf_counter() - conn.info["profile_start"].pop()
+            queries.append({"ms": round(elapsed * 1000, 3), "statement": statement, "parameters": repr(parameters)[:500]})
+
+
+class StackSampler(threading.Thread):
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def _frame_name(frame) -> str:
+    name, filename, line = frame
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def collapsed(samples: Counter) -> str:
+    return "".join(f"{';'.join(_frame_name(f) for f in stack)} {n}\n" for stack, n in samples.most_common())
+
+
+def speedscope(samples: Counter, name: str, interval_ms: float) -> dict:
+    frames, index, out_samples, weights = [], {}, [], []
+    for stack, n in samples.most_common():
+        ids = []
+        for f in stack:
+            if f not in index:
+                index[f] = len(frames)
+                frames.append({"name": f[0], "file": f[1], "line": f[2]})
+            ids.append(index[f])
+        out_samples.append(ids)
+        weights.append(n * interval_ms)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled", "name": name, "unit": "milliseconds",
+            "startValue": 0, "endValue": sum(weights), "samples": out_samples, "weights": weights,
+        }],
+    }
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+
+    def _wanted(self, scope) -> bool:
+        for key, value in scope.get("headers", ()):
+            if key == PROFILE_HEADER:
+                return value in (b"1", b"true")
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            return await self.app(scope, receive, send)
+        stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S%fZ")
+        profile_id = f"{stamp}-{scope['method']}-{scope['path'].strip('/').replace('/', '_') or 'root'}"
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append((b"x-profile-id", profile_id.encode()))
+            await send(message)
+
+        queries = []
+        token = _query_log.set(queries)
+        sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            _query_log.reset(token)
+            self._write(profile_id, scope, sampler.samples, queries, elapsed_ms)
+
+    def _write(self, profile_id, scope, samples, queries, elapsed_ms):
+        base = os.path.join(PROFILE_DIR, profile_id)
+        if PROFILE_FORMAT == "speedscope":
+            with open(base + ".speedscope.json", "w") as f:
+                json.dump(speedscope(samples, f"{scope['method']} {scope['path']}", PROFILE_INTERVAL_MS), f)
+        else:
+            with open(base + ".collapsed", "w") as f:
+                f.write(collapsed(samples))
+        with open(base + ".sql.json", "w") as f:
+            json.dump({
+                "method": scope["method"],
+                "path": scope["path"],
+                "query_string": scope.get("query_string", b"").decode("latin-1"),
+                "elapsed_ms": round(elapsed_ms, 3),
+                "query_count": len(queries),
+                "query_ms": round(sum(q["ms"] for q in queries), 3),
+                "queries": sorted(queries, key=lambda q: q["ms"], reverse=True),
+            }, f, indent=2)
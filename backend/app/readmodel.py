@@ -0,0 +1,208 @@
+"""Read path for the control list, control detail and dashboard.
+
+``READ_MODE`` picks where those reads are answered from:
+
+- ``primary`` (default): the main engine, as before;
+- ``replica``: a separate read-only pool, ``READ_DATABASE_URL`` or, for
+  SQLite, the same file opened ``mode=ro`` with WAL journaling so readers
+  never wait on upload/import writers;
+- ``snapshot``: an in-memory copy of the controls table and its status
+  counts, per worker process, never older than ``READ_MAX_STALENESS``
+  seconds. It is refreshed in the background once half that age, and
+  synchronously after a write in the same process.
+
+Writes always go to the primary engine.
+"""
+import os
+import json
+import time
+import bisect
+import sqlite3
+import logging
+import threading
+from collections import Counter
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from sqlmodel import Session, create_engine, select, func, or_
+from fastapi.encoders import jsonable_encoder
+from . import metrics
+
+READ_MODE = os.getenv("READ_MODE", "primary")
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL") or None
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "10"))
+READ_MAX_STALENESS = float(os.getenv("READ_MAX_STALENESS", "2"))
+
+log = logging.getLogger(__name__)
+
+
+def enable_wal(engine):
+    """Let SQLite readers proceed while a writer holds the database."""
+    @event.listens_for(engine, "connect")
+    def _wal(dbapi_conn, record):
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.close()
+
+
+def read_engine(primary):
+    """Engine for read-only traffic; the primary itself unless READ_MODE=replica."""
+    if READ_MODE != "replica":
+        return primary
+    if READ_DATABASE_URL:
+        return create_engine(READ_DATABASE_URL, pool_size=READ_POOL_SIZE, pool_pre_ping=True)
+    if primary.url.get_backend_name() != "sqlite" or not primary.url.database:
+        raise ValueError("READ_MODE=replica needs READ_DATABASE_URL for non-SQLite databases")
+    uri = f"file:{os.path.abspath(primary.url.database)}?mode=ro"
+    return create_engine(
+        "sqlite://",
+        creator=lambda: sqlite3.connect(uri, uri=True, check_same_thread=False),
+        poolclass=QueuePool, pool_size=READ_POOL_SIZE, max_overflow=READ_POOL_SIZE,
+    )
+
+
+def _status_counts(rows):
+    return (
+        len(rows),
+        Counter((r.c3pao_finding or "UNASSIGNED") for r in rows),
+        Counter((r.self_impl_status or "UNASSIGNED") for r in rows),
+    )
+
+
+def _matches(r, needle, domain) -> bool:
+    if domain and r.domain.lower() != domain:
+        return False
+    return not needle or any(needle in (v or "").lower() for v in (r.title, r.statement, r.requirement_id, r.domain))
+
+
+class _Snapshot:
+    __slots__ = ("rows", "keys", "by_id", "counts", "taken_at", "_body")
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.keys = [r.sort_key or "" for r in rows]
+        self.by_id = {r.id: r for r in rows}
+        self.counts = _status_counts(rows)
+        self.taken_at = time.monotonic()
+        self._body = None
+
+    def body(self) -> bytes:
+        """The unfiltered control list, encoded once per snapshot the way FastAPI's JSONResponse would."""
+        if self._body is None:
+            self._body = json.dumps(jsonable_encoder(self.rows), ensure_ascii=False, allow_nan=False,
+                                    separators=(",", ":")).encode("utf-8")
+        return self._body
+
+
+class ReadModel:
+    def __init__(self, engine, control_model, mode: str = READ_MODE, max_staleness: float = READ_MAX_STALENESS):
+        self.engine = engine
+        self.control_model = control_model
+        self.mode = mode
+        self.max_staleness = max_staleness
+        self._snap = None
+        self._dirty = True
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    # -- snapshot maintenance -------------------------------------------------
+
+    def invalidate(self):
+        """A write in this process changed controls; the next read reloads."""
+        self._dirty = True
+
+    def _load(self) -> _Snapshot:
+        with Session(self.engine) as s:
+            cm = self.control_model
+            rows = s.exec(select(cm).order_by(cm.sort_key, cm.id)).all()
+            s.expunge_all()
+        return _Snapshot(rows)
+
+    def _refresh_async(self):
+        def run():
+            try:
+                dirty_before = self._dirty
+                snap = self._load()
+                with self._lock:
+                    self._snap = snap
+                    # a write that landed during the load still forces the next reader to reload
+                    self._dirty = self._dirty and not dirty_before
+            except Exception as e:
+                log.warning("read snapshot refresh failed: %s", e)
+            finally:
+                self._refreshing = False
+
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=run, name="read-snapshot", daemon=True).start()
+
+    def snapshot(self) -> _Snapshot:
+        snap = self._snap
+        age = time.monotonic() - snap.taken_at if snap else None
+        if snap is not None and not self._dirty and age <= self.max_staleness:
+            metrics.cache_hit("read_snapshot")
+            if age > self.max_staleness / 2:
+                self._refresh_async()
+            return snap
+        metrics.cache_miss("read_snapshot")
+        with self._lock:
+            snap = self._snap
+            if snap is None or self._dirty or time.monotonic() - snap.taken_at > self.max_staleness:
+                self._dirty = False
+                snap = self._snap = self._load()
+            return snap
+
+    # -- queries --------------------------------------------------------------
+
+    def controls(self, session: Session, q: str = None, domain: str = None, after: str = None, limit: int = None) -> list:
+        """Controls in ``sort_key`` order, optionally filtered, starting after the ``after`` sort key."""
+        needle = (q or "").strip().lower()
+        domain = (domain or "").lower()
+        if self.mode == "snapshot":
+            snap = self.snapshot()
+            start = bisect.bisect_right(snap.keys, after) if after is not None else 0
+            out = []
+            for r in snap.rows[start:]:
+                if _matches(r, needle, domain):
+                    out.append(r)
+                    if limit is not None and len(out) == limit:
+                        break
+            return out
+        cm = self.control_model
+        stmt = select(cm).order_by(cm.sort_key, cm.id)
+        if domain:
+            stmt = stmt.where(func.lower(cm.domain) == domain)
+        if needle:
+            stmt = stmt.where(or_(*(func.lower(col).contains(needle, autoescape=True)
+                                    for col in (cm.title, cm.statement, cm.requirement_id, cm.domain))))
+        if after is not None:
+            stmt = stmt.where(cm.sort_key > after)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return session.exec(stmt).all()
+
+    def controls_json(self):
+        """Pre-encoded JSON of every control in snapshot mode, else None."""
+        if self.mode == "snapshot":
+            return self.snapshot().body()
+        return None
+
+    def control(self, session: Session, control_id: int):
+        if self.mode == "snapshot":
+            return self.snapshot().by_id.get(control_id)
+        return session.get(self.control_model, control_id)
+
+    def status_counts(self, session: Session):
+        """``(total, c3pao Counter, self-impl Counter)``; the Counters are copies the caller may fill in."""
+        if self.mode == "snapshot":
+            total, c3pao, impl = self.snapshot().counts
+            return total, Counter(c3pao), Counter(impl)
+        counts = []
+        for column in (self.control_model.c3pao_finding, self.control_model.self_impl_status):
+            c = Counter()
+            for status, n in session.exec(select(column, func.count()).group_by(column)):
+                c[status or "UNASSIGNED"] += n
+            counts.append(c)
+        return sum(counts[0].values()), counts[0], counts[1]
@@ -0,0 +1,161 @@
+"""Reconcile evidence storage against the Evidence table.
+
+One pass lists every stored object (top-level folders scanned in parallel),
+joins that set with the Evidence rows by storage key, and reports:
+
+- ``missing``: rows whose file is gone;
+- ``orphans``: stored evidence files no row refers to (older than
+  ``RECONCILE_GRACE_SECONDS``, so uploads still in flight are left alone);
+- ``unknown``: other files, outside the ``<requirement_id>/<stamp>__<name>``
+  layout uploads use (e.g. the ``Evidence.txt`` placeholder), which are
+  only reported;
+- ``corrupt``: files whose size or SHA-256 no longer match the row.
+
+Hashes are verified incrementally: ``EvidenceCheck`` remembers the size and
+mtime each file had when it was last hashed, and only files that changed
+since are read again. With ``repair`` orphans are deleted, rows of missing
+files are removed, and rows recorded without a hash are backfilled.
+
+CLI, from ``backend/``::
+
+    python -m app.reconcile [--repair]
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from sqlmodel import SQLModel, Field, Session, select
+from .previews import PREVIEW_DIRNAME
+from .storage import StorageError, is_evidence_key
+
+RECONCILE_WORKERS = int(os.getenv("RECONCILE_WORKERS", "8"))
+RECONCILE_GRACE_SECONDS = int(os.getenv("RECONCILE_GRACE_SECONDS", "3600"))
+REPORT_LIMIT = 500
+
+log = logging.getLogger(__name__)
+
+
+class EvidenceCheck(SQLModel, table=True):
+    evidence_id: int = Field(primary_key=True)
+    size: int = 0
+    mtime_ns: int = 0
+    sha256: str = ""
+    checked_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+
+
+def _hash(storage, key: str):
+    digest = hashlib.sha256()
+    try:
+        with storage.open(key) as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    except OSError:
+        return None  # removed since the scan; the next run reports it as missing
+    return digest.hexdigest()
+
+
+def discard(session: Session, evidence_id: int):
+    row = session.get(EvidenceCheck, evidence_id)
+    if row:
+        session.delete(row)
+
+
+def reconcile(session: Session, storage, evidence_model, repair: bool = False, forget=None) -> dict:
+    """Compare storage with ``evidence_model`` rows; ``forget(session, row)`` removes a row and its derived data."""
+    started = time.perf_counter()
+    stored = {key: (size, mtime_ns) for key, size, mtime_ns in storage.scan(RECONCILE_WORKERS, skip_dirs={PREVIEW_DIRNAME})}
+    rows = {storage.key_for(e.path): e for e in session.exec(select(evidence_model))}
+    checks = {c.evidence_id: c for c in session.exec(select(EvidenceCheck))}
+
+    missing = [rows[k] for k in rows.keys() - stored.keys()]
+    cutoff = (time.time() - RECONCILE_GRACE_SECONDS) * 1e9
+    unreferenced = stored.keys() - rows.keys()
+    unknown = sorted(k for k in unreferenced if not is_evidence_key(k))
+    orphans = [k for k in unreferenced if is_evidence_key(k) and stored[k][1] < cutoff]
+
+    to_hash, unchanged = [], 0
+    for key in rows.keys() & stored.keys():
+        e, (size, mtime_ns) = rows[key], stored[key]
+        c = checks.get(e.id)
+        if c is not None and (c.size, c.mtime_ns) == (size, mtime_ns) and e.sha256 is not None and c.sha256 == e.sha256:
+            unchanged += 1
+            continue
+        to_hash.append((key, e, size, mtime_ns))
+
+    corrupt, backfilled = [], 0
+    with ThreadPoolExecutor(RECONCILE_WORKERS, thread_name_prefix="reconcile") as pool:
+        hashes = pool.map(lambda item: _hash(storage, item[0]), to_hash)
+        for (key, e, size, mtime_ns), sha in zip(to_hash, hashes):
+            if sha is None:
+                continue
+            if e.sha256 is None:
+                if repair:
+                    e.sha256 = sha
+                    session.add(e)
+                    backfilled += 1
+            elif sha != e.sha256 or size != e.size:
+                corrupt.append({"evidence_id": e.id, "path": key, "size": size, "expected_size": e.size,
+                                "sha256": sha, "expected_sha256": e.sha256})
+                continue
+            session.merge(EvidenceCheck(evidence_id=e.id, size=size, mtime_ns=mtime_ns, sha256=sha,
+                                        checked_at=datetime.datetime.utcnow()))
+
+    report = {
+        "stored_files": len(stored),
+        "evidence_rows": len(rows),
+        "verified": len(to_hash),
+        "unchanged": unchanged,
+        "missing_count": len(missing),
+        "missing": [{"evidence_id": e.id, "requirement_id": e.requirement_id, "filename": e.filename, "path": e.path}
+                    for e in missing[:REPORT_LIMIT]],
+        "orphan_count": len(orphans),
+        "orphans": [{"path": k, "size": stored[k][0]} for k in sorted(orphans)[:REPORT_LIMIT]],
+        "unknown_count": len(unknown),
+        "unknown": [{"path": k, "size": stored[k][0]} for k in unknown[:REPORT_LIMIT]],
+        "corrupt_count": len(corrupt),
+        "corrupt": corrupt[:REPORT_LIMIT],
+        "repaired": None,
+    }
+    removed_rows = removed_files = 0
+    if repair:
+        for e in missing:
+            discard(session, e.id)
+            if forget is not None:
+                forget(session, e)
+            else:
+                session.delete(e)
+            removed_rows += 1
+        for key in orphans:
+            try:
+                storage.delete(key)
+            except (OSError, StorageError) as e:
+                log.warning("could not remove orphaned evidence file %s: %s", key, e)
+                continue
+            removed_files += 1
+        report["repaired"] = {"rows_removed": removed_rows, "files_removed": removed_files, "hashes_backfilled": backfilled}
+    session.commit()
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def main(argv=None):
+    from .main import engine, Evidence, storage, forget_evidence
+
+    args = argv if argv is not None else sys.argv[1:]
+    if args not in ([], ["--repair"]):
+        raise SystemExit("usage: python -m app.reconcile [--repair]")
+    with Session(engine) as s:
+        report = reconcile(s, storage, Evidence, repair=bool(args), forget=forget_evidence)
+    print(json.dumps(report, indent=2))
+    if report["corrupt_count"] or (not args and (report["missing_count"] or report["orphan_count"])):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # app.main imports this module; reuse the running copy so EvidenceCheck is not declared twice
+    sys.modules.setdefault("app.reconcile", sys.modules[__name__])
+    main()
@@ -0,0 +1,121 @@
+"""SPRS scoring for CMMC Level 2 / NIST SP 800-171.
+
+The score is 110 minus the DoD Assessment Methodology weight of every
+unmet requirement. Deductions are held in memory and adjusted by delta
+whenever a status changes, so reading the score never scans the table.
+"""
+import re
+import datetime
+from typing import Optional
+from sqlmodel import SQLModel, Field
+
+MAX_SCORE = 110
+
+# DoD NIST SP 800-171 Assessment Methodology v1.2.1, keyed by NIST number.
+# 3.12.4 (SSP) carries no weight: without an SSP there is no assessment.
+WEIGHTS = {
+    "3.1.1": 5, "3.1.2": 5, "3.1.3": 1, "3.1.4": 1, "3.1.5": 3, "3.1.6": 1,
+    "3.1.7": 1, "3.1.8": 1, "3.1.9": 1, "3.1.10": 1, "3.1.11": 1, "3.1.12": 5,
+    "3.1.13": 5, "3.1.14": 1, "3.1.15": 1, "3.1.16": 5, "3.1.17": 5, "3.1.18": 5,
+    "3.1.19": 3, "3.1.20": 1, "3.1.21": 1, "3.1.22": 1,
+    "3.2.1": 5, "3.2.2": 5, "3.2.3": 1,
+    "3.3.1": 5, "3.3.2": 3, "3.3.3": 1, "3.3.4": 1, "3.3.5": 5, "3.3.6": 1,
+    "3.3.7": 1, "3.3.8": 1, "3.3.9": 1,
+    "3.4.1": 5, "3.4.2": 5, "3.4.3": 1, "3.4.4": 1, "3.4.5": 5, "3.4.6": 5,
+    "3.4.7": 5, "3.4.8": 5, "3.4.9": 1,
+    "3.5.1": 5, "3.5.2": 5, "3.5.3": 5, "3.5.4": 1, "3.5.5": 1, "3.5.6": 1,
+    "3.5.7": 1, "3.5.8": 1, "3.5.9": 1, "3.5.10": 5, "3.5.11": 1,
+    "3.6.1": 5, "3.6.2": 5, "3.6.3": 1,
+    "3.7.1": 3, "3.7.2": 5, "3.7.3": 1, "3.7.4": 3, "3.7.5": 5, "3.7.6": 1,
+    "3.8.1": 3, "3.8.2": 3, "3.8.3": 5, "3.8.4": 1, "3.8.5": 1, "3.8.6": 1,
+    "3.8.7": 5, "3.8.8": 3, "3.8.9": 1,
+    "3.9.1": 3, "3.9.2": 5,
+    "3.10.1": 5, "3.10.2": 5, "3.10.3": 1, "3.10.4": 1, "3.10.5": 1, "3.10.6": 1,
+    "3.11.1": 3, "3.11.2": 5, "3.11.3": 1,
+    "3.12.1": 5, "3.12.2": 3, "3.12.3": 5, "3.12.4": 0,
+    "3.13.1": 5, "3.13.2": 5, "3.13.3": 1, "3.13.4": 1, "3.13.5": 5, "3.13.6": 5,
+    "3.13.7": 1, "3.13.8": 3, "3.13.9": 1, "3.13.10": 1, "3.13.11": 5, "3.13.12": 1,
+    "3.13.13": 1, "3.13.14": 1, "3.13.15": 5, "3.13.16": 1,
+    "3.14.1": 5, "3.14.2": 5, "3.14.3": 5, "3.14.4": 5, "3.14.5": 3, "3.14.6": 5,
+    "3.14.7": 3,
+}
+MIN_SCORE = MAX_SCORE - sum(WEIGHTS.values())
+
+# Statuses that count as satisfied for each basis; anything else, including
+# an unassigned status, is deducted.
+MET_STATUSES = {
+    "c3pao": {"MET", "NA"},
+    "self": {"Implemented", "Alternative Implementation", "N/A"},
+}
+STATUS_FIELDS = {"c3pao": "c3pao_finding", "self": "self_impl_status"}
+
+_NIST_RE = re.compile(r"3\.\d+\.\d+")
+_weight_cache = {}
+
+
+def weight_for(requirement_id: str) -> int:
+    """Weight of a requirement such as ``AC.L2-3.1.1``; 0 if not in 800-171."""
+    w = _weight_cache.get(requirement_id)
+    if w is None:
+        m = _NIST_RE.search(requirement_id or "")
+        w = WEIGHTS.get(m.group(0), 0) if m else 0
+        _weight_cache[requirement_id] = w
+    return w
+
+
+def deduction(requirement_id: str, basis: str, status: Optional[str]) -> int:
+    return 0 if status in MET_STATUSES[basis] else weight_for(requirement_id)
+
+
+class ScoreHistory(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    ts: datetime.datetime = Field(default_factory=datetime.datetime.utcnow, index=True)
+    requirement_id: str
+    self_score: int
+    c3pao_score: int
+
+
+class ScoreBoard:
+    """Running SPRS deductions for both the self-assessed and C3PAO basis."""
+
+    def __init__(self):
+        self.deductions = {basis: 0 for basis in STATUS_FIELDS}
+        self._loader = None
+        self._stale = False
+
+    def bind(self, loader):
+        """``loader()`` returns the rows for :meth:`load`; used to reload lazily after :meth:`invalidate`."""
+        self._loader = loader
+
+    def invalidate(self):
+        """Another process changed statuses; reload before the next score is read."""
+        self._stale = True
+
+    def load(self, rows):
+        """Full recompute from ``(requirement_id, c3pao_finding, self_impl_status)`` rows."""
+        totals = {basis: 0 for basis in STATUS_FIELDS}
+        for rid, c3pao, impl in rows:
+            totals["c3pao"] += deduction(rid, "c3pao", c3pao)
+            totals["self"] += deduction(rid, "self", impl)
+        self.deductions = totals
+
+    def delta(self, requirement_id: str, old: dict, new: dict) -> dict:
+        """Deduction change for one control going from ``old`` to ``new`` statuses."""
+        return {
+            basis: deduction(requirement_id, basis, new.get(field)) - deduction(requirement_id, basis, old.get(field))
+            for basis, field in STATUS_FIELDS.items()
+        }
+
+    def scores(self, delta: Optional[dict] = None) -> dict:
+        if self._stale and self._loader is not None:
+            self._stale = False
+            self.load(self._loader())
+        delta = delta or {}
+        return {basis: MAX_SCORE - d - delta.get(basis, 0) for basis, d in self.deductions.items()}
+
+    def apply(self, delta: dict):
+        for basis, d in delta.items():
+            self.deductions[basis] += d
+
+
+scoreboard = ScoreBoard()
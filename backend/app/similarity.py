@@ -0,0 +1,270 @@
+"""Similar controls and narrative reuse suggestions by TF-IDF cosine similarity.
+
+Documents are control statements, provider/solution TextLog entries and the
+solution texts shipped with the seed catalogue. Identical texts of the same
+kind are one document that remembers every control using it, so the matrix
+grows with the distinct text. Terms are words and word pairs with sublinear
+term frequency.
+
+Most documents live in a row-normalised sparse matrix, kept transposed
+(term-major) so a query only touches the postings of its own terms; top-k
+comes from ``argpartition``. Narratives added since the matrix was last
+built are scored from a small pending list and folded in, with fresh IDF
+weights, every ``MERGE_EVERY`` additions. Changes made by other processes
+trigger a rebuild in the background (see ``derived``).
+"""
+import re
+import math
+from collections import Counter
+import numpy as np
+from scipy import sparse
+from sqlmodel import Session, select
+from .derived import DerivedIndex
+
+STATEMENT, PROVIDER, SOLUTION = "statement", "provider", "solution"
+NARRATIVE_KINDS = (PROVIDER, SOLUTION)
+_KIND_CODES = {STATEMENT: 0, PROVIDER: 1, SOLUTION: 2}
+MERGE_EVERY = 256
+SNIPPET_CHARS = 300
+BORROW_CONTROLS = 20
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("a an and are as at be by for from has have in is it its of on or that the this to was with".split())
+
+
+def terms(text: str) -> list:
+    words = [w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class _Corpus:
+    def __init__(self):
+        self.keys = {}      # (kind, normalised text) -> doc id
+        self.kind = []
+        self.text = []
+        self.refs = []      # doc id -> Counter of (requirement_id, TextLog id or None)
+        self.tf = []        # doc id -> {column: sublinear tf}
+        self.vocab = {}
+        self.df = []
+        self.by_control = {}  # requirement_id -> set of doc ids
+        self.by_log = {}      # TextLog id -> doc id
+        self.base = 0         # docs [0, base) are in the matrix
+        self.tf_matrix = None  # doc-major raw TF of the base docs
+        self.xt = None        # term-major, row-normalised TF-IDF of the base docs
+        self.idf = np.zeros(0)
+        self.idf_unseen = 1.0
+        self.kinds = np.zeros(0, dtype=np.int8)
+        self.pending = {}     # doc id -> normalised {column: weight} for docs past ``base``
+
+    def add(self, kind: str, requirement_id: str, log_id, text: str):
+        text = (text or "").strip()
+        if not text:
+            return None
+        key = (kind, " ".join(text.lower().split()))
+        doc = self.keys.get(key)
+        if doc is None:
+            doc = self.keys[key] = len(self.text)
+            self.kind.append(kind)
+            self.text.append(text)
+            self.refs.append(Counter())
+            counts = Counter()
+            for t in terms(text):
+                col = self.vocab.get(t)
+                if col is None:
+                    col = self.vocab[t] = len(self.df)
+                    self.df.append(0)
+                counts[col] += 1
+            for col in counts:
+                self.df[col] += 1
+            self.tf.append({col: 1 + math.log(n) for col, n in counts.items()})
+            if self.xt is not None:
+                self.pending[doc] = self.vector(self.tf[doc])
+        self.refs[doc][(requirement_id, log_id)] += 1
+        self.by_control.setdefault(requirement_id, set()).add(doc)
+        if log_id is not None:
+            self.by_log[log_id] = doc
+        return doc
+
+    def remove_log(self, log_id: int, requirement_id: str):
+        doc = self.by_log.pop(log_id, None)
+        if doc is None:
+            return
+        refs = self.refs[doc]
+        refs[(requirement_id, log_id)] -= 1
+        if refs[(requirement_id, log_id)] <= 0:
+            del refs[(requirement_id, log_id)]
+        if not any(rid == requirement_id for rid, _ in refs):
+            self.by_control.get(requirement_id, set()).discard(doc)
+
+    def _idf(self, col: int) -> float:
+        return self.idf[col] if col < len(self.idf) else self.idf_unseen
+
+    def vector(self, tf: dict) -> dict:
+        weighted = {col: w * self._idf(col) for col, w in tf.items()}
+        norm = math.sqrt(sum(v * v for v in weighted.values())) or 1.0
+        return {col: v / norm for col, v in weighted.items()}
+
+    def build(self):
+        """Fold new documents into the matrix and re-weight every row with IDF from the current counts."""
+        n, width = len(self.text), len(self.df)
+        indptr, cols, vals = [0], [], []
+        for tf in self.tf[self.base:]:
+            cols.extend(tf)
+            vals.extend(tf.values())
+            indptr.append(len(cols))
+        added = sparse.csr_matrix((vals, cols, indptr), shape=(n - self.base, width), dtype=np.float32)
+        if self.tf_matrix is None:
+            self.tf_matrix = added
+        else:
+            self.tf_matrix.resize((self.base, width))
+            self.tf_matrix = sparse.vstack([self.tf_matrix, added], format="csr")
+        self.idf = np.log((1 + n) / (1 + np.asarray(self.df, dtype=np.float64))) + 1
+        self.idf_unseen = math.log(1 + n) + 1
+        weighted = self.tf_matrix @ sparse.diags(self.idf.astype(np.float32))
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        self.xt = (sparse.diags((1 / norms).astype(np.float32)) @ weighted).T.tocsr()
+        self.kinds = np.asarray([_KIND_CODES[k] for k in self.kind], dtype=np.int8)
+        self.base = n
+        self.pending = {}
+
+    def scores(self, query: dict) -> np.ndarray:
+        """Cosine similarity of every document to the normalised ``query`` vector."""
+        out = np.zeros(len(self.text), dtype=np.float32)
+        cols = [c for c in query if c < self.xt.shape[0]]
+        if cols:
+            weights = np.asarray([query[c] for c in cols], dtype=np.float32)
+            out[:self.base] = self.xt[cols].T @ weights
+        for doc, vec in self.pending.items():
+            out[doc] = sum(w * vec.get(c, 0.0) for c, w in query.items())
+        return out
+
+
+class SimilarityIndex(DerivedIndex):
+    name = "similarity_index"
+
+    def __init__(self, engine, control_model, textlog_model, seed_narratives=()):
+        """``seed_narratives`` are ``(requirement_id, solution text)`` pairs offered alongside saved narratives."""
+        super().__init__()
+        self.engine = engine
+        self.control_model = control_model
+        self.textlog_model = textlog_model
+        self.seed_narratives = list(seed_narratives)
+
+    def _build(self) -> _Corpus:
+        corpus = _Corpus()
+        with Session(self.engine) as s:
+            cm, tl = self.control_model, self.textlog_model
+            for rid, statement in s.exec(select(cm.requirement_id, cm.statement)):
+                corpus.add(STATEMENT, rid, None, statement)
+            for rid, text in self.seed_narratives:
+                corpus.add(SOLUTION, rid, None, text)
+            q = select(tl.id, tl.requirement_id, tl.kind, tl.text).where(tl.kind.in_(NARRATIVE_KINDS))
+            for log_id, rid, kind, text in s.exec(q):
+                corpus.add(kind, rid, log_id, text)
+        corpus.build()
+        return corpus
+
+    def _changed(self, corpus):
+        if len(corpus.pending) >= MERGE_EVERY:
+            corpus.build()
+
+    def narrative_added(self, log_id: int, requirement_id: str, kind: str, text: str):
+        if kind in NARRATIVE_KINDS:
+            self._change(lambda corpus: corpus.add(kind, requirement_id, log_id, text))
+
+    def narrative_removed(self, log_id: int, requirement_id: str):
+        self._change(lambda corpus: corpus.remove_log(log_id, requirement_id))
+
+    # -- queries --------------------------------------------------------------
+
+    @staticmethod
+    def _top(corpus, scores: np.ndarray, k: int):
+        k = min(k, int(np.count_nonzero(scores > 0)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        return sorted(top.tolist(), key=lambda d: -scores[d])
+
+    def similar_controls(self, requirement_id: str, k: int = 10):
+        """Controls whose statement or narratives resemble this control's; None if the control is unknown."""
+        corpus = self._current()
+        with self._lock:
+            docs = corpus.by_control.get(requirement_id)
+            if not docs:
+                return None
+            tf = Counter()
+            for doc in docs:
+                tf.update(corpus.tf[doc])
+            scores = corpus.scores(corpus.vector(tf))
+            out, seen = [], {requirement_id}
+            # documents are shared between controls; look a little deeper than k to fill k controls
+            for doc in self._top(corpus, scores, k * 4):
+                for rid, _ in corpus.refs[doc]:
+                    if rid in seen:
+                        continue
+                    seen.add(rid)
+                    out.append({"requirement_id": rid, "score": round(float(scores[doc]), 4),
+                                "via": corpus.kind[doc], "text": corpus.text[doc][:SNIPPET_CHARS]})
+                    if len(out) == k:
+                        return out
+            return out
+
+    def _narrative_scores(self, corpus, text: str, kind: str):
+        counts = Counter(terms(text))
+        tf = {corpus.vocab[t]: 1 + math.log(n) for t, n in counts.items() if t in corpus.vocab}
+        if not tf:
+            return np.zeros(len(corpus.text), dtype=np.float32)
+        scores = corpus.scores(corpus.vector(tf))
+        wanted = (kind,) if kind else NARRATIVE_KINDS
+        mask = np.isin(corpus.kinds, [_KIND_CODES[w] for w in wanted])
+        pending = [corpus.kind[d] in wanted for d in range(corpus.base, len(corpus.kind))]
+        return np.where(np.concatenate([mask, np.asarray(pending, dtype=bool)]), scores, 0)
+
+    def _borrowed_scores(self, corpus, requirement_id: str, kind: str):
+        """Narratives of the controls whose statements are closest to this one's, scored by that closeness."""
+        docs = [d for d in corpus.by_control.get(requirement_id, ()) if corpus.kind[d] == STATEMENT]
+        scores = np.zeros(len(corpus.text), dtype=np.float32)
+        if not docs:
+            return scores
+        statements = corpus.scores(corpus.vector(corpus.tf[docs[0]]))
+        statements = np.where(np.concatenate([corpus.kinds == _KIND_CODES[STATEMENT],
+                                              np.zeros(len(corpus.text) - corpus.base, dtype=bool)]), statements, 0)
+        wanted = (kind,) if kind else NARRATIVE_KINDS
+        for doc in self._top(corpus, statements, 50):
+            # copies of a statement across tenants carry the same narratives; a sample of them is enough
+            for rid, _ in list(corpus.refs[doc])[:BORROW_CONTROLS]:
+                for narrative in corpus.by_control.get(rid, ()):
+                    if corpus.kind[narrative] in wanted and scores[narrative] < statements[doc]:
+                        scores[narrative] = statements[doc]
+        return scores
+
+    def suggest(self, text: str = None, requirement_id: str = None, kind: str = None, k: int = 5):
+        """Existing narratives to reuse, each with how many controls already use it.
+
+        With ``text``, the narratives closest to that draft; without, the
+        narratives of controls whose statements resemble ``requirement_id``'s
+        (None if that control is unknown). Narratives ``requirement_id``
+        already has are left out.
+        """
+        corpus = self._current()
+        with self._lock:
+            if (text or "").strip():
+                scores = self._narrative_scores(corpus, text, kind)
+            elif requirement_id in corpus.by_control:
+                scores = self._borrowed_scores(corpus, requirement_id, kind)
+            else:
+                return None
+            for doc in corpus.by_control.get(requirement_id, ()):
+                scores[doc] = 0
+            out = []
+            # over-fetch: narratives since deleted everywhere still hold a row until the next rebuild
+            for doc in self._top(corpus, scores, k * 2):
+                controls = sorted({rid for rid, _ in corpus.refs[doc]})
+                if not controls:
+                    continue
+                if len(out) == k:
+                    break
+                out.append({"text": corpus.text[doc], "kind": corpus.kind[doc], "score": round(float(scores[doc]), 4),
+                            "uses": len(controls), "requirement_ids": controls[:5]})
+            return out
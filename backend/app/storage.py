@@ -0,0 +1,298 @@
+"""Where evidence bytes live.
+
+``Evidence.path`` holds a storage key such as ``AC.L2-3.1.1/20240101T000000Z__gpo.png``.
+``LocalStorage`` maps keys under ``UPLOAD_DIR`` (absolute paths written by
+older versions are still honoured); ``S3Storage`` keeps them in an
+S3-compatible bucket (AWS, MinIO) so API replicas need no shared volume.
+Pick the backend with ``STORAGE_BACKEND=local|s3``.
+
+S3 uploads are split into parts uploaded in parallel once they pass
+``S3_MULTIPART_THRESHOLD``; downloads are handed to the client as presigned
+URLs. One boto3 client, with a bounded connection pool, is shared by all
+threads.
+"""
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+import threading
+import contextlib
+from typing import Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+S3_BUCKET = os.getenv("S3_BUCKET", "evidence")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_PUBLIC_ENDPOINT_URL = os.getenv("S3_PUBLIC_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32"))
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", str(16 * 1024 * 1024)))
+S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNKSIZE", str(16 * 1024 * 1024)))
+S3_UPLOAD_CONCURRENCY = int(os.getenv("S3_UPLOAD_CONCURRENCY", "8"))
+S3_PRESIGN_SECONDS = int(os.getenv("S3_PRESIGN_SECONDS", "300"))
+CHUNK_SIZE = 1024 * 1024
+
+
+class StorageError(Exception):
+    pass
+
+
+class _HashingReader:
+    """Read-only wrapper that hashes and counts what passes through it."""
+
+    def __init__(self, src):
+        self._src = src
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def read(self, n=-1):
+        data = self._src.read(n)
+        self.digest.update(data)
+        self.size += len(data)
+        return data
+
+
+def _not_found(error) -> bool:
+    return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NoSuchBucket", "NotFound")
+
+
+def safe_name(filename: str) -> str:
+    return os.path.basename((filename or "").replace("\\", "/")) or "evidence"
+
+
+def make_key(requirement_id: str, filename: str, stamp: str) -> str:
+    """``<requirement_id>/<stamp>__<basename>``; directory parts of client-supplied names are dropped."""
+    return f"{requirement_id}/{stamp}__{safe_name(filename)}"
+
+
+_EVIDENCE_KEY = re.compile(r"[^/]+/[^/]+__[^/]+")
+
+
+def is_evidence_key(key: str) -> bool:
+    """Whether ``key`` has the layout ``make_key`` produces; anything else was not put there by an upload."""
+    return _EVIDENCE_KEY.fullmatch(key) is not None
+
+
+class LocalStorage:
+    presigns = False
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def local_path(self, key: str) -> str:
+        return key if os.path.isabs(key) else os.path.join(self.root, key)
+
+    def key_for(self, path: str) -> str:
+        """Normalise a stored path: absolute paths under ``root`` (older rows) become keys."""
+        if os.path.isabs(path):
+            rel = os.path.relpath(path, self.root)
+            if not rel.startswith(".." + os.sep):
+                return rel.replace(os.sep, "/")
+        return path
+
+    def _walk(self, top: str, skip_dirs) -> list:
+        out, stack = [], [top]
+        while stack:
+            try:
+                it = os.scandir(stack.pop())
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in skip_dirs:
+                                stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            out.append((os.path.relpath(entry.path, self.root).replace(os.sep, "/"), st.st_size, st.st_mtime_ns))
+                    except OSError:
+                        continue
+        return out
+
+    def scan(self, workers: int = 8, skip_dirs=()):
+        """Yield ``(key, size, mtime_ns)`` for every stored object, one top-level folder per worker."""
+        tops = []
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False) and entry.name not in skip_dirs:
+                    tops.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    yield entry.name, st.st_size, st.st_mtime_ns
+        with ThreadPoolExecutor(workers, thread_name_prefix="scan") as pool:
+            for batch in pool.map(lambda top: self._walk(top, skip_dirs), tops):
+                yield from batch
+
+    def save(self, key: str, src) -> Tuple[int, str]:
+        """Copy the binary stream ``src`` to ``key``; returns its size and SHA-256."""
+        dest = self.local_path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        reader = _HashingReader(src)
+        with open(dest, "wb") as out:
+            for chunk in iter(lambda: reader.read(CHUNK_SIZE), b""):
+                out.write(chunk)
+        return reader.size, reader.digest.hexdigest()
+
+    def open(self, key: str):
+        return open(self.local_path(key), "rb")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.local_path(key))
+
+    def stat(self, key: str) -> Optional[Tuple[int, int]]:
+        """``(size, mtime_ns)``, or None when the object is missing."""
+        try:
+            st = os.stat(self.local_path(key))
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    @contextlib.contextmanager
+    def materialize(self, key: str):
+        """A filesystem path holding the object's bytes for the duration of the block."""
+        yield self.local_path(key)
+
+    def download_url(self, key: str, filename: str) -> Optional[str]:
+        return None
+
+
+class S3Storage:
+    presigns = True
+
+    def __init__(self, bucket: str = S3_BUCKET, endpoint_url: Optional[str] = S3_ENDPOINT_URL, prefix: str = S3_PREFIX):
+        try:
+            import boto3
+            from botocore.config import Config
+            from boto3.s3.transfer import TransferConfig
+        except ImportError:
+            raise StorageError("STORAGE_BACKEND=s3 requires boto3")
+        config = Config(
+            region_name=S3_REGION,
+            max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+            retries={"max_attempts": 5, "mode": "standard"},
+            s3={"addressing_style": "path" if endpoint_url else "auto"},
+            signature_version="s3v4",
+        )
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, config=config)
+        # presigned URLs must name the host the browser can reach, which differs from the in-cluster endpoint for MinIO
+        self._signer = (boto3.client("s3", endpoint_url=S3_PUBLIC_ENDPOINT_URL, config=config)
+                        if S3_PUBLIC_ENDPOINT_URL else self.client)
+        self.transfer = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=S3_UPLOAD_CONCURRENCY,
+            use_threads=True,
+        )
+        self._client_error = self.client.exceptions.ClientError
+        try:
+            self.client.head_bucket(Bucket=bucket)
+        except self._client_error as e:
+            if not _not_found(e):
+                raise StorageError(f"S3 bucket {bucket!r} is not accessible: {e}") from e
+            self.client.create_bucket(Bucket=bucket)
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key.lstrip("/")
+
+    def key_for(self, path: str) -> str:
+        return path
+
+    def _list(self, prefix: str) -> list:
+        out = []
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", ()):
+                out.append((obj["Key"][len(self.prefix):], obj["Size"], int(obj["LastModified"].timestamp() * 1e9)))
+        return out
+
+    def scan(self, workers: int = 8, skip_dirs=()):
+        """Yield ``(key, size, mtime_ns)`` for every object; top-level prefixes are listed in parallel."""
+        tops = []
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self.prefix, Delimiter="/"):
+            tops += [p["Prefix"] for p in page.get("CommonPrefixes", ())
+                     if p["Prefix"][len(self.prefix):].rstrip("/") not in skip_dirs]
+            for obj in page.get("Contents", ()):
+                yield obj["Key"][len(self.prefix):], obj["Size"], int(obj["LastModified"].timestamp() * 1e9)
+        with ThreadPoolExecutor(workers, thread_name_prefix="scan") as pool:
+            for batch in pool.map(self._list, tops):
+                yield from batch
+
+    def save(self, key: str, src) -> Tuple[int, str]:
+        # the wrapper has no seek(), so s3transfer reads it sequentially and only the part uploads run in parallel
+        reader = _HashingReader(src)
+        self.client.upload_fileobj(reader, self.bucket, self._key(key), Config=self.transfer)
+        return reader.size, reader.digest.hexdigest()
+
+    def open(self, key: str):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+        except self._client_error as e:
+            if _not_found(e):
+                raise FileNotFoundError(key) from e
+            raise StorageError(str(e)) from e
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    def stat(self, key: str) -> Optional[Tuple[int, int]]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client_error as e:
+            if _not_found(e):
+                return None
+            raise StorageError(str(e)) from e
+        return head["ContentLength"], int(head["LastModified"].timestamp() * 1e9)
+
+    def delete(self, key: str):
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client_error as e:
+            raise StorageError(str(e)) from e
+
+    @contextlib.contextmanager
+    def materialize(self, key: str):
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+        try:
+            with os.fdopen(fd, "wb") as out, contextlib.closing(self.open(key)) as body:
+                shutil.copyfileobj(body, out, CHUNK_SIZE)
+            yield path
+        finally:
+            os.remove(path)
+
+    def download_url(self, key: str, filename: str) -> Optional[str]:
+        disposition = "attachment; filename*=UTF-8''" + quote(safe_name(filename), safe="")
+        return self._signer.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(key), "ResponseContentDisposition": disposition},
+            ExpiresIn=S3_PRESIGN_SECONDS,
+        )
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_storage(upload_dir: Optional[str] = None):
+    """The process-wide backend chosen by ``STORAGE_BACKEND``; also used inside worker processes."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            if STORAGE_BACKEND == "s3":
+                _default = S3Storage()
+            elif STORAGE_BACKEND == "local":
+                _default = LocalStorage(upload_dir or os.getenv("UPLOAD_DIR", "/data/uploads"))
+            else:
+                raise StorageError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}")
+        return _default
@@ -0,0 +1,155 @@
+"""Evidence disk usage counters and quotas.
+
+``EvidenceUsage`` keeps one row of (bytes, files) per control, per domain
+(the family prefix of the requirement_id, e.g. ``AC``) and one overall
+``total`` row. Counters are adjusted with an upsert inside the same
+transaction that inserts or deletes the Evidence row, so they cannot drift
+from the table on rollback, and ``/evidence/usage`` reads them directly.
+
+Quotas (0 = unlimited) are checked before any bytes are written, against
+the counters plus what the request itself brings, and checked again when
+the counters are bumped so concurrent uploads cannot both squeeze under.
+"""
+import os
+from collections import defaultdict
+from sqlalchemy import text as sql
+from sqlmodel import SQLModel, Field, Session, select, func
+
+QUOTA_CONTROL_BYTES = int(os.getenv("EVIDENCE_QUOTA_CONTROL_BYTES", "0"))
+QUOTA_DOMAIN_BYTES = int(os.getenv("EVIDENCE_QUOTA_DOMAIN_BYTES", "0"))
+QUOTA_TOTAL_BYTES = int(os.getenv("EVIDENCE_QUOTA_TOTAL_BYTES", "0"))
+
+CONTROL, DOMAIN, TOTAL = "control", "domain", "total"
+LIMITS = {CONTROL: QUOTA_CONTROL_BYTES, DOMAIN: QUOTA_DOMAIN_BYTES, TOTAL: QUOTA_TOTAL_BYTES}
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class EvidenceUsage(SQLModel, table=True):
+    scope: str = Field(primary_key=True)
+    key: str = Field(primary_key=True)
+    bytes: int = 0
+    files: int = 0
+
+
+def domain_of(requirement_id: str) -> str:
+    return requirement_id.split(".", 1)[0].upper()
+
+
+def _scopes(requirement_id: str):
+    return ((CONTROL, requirement_id), (DOMAIN, domain_of(requirement_id)), (TOTAL, ""))
+
+
+def apply(session: Session, requirement_id: str, nbytes: int, nfiles: int):
+    """Adjust the counters for one control; call within the transaction that changes Evidence."""
+    for scope, key in _scopes(requirement_id):
+        session.exec(sql(
+            "INSERT INTO evidenceusage (scope, key, bytes, files) VALUES (:s, :k, :b, :f) "
+            "ON CONFLICT (scope, key) DO UPDATE SET bytes = evidenceusage.bytes + :b, files = evidenceusage.files + :f"
+        ), params={"s": scope, "k": key, "b": nbytes, "f": nfiles})
+
+
+def _current(session: Session, requirement_id: str) -> dict:
+    # plain SQL rather than session.get: the identity map would not see apply()'s upserts
+    out = {CONTROL: 0, DOMAIN: 0, TOTAL: 0}
+    rows = session.exec(sql(
+        "SELECT scope, bytes FROM evidenceusage "
+        "WHERE (scope = :c AND key = :rid) OR (scope = :d AND key = :dom) OR (scope = :t AND key = '')"
+    ), params={"c": CONTROL, "rid": requirement_id, "d": DOMAIN, "dom": domain_of(requirement_id), "t": TOTAL})
+    for scope, nbytes in rows:
+        out[scope] = nbytes
+    return out
+
+
+def _over(requirement_id: str, used: dict, incoming: int):
+    for scope, key in _scopes(requirement_id):
+        limit = LIMITS[scope]
+        if limit and used[scope] + incoming > limit:
+            label = {CONTROL: f"control {key}", DOMAIN: f"domain {key}", TOTAL: "evidence storage"}[scope]
+            return f"Quota for {label} exceeded: {used[scope]} of {limit} bytes used, {incoming} more requested"
+    return None
+
+
+def check(session: Session, requirement_id: str, incoming: int):
+    """Raise QuotaExceeded if ``incoming`` more bytes would not fit."""
+    if not any(LIMITS.values()):
+        return
+    problem = _over(requirement_id, _current(session, requirement_id), incoming)
+    if problem:
+        raise QuotaExceeded(problem)
+
+
+def verify(session: Session, requirement_id: str):
+    """Re-check after ``apply`` in the same transaction; raises so the caller rolls back."""
+    if any(LIMITS.values()):
+        problem = _over(requirement_id, _current(session, requirement_id), 0)
+        if problem:
+            raise QuotaExceeded(problem)
+
+
+class Budget:
+    """Running quota check for a batch of files not yet recorded (bulk ingest)."""
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.pending = defaultdict(int)
+
+    def take(self, requirement_id: str, size: int):
+        if not any(LIMITS.values()):
+            return
+        used = _current(self.session, requirement_id)
+        for scope, key in _scopes(requirement_id):
+            used[scope] += self.pending[(scope, key)]
+        problem = _over(requirement_id, used, size)
+        if problem:
+            raise QuotaExceeded(problem)
+        for scope_key in _scopes(requirement_id):
+            self.pending[scope_key] += size
+
+    def release(self, requirement_id: str, size: int):
+        for scope_key in _scopes(requirement_id):
+            self.pending[scope_key] -= size
+
+
+def rebuild(session: Session, evidence_model):
+    """Recompute every counter from the Evidence table."""
+    session.exec(sql("DELETE FROM evidenceusage"))
+    totals = defaultdict(lambda: [0, 0])
+    q = select(evidence_model.requirement_id, func.coalesce(func.sum(evidence_model.size), 0), func.count())
+    for rid, nbytes, nfiles in session.exec(q.group_by(evidence_model.requirement_id)):
+        for scope_key in _scopes(rid):
+            totals[scope_key][0] += nbytes
+            totals[scope_key][1] += nfiles
+    totals.setdefault((TOTAL, ""), [0, 0])
+    session.add_all(EvidenceUsage(scope=s, key=k, bytes=b, files=f) for (s, k), (b, f) in totals.items())
+    session.commit()
+
+
+def ensure_counters(session: Session, evidence_model):
+    """Build the counters once for databases that predate them."""
+    if session.get(EvidenceUsage, (TOTAL, "")) is None:
+        rebuild(session, evidence_model)
+
+
+def report(session: Session, requirement_id: str = None, domain: str = None, limit: int = 100) -> dict:
+    def row(u):
+        return {"bytes": u.bytes, "files": u.files}
+
+    total = session.get(EvidenceUsage, (TOTAL, ""))
+    domains = session.exec(select(EvidenceUsage).where(EvidenceUsage.scope == DOMAIN).order_by(EvidenceUsage.bytes.desc())).all()
+    q = select(EvidenceUsage).where(EvidenceUsage.scope == CONTROL)
+    if requirement_id:
+        q = q.where(EvidenceUsage.key == requirement_id)
+    if domain:
+        # accept either the family code ("AC") or the full name ("Access Control (AC)")
+        code = domain.split("(")[-1].strip(" )").upper()
+        q = q.where(EvidenceUsage.key.like(f"{code}.%"))
+    controls = session.exec(q.order_by(EvidenceUsage.bytes.desc()).limit(limit)).all()
+    return {
+        "total": row(total) if total else {"bytes": 0, "files": 0},
+        "quotas": {"control_bytes": QUOTA_CONTROL_BYTES, "domain_bytes": QUOTA_DOMAIN_BYTES, "total_bytes": QUOTA_TOTAL_BYTES},
+        "domains": [{"domain": u.key, **row(u)} for u in domains],
+        "controls": [{"requirement_id": u.key, **row(u)} for u in controls],
+    }
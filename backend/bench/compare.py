@@ -0,0 +1,42 @@
+"""Compare two ``bench.run`` reports and flag regressions.
+
+    python -m bench.compare old.json new.json --threshold 0.15
+
+Exits non-zero when any route's p95 latency grew, or its throughput fell,
+by more than the threshold.
+"""
+import sys
+import json
+import argparse
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("old")
+    ap.add_argument("new")
+    ap.add_argument("--threshold", type=float, default=0.10)
+    args = ap.parse_args(argv)
+
+    with open(args.old) as f:
+        old = json.load(f)["results"]
+    with open(args.new) as f:
+        new = json.load(f)["results"]
+
+    regressions = 0
+    for scale in sorted(set(old) & set(new), key=int):
+        print(f"== {scale} controls")
+        for route in sorted(set(old[scale]["routes"]) & set(new[scale]["routes"])):
+            a, b = old[scale]["routes"][route], new[scale]["routes"][route]
+            p95 = (b["p95_ms"] - a["p95_ms"]) / a["p95_ms"] if a["p95_ms"] else 0.0
+            rps = (b["throughput_rps"] - a["throughput_rps"]) / a["throughput_rps"] if a["throughput_rps"] else 0.0
+            bad = p95 > args.threshold or rps < -args.threshold
+            regressions += bad
+            print(f"{'!!' if bad else '  '} {route:28s} p95 {a['p95_ms']:>10.2f} -> {b['p95_ms']:>10.2f} ms ({p95:+.0%})"
+                  f"   rps {a['throughput_rps']:>9.1f} -> {b['throughput_rps']:>9.1f} ({rps:+.0%})")
+    if regressions:
+        print(f"{regressions} regression(s) over {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
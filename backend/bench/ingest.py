@@ -0,0 +1,130 @@
+"""Bulk ingest benchmark: 10k small files as a directory tree and as a ZIP.
+
+Run from ``backend/``:
+
+    python -m bench.ingest --files 10000 --out ingest.json
+
+The tree mimics an auditor drop (``<requirement_id>/<subfolder>/<file>``).
+Each mode runs in a fresh subprocess with its own database and upload
+directory, and goes through ``POST /evidence/ingest`` in-process.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import zipfile
+import argparse
+import platform
+import datetime
+import tempfile
+import subprocess
+
+SUBFOLDERS = ("screenshots", "policies", "logs", "exports")
+
+
+def build_tree(root, n_files, seed):
+    from app.main import SEED
+
+    rng = random.Random(seed)
+    rids = [c["requirement_id"] for c in SEED]
+    total = 0
+    for i in range(n_files):
+        d = os.path.join(root, rng.choice(rids), rng.choice(SUBFOLDERS))
+        os.makedirs(d, exist_ok=True)
+        body = os.urandom(rng.randint(1024, 16 * 1024))
+        with open(os.path.join(d, f"evidence-{i}.bin"), "wb") as f:
+            f.write(body)
+        total += len(body)
+    return total
+
+
+def build_zip(root, path):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for dirpath, _, names in os.walk(root):
+            for name in names:
+                full = os.path.join(dirpath, name)
+                zf.write(full, os.path.relpath(full, root))
+
+
+async def run_mode(args):
+    import httpx
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        t0 = time.perf_counter()
+        if args.mode == "zip":
+            with open(args.source, "rb") as f:
+                r = await client.post("/evidence/ingest", files={"file": ("drop.zip", f, "application/zip")})
+        else:
+            r = await client.post("/evidence/ingest", data={"directory": args.source})
+        elapsed = time.perf_counter() - t0
+    r.raise_for_status()
+    report = r.json()
+    return {"mode": args.mode, "seconds": round(elapsed, 3), "ingested": report["ingested"],
+            "bytes": report["bytes"], "unmapped": len(report["unmapped"]),
+            "files_per_second": round(report["ingested"] / elapsed, 1) if elapsed else None,
+            "mb_per_second": round(report["bytes"] / elapsed / 1e6, 2) if elapsed else None}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--files", type=int, default=10000)
+    ap.add_argument("--workers", default="1,8", help="comma-separated INGEST_WORKERS values")
+    ap.add_argument("--seed", type=int, default=1234)
+    ap.add_argument("--out", help="write JSON results here (default: stdout)")
+    ap.add_argument("--mode", help=argparse.SUPPRESS)
+    ap.add_argument("--source", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.mode:
+        print(json.dumps(asyncio.run(run_mode(args))))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="certmanager-ingest-") as tmp:
+        drop = os.path.join(tmp, "ingest", "drop")
+        os.makedirs(drop)
+        # app.main creates its database on import; keep the parent's copy (used for SEED) in tmp too
+        os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'seed.db')}", UPLOAD_DIR=os.path.join(tmp, "seed-uploads"))
+        size = build_tree(drop, args.files, args.seed)
+        archive = os.path.join(tmp, "drop.zip")
+        build_zip(drop, archive)
+        print(f"{args.files} files, {size / 1e6:.1f} MB", file=sys.stderr)
+        for workers in args.workers.split(","):
+            for mode, source in (("directory", drop), ("zip", archive)):
+                run_dir = tempfile.mkdtemp(dir=tmp)
+                env = dict(os.environ,
+                           DATABASE_URL=f"sqlite:///{os.path.join(run_dir, 'bench.db')}",
+                           UPLOAD_DIR=os.path.join(run_dir, "uploads"),
+                           INGEST_ROOT=os.path.join(tmp, "ingest"),
+                           INGEST_WORKERS=workers,
+                           EVIDENCE_INDEX_WORKERS="1")
+                cmd = [sys.executable, "-m", "bench.ingest", "--mode", mode, "--source", source]
+                proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, check=True)
+                res = json.loads(proc.stdout.decode().strip().splitlines()[-1])
+                res["workers"] = int(workers)
+                print(f"  {res}", file=sys.stderr)
+                results.append(res)
+
+    text = json.dumps({
+        "meta": {
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "files": args.files,
+            "seed": args.seed,
+        },
+        "results": results,
+    }, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""API benchmark: scales the SEED catalogue and drives the ASGI app in-process.
+
+Run from ``backend/``:
+
+    python -m bench.run --controls 110,10000,100000 --out bench.json
+
+Each scale runs in a fresh subprocess with its own SQLite database and
+upload directory, because ``app.main`` binds its engine at import time.
+Synthetic tenants are copies of SEED with ``@tNNNNN`` appended to the
+requirement_id. Results are JSON keyed by scale and route; compare two runs
+with ``python -m bench.compare old.json new.json``.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import datetime
+import tempfile
+import subprocess
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def populate(n_controls, n_textlog, n_evidence, seed):
+    """Grow the freshly seeded database to the requested size with bulk inserts.
+
+    The inserts bypass the app's write paths, so afterwards the in-memory
+    score and the history baseline are rebuilt and the cache versions bumped,
+    as if another worker had written the rows.
+    """
+    from sqlalchemy import delete
+    from sqlmodel import Session, select
+    from app.main import (engine, Control, TextLog, Evidence, SEED, requirement_sort_key, storage, make_key,
+                          coherence, scoreboard, control_statuses)
+    from app import usage, history
+
+    rng = random.Random(seed)
+    fields = [c.name for c in Control.__table__.columns if c.name != "id"]
+    statuses = ["Implemented", "Partially Implemented", "Planned or Not Implemented", None]
+    findings = ["MET", "NOT_MET", "NA", None]
+    with Session(engine) as s:
+        have = len(s.exec(select(Control.id)).all())
+        rows, tenant = [], 1
+        while have + len(rows) < n_controls:
+            for base in SEED:
+                if have + len(rows) >= n_controls:
+                    break
+                row = {k: base.get(k) for k in fields}
+                row["requirement_id"] = f"{base['requirement_id']}@t{tenant:05d}"
+                row["sort_key"] = requirement_sort_key(row["requirement_id"])
+                row["self_impl_status"] = rng.choice(statuses)
+                row["c3pao_finding"] = rng.choice(findings)
+                row["version"], row["seq"] = 1, 0
+                rows.append(row)
+            tenant += 1
+        for i in range(0, len(rows), 5000):
+            s.execute(Control.__table__.insert(), rows[i:i + 5000])
+        rids = s.exec(select(Control.requirement_id)).all()
+
+        now = datetime.datetime.utcnow()
+        logs = [{
+            "requirement_id": rng.choice(rids),
+            "kind": rng.choice(("provider", "solution")),
+            "text": rng.choice(SEED)["What is the Solution?\nHow is it implemented?"] or "Configured By On-Site Technology",
+            "ts": now - datetime.timedelta(minutes=i),
+        } for i in range(n_textlog)]
+        for i in range(0, len(logs), 5000):
+            s.execute(TextLog.__table__.insert(), logs[i:i + 5000])
+
+        # stored and counted the way upload_evidence and ingest do it, so quotas,
+        # reconcile and archives see the same keys and usage totals as real uploads
+        evidence, per_control = [], {}
+        stamp = now.strftime("%Y%m%dT%H%M%SZ")
+        for i in range(n_evidence):
+            rid = rng.choice(rids)
+            name = f"bench-{i}.txt"
+            key = make_key(rid, name, stamp)
+            size, sha256 = storage.save(key, io.BytesIO(os.urandom(rng.randint(256, 4096))))
+            evidence.append({"requirement_id": rid, "filename": name, "size": size, "path": key, "sha256": sha256, "ts": now})
+            nbytes, nfiles = per_control.get(rid, (0, 0))
+            per_control[rid] = (nbytes + size, nfiles + 1)
+        for i in range(0, len(evidence), 5000):
+            s.execute(Evidence.__table__.insert(), evidence[i:i + 5000])
+        for rid, (nbytes, nfiles) in per_control.items():
+            usage.apply(s, rid, nbytes, nfiles)
+        # not passed to coherence.written, so this process's next check invalidates its own caches too
+        coherence.bump(s, "controls")
+        coherence.bump(s, "search")
+        s.commit()
+
+        s.exec(delete(history.DailySnapshot))
+        history.ensure_baseline(s, s.exec(select(Control.c3pao_finding, Control.self_impl_status)).all())
+        scoreboard.load(control_statuses())
+        ids = s.exec(select(Control.id)).all()
+    return ids, rids
+
+
+def routes(ids, rids, rng):
+    """(name, request factory) pairs; each factory returns httpx request kwargs."""
+    return [
+        ("list_controls", lambda: {"method": "GET", "url": "/controls"}),
+        ("list_controls_search", lambda: {"method": "GET", "url": "/controls", "params": {"q": "session"}}),
+        ("get_control", lambda: {"method": "GET", "url": f"/controls/{rng.choice(ids)}"}),
+        ("dashboard", lambda: {"method": "GET", "url": "/dashboard"}),
+        ("dashboard_history", lambda: {"method": "GET", "url": "/dashboard/history"}),
+        ("score", lambda: {"method": "GET", "url": "/score"}),
+        ("list_textlog", lambda: {"method": "GET", "url": f"/controls/{rng.choice(rids)}/textlog"}),
+        ("list_evidence", lambda: {"method": "GET", "url": f"/controls/{rng.choice(rids)}/evidence"}),
+        ("update_control", lambda: {"method": "PATCH", "url": f"/controls/{rng.choice(ids)}",
+                                    "json": {"self_impl_status": rng.choice(["Implemented", "Partially Implemented"])}}),
+        ("upload_evidence", lambda: {"method": "POST", "url": f"/controls/{rng.choice(rids)}/evidence",
+                                     "files": [("files", ("bench.txt", os.urandom(16 * 1024), "text/plain"))]}),
+    ]
+
+
+async def drive(client, factory, n_requests, concurrency):
+    latencies, errors = [], 0
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors
+        async with sem:
+            kwargs = factory()
+            t0 = time.perf_counter()
+            r = await client.request(**kwargs)
+            latencies.append(time.perf_counter() - t0)
+            if r.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n_requests)))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    out = {"requests": n_requests, "concurrency": concurrency, "errors": errors,
+           "throughput_rps": round(n_requests / wall, 2) if wall else None}
+    for p in PERCENTILES:
+        out[f"p{p}_ms"] = round(percentile(latencies, p) * 1000, 3)
+    return out
+
+
+def bench_importer(rids, rng):
+    try:
+        import pandas as pd
+    except ImportError:
+        return {"skipped": "pandas not installed"}
+    from app import import_excel
+    sample = rng.sample(rids, min(len(rids), 2000))
+    df = pd.DataFrame({
+        "requirement_id": sample,
+        "assessment_objectives": ["[a] Objective one;\n[b] Objective two."] * len(sample),
+        "assessment_methods": ["Examine: policy;\n\nInterview: admins."] * len(sample),
+    })
+    df.to_excel(import_excel.XLSX_PATH, index=False)
+    t0 = time.perf_counter()
+    import_excel.run()
+    elapsed = time.perf_counter() - t0
+    return {"rows": len(sample), "seconds": round(elapsed, 3), "rows_per_second": round(len(sample) / elapsed, 2)}
+
+
+async def run_scale(args):
+    import httpx
+    from app.main import app
+
+    rng = random.Random(args.seed)
+    t0 = time.perf_counter()
+    ids, rids = populate(args.single, args.textlog, args.evidence, args.seed)
+    result = {"controls": len(ids), "textlog": args.textlog, "evidence": args.evidence,
+              "populate_seconds": round(time.perf_counter() - t0, 3), "routes": {}}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, factory in routes(ids, rids, rng):
+            if args.only and name not in args.only:
+                continue
+            await drive(client, factory, min(args.warmup, args.requests), args.concurrency)
+            result["routes"][name] = await drive(client, factory, args.requests, args.concurrency)
+            print(f"  {name}: {result['routes'][name]}", file=sys.stderr)
+    result["importer"] = bench_importer(rids, rng)
+    return result
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--controls", default="110,10000,100000", help="comma-separated control counts")
+    ap.add_argument("--textlog", type=int, default=5000)
+    ap.add_argument("--evidence", type=int, default=2000)
+    ap.add_argument("--requests", type=int, default=200, help="timed requests per route")
+    ap.add_argument("--warmup", type=int, default=20)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--seed", type=int, default=1234)
+    ap.add_argument("--only", type=lambda v: set(v.split(",")), help="comma-separated route names")
+    ap.add_argument("--out", help="write JSON results here (default: stdout)")
+    ap.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.single:
+        print(json.dumps(asyncio.run(run_scale(args))))
+        return
+
+    results = {}
+    for n in (int(x) for x in args.controls.split(",")):
+        print(f"scale {n} controls", file=sys.stderr)
+        with tempfile.TemporaryDirectory(prefix="certmanager-bench-") as tmp:
+            env = dict(os.environ,
+                       DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                       UPLOAD_DIR=os.path.join(tmp, "uploads"),
+                       XLSX_PATH=os.path.join(tmp, "import.xlsx"))
+            cmd = [sys.executable, "-m", "bench.run", "--single", str(n)] + [a for a in (argv or sys.argv[1:])]
+            proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, check=True)
+            results[str(n)] = json.loads(proc.stdout.decode().strip().splitlines()[-1])
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
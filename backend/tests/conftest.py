@@ -0,0 +1,49 @@
+"""Shared fixtures: one app on a throwaway SQLite database and upload directory.
+
+``app.main`` binds its engine at import time, so the environment is set here
+before anything imports it; every test module shares that one database and
+picks its own controls to avoid stepping on the others.
+"""
+import os
+import atexit
+import shutil
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="certmanager-test-")
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ["UPLOAD_DIR"] = os.path.join(_tmp, "uploads")
+os.environ["LOCK_DIR"] = _tmp
+os.environ["READ_MODE"] = "primary"
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="session")
+def main():
+    from app import main
+    return main
+
+
+@pytest.fixture(scope="session")
+def client(main):
+    with TestClient(main.app) as c:
+        yield c
+
+
+_used_controls = set()
+
+
+@pytest.fixture
+def control(client):
+    """A control no other test has touched, as ``/controls`` lists it."""
+    row = next(r for r in client.get("/controls").json() if r["id"] not in _used_controls and r["version"] == 1)
+    _used_controls.add(row["id"])
+    return row
+
+
+@pytest.fixture
+def flush_audit(main):
+    """Call to wait until every queued audit entry is written; the writer restarts on the next submit."""
+    return main.audit_log.stop
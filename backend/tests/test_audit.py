@@ -0,0 +1,57 @@
+"""Hash-chained audit trail: what gets recorded, verification, and the writer queue."""
+import time
+import queue
+import asyncio
+from sqlalchemy import text
+from app import audit, metrics
+
+
+def test_mutations_are_recorded_and_reads_are_not(client, control, flush_audit):
+    rid = control["requirement_id"]
+    client.patch(f"/controls/{control['id']}", json={"c3pao_finding": "MET"}, headers={"X-Actor": "alice"})
+    client.get(f"/controls/{control['id']}")
+    flush_audit()
+    rows = client.get(f"/audit?requirement_id={rid}").json()
+    assert [(r["actor"], r["method"], r["status_code"]) for r in rows] == [("alice", "PATCH", 200)]
+    assert '"after": {"c3pao_finding": "MET"' in rows[0]["detail"]
+
+
+def test_failed_mutation_is_recorded_with_its_status(client, flush_audit):
+    client.delete("/textlog/987654")
+    flush_audit()
+    latest = client.get("/audit?limit=1").json()[0]
+    assert (latest["method"], latest["path"], latest["status_code"]) == ("DELETE", "/textlog/987654", 404)
+
+
+def test_chain_verifies_and_detects_tampering(client, main, control, flush_audit):
+    for status in ("MET", "NOT_MET", "NA"):
+        client.patch(f"/controls/{control['id']}", json={"c3pao_finding": status})
+    flush_audit()
+    report = client.get("/audit/verify").json()
+    assert report["ok"] and report["checked"] >= 3
+
+    target = client.get(f"/audit?requirement_id={control['requirement_id']}&limit=1").json()[0]
+    with main.engine.begin() as conn:
+        conn.execute(text("UPDATE auditentry SET actor = 'mallory' WHERE id = :id"), {"id": target["id"]})
+    try:
+        assert client.get("/audit/verify").json() == {"ok": False, "checked": target["id"] - 1, "broken_at": target["id"]}
+    finally:
+        with main.engine.begin() as conn:
+            conn.execute(text("UPDATE auditentry SET actor = :a WHERE id = :id"), {"a": target["actor"], "id": target["id"]})
+    assert client.get("/audit/verify").json()["ok"]
+
+
+def test_full_queue_waits_without_dropping(main, monkeypatch):
+    writer = audit.AuditWriter(main.engine)
+    writer.queue = queue.Queue(maxsize=1)
+    written = []
+    monkeypatch.setattr(writer, "_write", lambda batch: (time.sleep(0.05), written.extend(batch)))
+    before = metrics.audit_queue_full_total[0]
+
+    async def burst():
+        await asyncio.gather(*[writer.submit(n=i) for i in range(6)])
+
+    asyncio.run(burst())
+    writer.stop()
+    assert sorted(e["n"] for e in written) == list(range(6))
+    assert metrics.audit_queue_full_total[0] > before
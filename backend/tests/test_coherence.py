@@ -0,0 +1,71 @@
+"""Cross-worker cache coherence: version counters, data_version checks and file locks.
+
+A second ``Coherence`` on the same database stands in for another worker.
+"""
+import time
+import threading
+from sqlmodel import Session
+from app.coherence import Coherence, locked
+
+
+def listen(coherence, name):
+    calls = []
+    coherence.register(name, lambda: calls.append(name))
+    return calls
+
+
+def test_edit_in_one_worker_invalidates_the_other(client, main, control):
+    other = Coherence(main.engine)
+    other.prime()
+    calls = listen(other, "controls")
+    other.check()
+    assert calls == []
+    client.patch(f"/controls/{control['id']}", json={"c3pao_finding": "MET"})
+    other.check()
+    assert calls == ["controls"]
+    other.check()
+    assert calls == ["controls"]
+    other.close()
+
+
+def test_own_write_does_not_invalidate_own_caches(client, main, control):
+    main.coherence.check()
+    calls = listen(main.coherence, "controls")
+    try:
+        client.patch(f"/controls/{control['id']}", json={"self_impl_status": "Implemented"})
+        main.coherence.check()
+        assert calls == []
+    finally:
+        main.coherence._listeners["controls"].pop()
+
+
+def test_other_workers_write_reaches_the_app(client, main, control):
+    other = Coherence(main.engine)
+    main.coherence.check()
+    calls = listen(main.coherence, "search")
+    try:
+        with Session(main.engine) as s:
+            version = other.bump(s, "search")
+            s.commit()
+        other.written("search", version)
+        client.get(f"/controls/{control['id']}")  # every request checks first
+        assert calls == ["search"]
+    finally:
+        main.coherence._listeners["search"].pop()
+        other.close()
+
+
+def test_locked_excludes_other_holders(main):
+    order = []
+
+    def contender():
+        with locked(main.engine, "test"):
+            order.append("contender")
+
+    with locked(main.engine, "test"):
+        t = threading.Thread(target=contender)
+        t.start()
+        time.sleep(0.1)
+        order.append("holder")
+    t.join()
+    assert order == ["holder", "contender"]
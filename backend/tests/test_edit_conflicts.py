@@ -0,0 +1,53 @@
+"""Compare-and-set edits on Control.version (PATCH /controls/{id} with If-Match)."""
+import asyncio
+import httpx
+
+
+def test_etag_is_weak_and_tracks_version(client, control):
+    r = client.get(f"/controls/{control['id']}")
+    assert r.headers["etag"] == 'W/"1"'
+    r = client.patch(f"/controls/{control['id']}", json={"c3pao_finding": "MET"}, headers={"If-Match": r.headers["etag"]})
+    assert r.status_code == 200
+    assert r.headers["etag"] == 'W/"2"'
+    assert r.json()["version"] == 2
+    assert r.json()["changed"] == {"c3pao_finding": "MET"}
+
+
+def test_stale_if_match_gets_409_with_current(client, control):
+    url = f"/controls/{control['id']}"
+    assert client.patch(url, json={"self_impl_status": "Implemented"}, headers={"If-Match": '"1"'}).status_code == 200
+    r = client.patch(url, json={"self_impl_status": "Planned or Not Implemented"}, headers={"If-Match": '"1"'})
+    assert r.status_code == 409
+    assert r.headers["etag"] == 'W/"2"'
+    current = r.json()["detail"]["current"]
+    assert current["version"] == 2
+    assert current["self_impl_status"] == "Implemented"
+
+
+def test_malformed_if_match_is_rejected(client, control):
+    r = client.patch(f"/controls/{control['id']}", json={"c3pao_finding": "MET"}, headers={"If-Match": '"abc"'})
+    assert r.status_code == 400
+
+
+def test_noop_edit_keeps_version_and_caches(client, main, control):
+    url = f"/controls/{control['id']}"
+    before = main.coherence._versions()
+    r = client.patch(url, json={}, headers={"If-Match": '"1"'})
+    assert r.status_code == 200
+    assert r.json()["changed"] == {}
+    assert r.json()["version"] == 1
+    assert main.coherence._versions() == before
+
+
+def test_concurrent_editors_exactly_one_wins(client, main, control):
+    async def race():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            return await asyncio.gather(*[
+                ac.patch(f"/controls/{control['id']}", json={"c3pao_finding": finding}, headers={"If-Match": '"1"'})
+                for finding in ("MET", "NOT_MET", "NA", "MET", "NOT_MET", "NA", "MET", "NOT_MET")
+            ])
+
+    codes = sorted(r.status_code for r in asyncio.run(race()))
+    assert codes == [200] + [409] * 7
+    assert client.get(f"/controls/{control['id']}").json()["version"] == 2
@@ -0,0 +1,58 @@
+"""Delta sync (GET /sync?since=) and tombstones."""
+
+
+def upload(client, rid, name):
+    r = client.post(f"/controls/{rid}/evidence", files=[("files", (name, name.encode(), "text/plain"))])
+    assert r.status_code == 200
+    return r.json()[0]["id"]
+
+
+def test_delta_holds_only_changes(client, control):
+    seq = client.get("/sync").json()["seq"]
+    client.patch(f"/controls/{control['id']}", json={"c3pao_finding": "MET"})
+    delta = client.get(f"/sync?since={seq}").json()
+    assert not delta["full"]
+    assert [c["id"] for c in delta["controls"]] == [control["id"]]
+    assert delta["seq"] > seq
+    assert client.get(f"/sync?since={delta['seq']}").json()["controls"] == []
+
+
+def test_full_sync_without_since(client):
+    full = client.get("/sync").json()
+    assert full["full"]
+    assert full["deleted"] == []
+    assert len(full["controls"]) == len(client.get("/controls").json())
+
+
+def test_since_ahead_of_server_restarts_full(client):
+    seq = client.get("/sync").json()["seq"]
+    assert client.get(f"/sync?since={seq + 1000}").json()["full"]
+
+
+def test_delete_leaves_tombstone_with_seq(client, control):
+    entry = client.post(f"/controls/{control['requirement_id']}/textlog", json={"kind": "provider", "text": "MSP"}).json()
+    seq = client.get("/sync").json()["seq"]
+    assert client.delete(f"/textlog/{entry['id']}").status_code == 200
+    delta = client.get(f"/sync?since={seq}").json()
+    assert [(d["kind"], d["id"]) for d in delta["deleted"]] == [("textlog", entry["id"])]
+    assert seq < delta["deleted"][0]["seq"] <= delta["seq"]
+
+
+def test_reused_id_is_not_buried(client, control):
+    rid = control["requirement_id"]
+    upload(client, rid, "a.txt")
+    seq = client.get("/sync").json()["seq"]
+    gone = upload(client, rid, "b.txt")
+    assert client.delete(f"/evidence/{gone}").status_code == 200
+    again = upload(client, rid, "c.txt")
+    assert again == gone  # SQLite hands the highest rowid out again after it is deleted
+
+    delta = client.get(f"/sync?since={seq}").json()
+    assert [(e["id"], e["filename"]) for e in delta["evidence"]] == [(again, "c.txt")]
+    assert delta["deleted"] == []
+
+    # deleted again: the newest change is the tombstone, and no row comes back
+    assert client.delete(f"/evidence/{again}").status_code == 200
+    delta = client.get(f"/sync?since={seq}").json()
+    assert delta["evidence"] == []
+    assert {(d["kind"], d["id"]) for d in delta["deleted"]} == {("evidence", again)}
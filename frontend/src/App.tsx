@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from 'react'
-import { listControls, patchControl, getControl, addTextLog, listTextLog, deleteTextLog, listEvidence, uploadEvidence, deleteEvidence, getDashboard, type Control } from './api'
+import { cachedControls, patchControl, getControlBundle, addTextLog, listTextLog, deleteTextLog, listEvidence, uploadEvidence, deleteEvidence, getDashboard, previewUrl, hasPreview, downloadUrl, archiveUrl, type Control } from './api'
 
 function rowBg(s?: string|null){
   if (s==='MET') return 'bg-green-50'
@@ -9,6 +9,7 @@ function rowBg(s?: string|null){
 }
 
 const FILTER_INACTIVE = 'bg-gray-50 border-gray-200 hover:bg-gray-100'
+const LOG_PAGE_SIZE = 500  // text-log entries per kind fetched at a time in the detail view
 
 type FilterOption = {
   value: string
@@ -47,7 +48,7 @@ export default function App(){
   const [implFilter, setImplFilter] = useState<string>('')
 
   const fetchRows = async() => {
-    const data = await listControls(q, domain)
+    const data = await cachedControls(q, domain)
     setAllRows(data)
     applyFilters(data, c3paoFilter, implFilter)
   }
@@ -57,6 +58,23 @@ export default function App(){
     setDashboard(data)
   }
 
+  // merge an edit into the loaded rows instead of refetching them; on a conflict show the other editor's values
+  const saveControl = async(r: Control, body: Partial<Control>) => {
+    let merged: Partial<Control>
+    try {
+      const updated = await patchControl(r, body)
+      merged = { ...updated.changed, version: updated.version }
+    } catch (err: any) {
+      if (err?.response?.status !== 409) throw err
+      merged = err.response.data.detail.current
+      alert(`${r.requirement_id} was changed by someone else; showing the latest values.`)
+    }
+    const next = allRows.map(x => x.id === r.id ? { ...x, ...merged } : x)
+    setAllRows(next)
+    applyFilters(next, c3paoFilter, implFilter)
+    await fetchDashboard()
+  }
+
   const applyFilters = (data: Control[], c3pao: string, impl: string) => {
     let filtered = data
     if (c3pao) {
@@ -110,6 +128,19 @@ export default function App(){
 
           {dashboard && (
             <div className="space-y-4">
+              {dashboard.sprs && (
+                <div className="bg-white rounded-xl p-4 border shadow-sm flex gap-8">
+                  <div>
+                    <h3 className="font-semibold text-gray-800">SPRS Score (Self-Reported)</h3>
+                    <div className="text-2xl font-bold">{dashboard.sprs.self} / 110</div>
+                  </div>
+                  <div>
+                    <h3 className="font-semibold text-gray-800">SPRS Score (C3PAO)</h3>
+                    <div className="text-2xl font-bold">{dashboard.sprs.c3pao} / 110</div>
+                  </div>
+                </div>
+              )}
+
               {/* C3PAO Assessment Findings Filters */}
               <div className="bg-white rounded-xl p-4 border shadow-sm">
                 <h3 className="font-semibold mb-3 text-gray-800">C3PAO Assessment Findings</h3>
@@ -191,6 +222,8 @@ export default function App(){
                   <th className="p-3 text-left">Req ID</th>
                   <th className="p-3 text-left">Domain</th>
                   <th className="p-3 text-left">Title</th>
+                  <th className="p-3 text-left">Evidence</th>
+                  <th className="p-3 text-left">Solution</th>
                   <th className="p-3 text-left w-56">C3PAO Assessment Findings</th>
                   <th className="p-3 text-left w-72">Self-Reported Implementation Status</th>
                 </tr>
@@ -201,11 +234,11 @@ export default function App(){
                     <td className="p-3 font-mono cursor-pointer" onClick={()=>setSel(r)}>{r.requirement_id}</td>
                     <td className="p-3 cursor-pointer" onClick={()=>setSel(r)}>{r.domain}</td>
                     <td className="p-3 cursor-pointer" onClick={()=>setSel(r)}>{r.title}</td>
+                    <td className={`p-3 cursor-pointer ${r.evidence_count ? '' : 'text-red-600'}`} onClick={()=>setSel(r)}>{r.evidence_count ?? 0}</td>
+                    <td className="p-3 cursor-pointer max-w-xs truncate" title={r.latest_solution?.text} onClick={()=>setSel(r)}>{r.latest_solution ? r.latest_solution.text : <span className="text-red-600">none</span>}</td>
                     <td className="p-3">
                       <select className="border rounded-xl px-2 py-1 w-full" value={r.c3pao_finding||''} onChange={async(e)=>{
-                        await patchControl(r.id, { c3pao_finding: e.target.value || null }); 
-                        await fetchRows(); 
-                        await fetchDashboard()
+                        await saveControl(r, { c3pao_finding: e.target.value || null } as Partial<Control>)
                       }}>
                         <option value="">Select...</option>
                         <option value="MET">MET</option>
@@ -216,9 +249,7 @@ export default function App(){
                     </td>
                     <td className="p-3">
                       <select className="border rounded-xl px-2 py-1 w-full" value={r.self_impl_status||''} onChange={async(e)=>{
-                        await patchControl(r.id, { self_impl_status: e.target.value || null }); 
-                        await fetchRows(); 
-                        await fetchDashboard()
+                        await saveControl(r, { self_impl_status: e.target.value || null } as Partial<Control>)
                       }}>
                         <option value="">Select...</option>
                         <option>Implemented</option>
@@ -247,26 +278,42 @@ function Detail({ control, onBack }: { control: Control, onBack: ()=>void }){
   const [providerLog, setProviderLog] = useState<Array<any>>([])
   const [solutionLog, setSolutionLog] = useState<Array<any>>([])
   const [evidence, setEvidence] = useState<Array<any>>([])
+  // whether older entries of each kind remain on the server beyond what is shown
+  const [olderLogs, setOlderLogs] = useState<Record<string, boolean>>({})
 
   useEffect(()=>{ (async()=>{
-    const fresh = await getControl(c.id); setC(fresh)
+    const bundle = await getControlBundle(c.requirement_id, LOG_PAGE_SIZE); setC(bundle.control)
     setProvider(''); setSolution('')
-    setProviderLog(await listTextLog(c.requirement_id, 'provider'))
-    setSolutionLog(await listTextLog(c.requirement_id, 'solution'))
-    setEvidence(await listEvidence(c.requirement_id))
+    setProviderLog(bundle.textlog.provider?.items ?? [])
+    setSolutionLog(bundle.textlog.solution?.items ?? [])
+    setOlderLogs({ provider: bundle.textlog.provider?.has_more ?? false, solution: bundle.textlog.solution?.has_more ?? false })
+    setEvidence(bundle.evidence)
   })() }, [c.id])
 
+  const reloadLog = async(kind: 'provider'|'solution')=>{
+    const rows = await listTextLog(c.requirement_id, kind)
+    if (kind === 'provider') setProviderLog(rows); else setSolutionLog(rows)
+    setOlderLogs(m => ({ ...m, [kind]: false }))
+  }
+  const loadOlder = async(kind: 'provider'|'solution')=>{
+    const shown = kind === 'provider' ? providerLog : solutionLog
+    const page = (await getControlBundle(c.requirement_id, LOG_PAGE_SIZE, shown.length)).textlog[kind]
+    const seen = new Set(shown.map(entry => entry.id))
+    const older = (page?.items ?? []).filter(entry => !seen.has(entry.id))
+    if (kind === 'provider') setProviderLog(log => [...older, ...log]); else setSolutionLog(log => [...older, ...log])
+    setOlderLogs(m => ({ ...m, [kind]: page?.has_more ?? false }))
+  }
   const saveProvider = async()=>{
     if (!provider.trim()) return
     await addTextLog(c.requirement_id, 'provider', provider.trim())
     setProvider('')
-    setProviderLog(await listTextLog(c.requirement_id, 'provider'))
+    await reloadLog('provider')
   }
   const saveSolution = async()=>{
     if (!solution.trim()) return
     await addTextLog(c.requirement_id, 'solution', solution.trim())
     setSolution('')
-    setSolutionLog(await listTextLog(c.requirement_id, 'solution'))
+    await reloadLog('solution')
   }
   const onUploadEvidence = async(files: FileList|null)=>{
     if (!files || files.length===0) return
@@ -294,11 +341,12 @@ function Detail({ control, onBack }: { control: Control, onBack: ()=>void }){
         </div>
         {providerLog.length>0 && (
           <div className="mt-2 space-y-2">
+            {olderLogs.provider && <button className="text-xs underline" onClick={()=>loadOlder('provider')}>Load older entries</button>}
             {providerLog.map((entry) => (
               <div key={entry.id} className="flex items-start gap-2 p-2 rounded-lg border bg-white">
                 <div className="text-xs text-gray-500 w-44 shrink-0">{new Date(entry.ts).toISOString()}</div>
                 <div className="whitespace-pre-wrap flex-1 text-sm">{entry.text}</div>
-                <button className="text-xs px-2 py-1 rounded border" onClick={async()=>{ await deleteTextLog(entry.id); setProviderLog(await listTextLog(c.requirement_id,'provider')) }}>Delete</button>
+                <button className="text-xs px-2 py-1 rounded border" onClick={async()=>{ await deleteTextLog(entry.id); await reloadLog('provider') }}>Delete</button>
               </div>
             ))}
           </div>
@@ -313,11 +361,12 @@ function Detail({ control, onBack }: { control: Control, onBack: ()=>void }){
         </div>
         {solutionLog.length>0 && (
           <div className="mt-2 space-y-2">
+            {olderLogs.solution && <button className="text-xs underline" onClick={()=>loadOlder('solution')}>Load older entries</button>}
             {solutionLog.map((entry) => (
               <div key={entry.id} className="flex items-start gap-2 p-2 rounded-lg border bg-white">
                 <div className="text-xs text-gray-500 w-44 shrink-0">{new Date(entry.ts).toISOString()}</div>
                 <div className="whitespace-pre-wrap flex-1 text-sm">{entry.text}</div>
-                <button className="text-xs px-2 py-1 rounded border" onClick={async()=>{ await deleteTextLog(entry.id); setSolutionLog(await listTextLog(c.requirement_id,'solution')) }}>Delete</button>
+                <button className="text-xs px-2 py-1 rounded border" onClick={async()=>{ await deleteTextLog(entry.id); await reloadLog('solution') }}>Delete</button>
               </div>
             ))}
           </div>
@@ -325,15 +374,23 @@ function Detail({ control, onBack }: { control: Control, onBack: ()=>void }){
       </section>
 
       <div className="mt-6 space-y-3">
-        <h2 className="font-semibold mb-2">Evidence</h2>
+        <div className="flex items-center justify-between mb-2">
+          <h2 className="font-semibold">Evidence</h2>
+          {evidence.length>0 && <a className="text-sm underline" href={archiveUrl({ requirement_id: c.requirement_id })}>Download all (ZIP)</a>}
+        </div>
         <input type="file" multiple className="border rounded-xl p-2" onChange={e=>onUploadEvidence(e.target.files)} />
         {evidence.length>0 && (
           <div className="space-y-2">
             {evidence.map(ev => (
               <div key={ev.id} className="flex items-center justify-between p-2 rounded-lg border bg-white text-sm">
                 <div className="flex items-center gap-3 overflow-hidden">
+                  {hasPreview(ev.filename) && (
+                    <a href={previewUrl(ev.id, ev.sha256)} target="_blank" rel="noreferrer" className="shrink-0">
+                      <img src={previewUrl(ev.id, ev.sha256)} loading="lazy" alt="" className="h-12 w-16 object-cover rounded border" onError={e=>{ e.currentTarget.style.display='none' }} />
+                    </a>
+                  )}
                   <span className="text-xs text-gray-500 shrink-0 w-44">{new Date(ev.ts).toISOString()}</span>
-                  <span className="truncate max-w-[26rem]" title={`${ev.filename} (${ev.size} bytes)`}>{ev.filename}</span>
+                  <a className="truncate max-w-[26rem] underline" href={downloadUrl(ev.id)} title={`${ev.filename} (${ev.size} bytes)`}>{ev.filename}</a>
                   <span className="text-xs text-gray-500 shrink-0">{ev.size} bytes</span>
                 </div>
                 <button className="text-xs px-2 py-1 rounded border" onClick={async()=>{ await deleteEvidence(ev.id); setEvidence(await listEvidence(c.requirement_id)) }}>Delete</button>
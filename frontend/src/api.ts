@@ -15,18 +15,134 @@ export type Control = {
   assessment_methods?: string
   c3pao_finding?: 'MET'|'NOT_MET'|'NA'|'UNASSIGNED'|null
   self_impl_status?: 'Implemented'|'Partially Implemented'|'Planned or Not Implemented'|'Alternative Implementation'|'N/A'|'UNASSIGNED'|null
+  version?: number
+  sort_key?: string
+  // present when listed with coverage=true
+  evidence_count?: number
+  evidence_bytes?: number
+  latest_provider?: { text: string, ts: string }|null
+  latest_solution?: { text: string, ts: string }|null
 }
 
-export async function listControls(q = '', domain = '') {
-  const { data } = await api.get<Control[]>('/controls', { params: { q, domain } })
+export async function listControls(q = '', domain = '', coverage = false) {
+  const { data } = await api.get<Control[]>('/controls', { params: { q, domain, coverage: coverage || undefined } })
   return data
 }
 export async function getControl(id: number) {
   const { data } = await api.get<Control>(`/controls/${id}`)
   return data
 }
-export async function patchControl(id: number, body: Partial<Control>) {
-  const { data } = await api.patch<Control>(`/controls/${id}`, body)
+export type TextLogEntry = {id:number, requirement_id:string, kind:string, text:string, ts:string}
+export type EvidenceEntry = {id:number, requirement_id:string, filename:string, size:number, ts:string, sha256?:string|null}
+export type ControlBundle = {
+  control: Control
+  textlog: Record<string, { latest: TextLogEntry|null, total: number, has_more: boolean, items: TextLogEntry[] }>
+  evidence: EvidenceEntry[]
+}
+// log_offset skips that many of each kind's newest entries, to page back through long histories
+export async function getControlBundle(requirement_id: string, log_limit = 500, log_offset = 0) {
+  const { data } = await api.get<ControlBundle>(`/controls/${requirement_id}/bundle`, { params: { log_limit, log_offset } })
+  return data
+}
+// Local copy of controls, narratives and evidence kept current with /sync: after the first load
+// only rows changed since the last seen sequence travel, and the copy still answers when offline.
+const SYNC_KEY = 'ssp-sync'
+const COVERAGE_SNIPPET_CHARS = 200
+type SyncKind = 'controls' | 'textlog' | 'evidence'
+type SyncCache = {
+  seq: number | null
+  controls: Record<number, Control>
+  order: number[]  // control ids in the server's list order (sort_key, then id)
+  textlog: Record<number, TextLogEntry>
+  evidence: Record<number, EvidenceEntry>
+}
+const emptyCache = (): SyncCache => ({ seq: null, controls: {}, order: [], textlog: {}, evidence: {} })
+const listOrder = (a: Control, b: Control) =>
+  (a.sort_key || '') < (b.sort_key || '') ? -1 : (a.sort_key || '') > (b.sort_key || '') ? 1 : a.id - b.id
+let cache: SyncCache = (() => {
+  try {
+    const saved = JSON.parse(localStorage.getItem(SYNC_KEY) || '') as SyncCache
+    saved.order ??= Object.values(saved.controls).sort(listOrder).map(c => c.id)  // saved before the order was kept
+    return saved
+  } catch { return emptyCache() }
+})()
+
+// a new control goes to its place in the list; sort_key follows requirement_id, so existing ones never move
+function placeControl(next: SyncCache, c: Control) {
+  let lo = 0, hi = next.order.length
+  while (lo < hi) {
+    const mid = (lo + hi) >> 1
+    if (listOrder(next.controls[next.order[mid]], c) < 0) lo = mid + 1
+    else hi = mid
+  }
+  next.order.splice(lo, 0, c.id)
+}
+
+export async function syncCache() {
+  let data: { seq: number, full: boolean, deleted: Array<{ kind: SyncKind, id: number, seq: number }> } & Record<SyncKind, Array<{ id: number, seq: number }>>
+  try {
+    ({ data } = await api.get('/sync', { params: { since: cache.seq ?? undefined } }))
+  } catch (err) {
+    if (cache.seq === null) throw err
+    return cache  // offline: serve what we have
+  }
+  const next = data.full ? emptyCache() : cache
+  // apply in commit order: SQLite reuses deleted ids, so a tombstone and a newer row can share one
+  const changes: Array<{ seq: number, kind: SyncKind, id: number, row?: { id: number } }> = data.deleted.map(d => ({ ...d }))
+  for (const kind of ['controls', 'textlog', 'evidence'] as SyncKind[]) {
+    for (const row of data[kind]) changes.push({ seq: row.seq, kind, id: row.id, row })
+  }
+  changes.sort((a, b) => a.seq - b.seq)
+  for (const { kind, id, row } of changes) {
+    if (kind === 'controls' && !data.full) {
+      if (row && !(id in next.controls)) placeControl(next, row as Control)
+      else if (!row && id in next.controls) next.order.splice(next.order.indexOf(id), 1)
+    }
+    if (row) (next[kind] as Record<number, unknown>)[id] = row
+    else delete next[kind][id]
+  }
+  // a full load is put in order once here, not on every read
+  if (data.full) next.order = Object.values(next.controls).sort(listOrder).map(c => c.id)
+  next.seq = data.seq
+  cache = next
+  try { localStorage.setItem(SYNC_KEY, JSON.stringify(cache)) } catch { /* quota: keep it in memory only */ }
+  return cache
+}
+
+// what listControls(q, domain, true) returns, computed from the synced copy
+export async function cachedControls(q = '', domain = '') {
+  const { controls, order, textlog, evidence } = await syncCache()
+  const needle = q.toLowerCase()
+  const rows = order.map(id => controls[id]).filter(c =>
+    (!domain || c.domain.toLowerCase() === domain.toLowerCase()) &&
+    (!needle || [c.title, c.statement, c.requirement_id, c.domain].some(v => (v || '').toLowerCase().includes(needle))))
+  const files: Record<string, { count: number, bytes: number }> = {}
+  for (const e of Object.values(evidence)) {
+    const f = files[e.requirement_id] ??= { count: 0, bytes: 0 }
+    f.count += 1
+    f.bytes += e.size
+  }
+  const latest: Record<string, TextLogEntry> = {}
+  for (const t of Object.values(textlog)) {
+    const key = `${t.requirement_id}\n${t.kind}`
+    const cur = latest[key]
+    if (!cur || t.ts > cur.ts || (t.ts === cur.ts && t.id > cur.id)) latest[key] = t
+  }
+  const snippet = (t?: TextLogEntry) => t ? { text: t.text.slice(0, COVERAGE_SNIPPET_CHARS), ts: t.ts } : null
+  return rows.map(c => ({
+    ...c,
+    evidence_count: files[c.requirement_id]?.count ?? 0,
+    evidence_bytes: files[c.requirement_id]?.bytes ?? 0,
+    latest_provider: snippet(latest[`${c.requirement_id}\nprovider`]),
+    latest_solution: snippet(latest[`${c.requirement_id}\nsolution`]),
+  }))
+}
+
+// the updated control plus the fields this edit changed; a 409 carries { detail: { message, current } }
+export type ControlPatch = Control & { changed: Partial<Control> }
+export async function patchControl(control: Control, body: Partial<Control>) {
+  const headers = control.version ? { 'If-Match': `"${control.version}"` } : {}
+  const { data } = await api.patch<ControlPatch>(`/controls/${control.id}`, body, { headers })
   return data
 }
 export async function listTextLog(requirement_id: string, kind?: string) {
@@ -42,7 +158,7 @@ export async function deleteTextLog(id: number) {
 }
 export async function listEvidence(requirement_id: string) {
   const { data } = await api.get(`/controls/${requirement_id}/evidence`)
-  return data as Array<{id:number, requirement_id:string, filename:string, size:number, ts:string}>
+  return data as EvidenceEntry[]
 }
 export async function uploadEvidence(requirement_id: string, files: FileList) {
   const fd = new FormData()
@@ -50,6 +166,18 @@ export async function uploadEvidence(requirement_id: string, files: FileList) {
   const { data } = await api.post(`/controls/${requirement_id}/evidence`, fd, { headers: { 'Content-Type': 'multipart/form-data' } })
   return data
 }
+export function downloadUrl(id: number) {
+  return `${api.defaults.baseURL}/evidence/${id}/download`
+}
+export function archiveUrl(params: { domain?: string, requirement_id?: string } = {}) {
+  const qs = new URLSearchParams(Object.entries(params).filter(([, v]) => v) as Array<[string, string]>).toString()
+  return `${api.defaults.baseURL}/evidence/archive${qs ? `?${qs}` : ''}`
+}
+// with the file's hash the URL is cached for good; ids are reused after deletes, so without it the browser revalidates
+export function previewUrl(id: number, sha256?: string|null) {
+  return `${api.defaults.baseURL}/evidence/${id}/preview${sha256 ? `?v=${sha256}` : ''}`
+}
+export const hasPreview = (filename: string) => /\.(png|jpe?g|gif|bmp|tiff?|webp|pdf)$/i.test(filename)
 export async function deleteEvidence(id: number) {
   await api.delete(`/evidence/${id}`)
 }
@@ -60,5 +188,17 @@ export async function getDashboard() {
     total: number
     c3pao: Record<string, number>
     impl: Record<string, number>
+    sprs: { self: number, c3pao: number }
+  }
+}
+
+export async function getScore(limit = 100) {
+  const { data } = await api.get('/score', { params: { limit } })
+  return data as {
+    max: number
+    min: number
+    self: number
+    c3pao: number
+    history: Array<{id:number, ts:string, requirement_id:string, self_score:number, c3pao_score:number}>
   }
 }